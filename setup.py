@@ -5,13 +5,21 @@ entry_points = {
     'console_scripts': [
         'nti_backup_course = nti.deploymenttools.content.backup_course_bundle:main',
         'nti_backup_full_course = nti.deploymenttools.content.backup_course:main',
+        'nti_backup_scheduler = nti.deploymenttools.content.scheduler:main',
+        'nti_batch_course_bundle = nti.deploymenttools.content.batch_course_bundle:main',
+        'nti_benchmark = nti.deploymenttools.content.benchmarks.run:main',
+        'nti_bundle_diff = nti.deploymenttools.content.bundle_diff:main',
+        'nti_cold_storage = nti.deploymenttools.content.cold_storage:main',
+        'nti_content = nti.deploymenttools.content.cli:main',
         'nti_copy_content_package = nti.deploymenttools.content.copy_content_package:main',
         'nti_copy_course = nti.deploymenttools.content.copy_course:main',
         'nti_import_course = nti.deploymenttools.content.import_course_bundle:main',
         'nti_manage_course = nti.deploymenttools.content.manage_course:main',
+        'nti_mirror_site = nti.deploymenttools.content.mirror:main',
         'nti_remote_render = nti.deploymenttools.content.remote_render:main',
         'nti_render_content = nti.deploymenttools.content.render:main',
         'nti_restore_course = nti.deploymenttools.content.restore_course_bundle:main',
+        'nti_worker = nti.deploymenttools.content.worker:main',
     ]
 }
 
@@ -56,7 +64,9 @@ setup(
     tests_require=TESTS_REQUIRE,
     install_requires=[
         'setuptools',
+        'backports.lzma; python_version == "2.7"',
         'boto',
+        'futures; python_version == "2.7"',
         'isodate',
         'nti.contentrendering',
         'requests',
@@ -67,6 +77,12 @@ setup(
     ],
     extras_require={
         'test': TESTS_REQUIRE,
+        'zstd': [
+            'zstandard',
+        ],
+        'async': [
+            'aiohttp; python_version >= "3.7"',
+        ],
         'docs': [
             'Sphinx',
             'repoze.sphinx.autointerface',
@@ -9,80 +9,670 @@ from __future__ import print_function
 from __future__ import absolute_import
 
 import os
+import sys
+import copy
+import stat
+import time
+import uuid
+import zlib
 import shutil
+import struct
+import hashlib
 import logging
 import tempfile
+import importlib
+import contextlib
+from io import BytesIO
+from getpass import getpass
+from timeit import default_timer
 from zipfile import ZipFile
+from zipfile import ZipInfo
+from zipfile import BadZipfile
+from zipfile import ZIP_STORED
+from zipfile import ZIP64_LIMIT
+from zipfile import ZIP_DEFLATED
 
-import requests
+import six
 
-from zope.exceptions.log import Formatter as ZopeLogFormatter
+import simplejson as json
+
+from nti.deploymenttools.content.timing import span
+
+from nti.deploymenttools.content.metrics import record_received
 
 logger = __import__('logging').getLogger(__name__)
 
-requests_codes = requests.codes
 
+class LazyModule(object):
+    """
+    Stands in for the module ``name``, importing it on first attribute
+    access, so heavy dependencies are only loaded by the code paths that
+    use them.
+    """
+
+    def __init__(self, name):
+        self._lazy_name = name
+        self._lazy_module = None
+
+    def __getattr__(self, name):
+        if self._lazy_module is None:
+            self._lazy_module = importlib.import_module(self._lazy_name)
+        return getattr(self._lazy_module, name)
+
+
+requests = LazyModule('requests')
+
+
+#: The timestamp of every member of a deterministic archive; the
+#: earliest a zip archive can record.
+DETERMINISTIC_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def deterministic_mode(path):
+    """
+    Return the permission bits a deterministic archive records for the
+    file at ``path``: 0755 if anyone may execute it, 0644 otherwise.
+    """
+    return 0o755 if os.stat(path).st_mode & 0o111 else 0o644
+
+
+#: The archive member listing the size and SHA-256 of every other member.
+MANIFEST_NAME = 'manifest.sha256.json'
+
+
+class _DigestReader(object):
+
+    def __init__(self, manifest, name, fp):
+        self.manifest = manifest
+        self.name = name
+        self.fp = fp
+        self.size = 0
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fp.read(size)
+        self.size += len(data)
+        self.digest.update(data)
+        return data
+
+    def finish(self):
+        self.manifest.add(self.name, self.size, self.digest.hexdigest())
+
+
+class ArchiveManifest(object):
+    """
+    The sizes and SHA-256 digests of the members of an archive, taken
+    from the data as it is written so nothing is read twice.
+    """
+
+    def __init__(self):
+        self.members = {}
+
+    def add(self, name, size, sha256):
+        self.members[name] = {'size': size, 'sha256': sha256}
+
+    def reader(self, name, fp):
+        """
+        Wrap ``fp`` so that everything read from it is digested; call
+        ``finish()`` on the result to record it as ``name``.
+        """
+        return _DigestReader(self, name, fp)
+
+    def dumps(self):
+        return json.dumps({'algorithm': 'sha256', 'members': self.members},
+                          indent=1, sort_keys=True)
+
+    def write(self, archive, deterministic=False):
+        """
+        Add the manifest to the open :class:`ZipFile` ``archive`` as
+        :data:`MANIFEST_NAME`.
+        """
+        date_time = DETERMINISTIC_DATE_TIME if deterministic \
+            else time.localtime(time.time())[:6]
+        info = ZipInfo(MANIFEST_NAME, date_time)
+        info.create_system = 3
+        info.external_attr = (stat.S_IFREG | 0o644) << 16
+        info.compress_type = archive.compression
+        archive.writestr(info, self.dumps())
+
+
+def read_archive_manifest(archive):
+    """
+    Return the members recorded in the manifest of the open
+    :class:`ZipFile` ``archive``, or None if it has no manifest.
+    """
+    try:
+        data = archive.read(MANIFEST_NAME)
+    except KeyError:
+        return None
+    return json.loads(data.decode('utf-8'))['members']
+
+
+def _write_member_chunks(archive, info, source, chunk_size):
+    # Before Python 3.6 zipfile only adds members from a path or from
+    # bytes in memory, so the member is streamed the way ZipFile.write
+    # does it: the local header, the data, then the header again with
+    # the CRC and sizes.
+    if info.compress_type == ZIP_DEFLATED:
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                      zlib.DEFLATED, -15)
+    elif info.compress_type == ZIP_STORED:
+        compressor = None
+    else:
+        raise ValueError("Compression type %s needs Python 3.6 here"
+                         % info.compress_type)
+    if getattr(archive, 'start_dir', None) is not None:
+        archive.fp.seek(archive.start_dir)
+    info.header_offset = archive.fp.tell()
+    archive._writecheck(info)
+    info.CRC = crc = 0
+    info.compress_size = compress_size = 0
+    # Compressed data can be a little larger than the original
+    zip64 = info.file_size * 1.05 > ZIP64_LIMIT
+    archive.fp.write(info.FileHeader(zip64))
+    file_size = 0
+    for chunk in iter(lambda: source.read(chunk_size), b''):
+        file_size += len(chunk)
+        crc = zlib.crc32(chunk, crc)
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        compress_size += len(chunk)
+        archive.fp.write(chunk)
+    if compressor is not None:
+        chunk = compressor.flush()
+        compress_size += len(chunk)
+        archive.fp.write(chunk)
+    info.CRC = crc & 0xffffffff
+    info.file_size = file_size
+    info.compress_size = compress_size
+    end = archive.fp.tell()
+    archive.fp.seek(info.header_offset)
+    archive.fp.write(info.FileHeader(zip64))
+    archive.fp.seek(end)
+    if getattr(archive, 'start_dir', None) is not None:
+        archive.start_dir = end
+    archive.filelist.append(info)
+    archive.NameToInfo[info.filename] = info
+    archive._didModify = True
+
+
+def write_archive_member(archive, file_path, archive_name, deterministic=False,
+                         manifest=None, chunk_size=1024 * 1024):
+    """
+    Add the file ``file_path`` to the open :class:`ZipFile` ``archive``
+    as ``archive_name``, with the normalized timestamp and permissions
+    of a deterministic archive if asked to, and recording its digest in
+    ``manifest`` if one is given.
+    """
+    name = archive_name.replace(os.sep, '/')
+    if not deterministic and manifest is None:
+        archive.write(file_path, name)
+        return
+    st = os.stat(file_path)
+    if deterministic:
+        info = ZipInfo(name, DETERMINISTIC_DATE_TIME)
+        info.create_system = 3
+        info.external_attr = (stat.S_IFREG | deterministic_mode(file_path)) << 16
+    else:
+        info = ZipInfo(name, time.localtime(st.st_mtime)[:6])
+        info.external_attr = (st.st_mode & 0xFFFF) << 16
+    info.compress_type = archive.compression
+    info.file_size = st.st_size
+    if getattr(archive, 'compresslevel', None) is not None:
+        info._compresslevel = archive.compresslevel
+    with open(file_path, 'rb') as fp:
+        source = fp if manifest is None else manifest.reader(name, fp)
+        if sys.version_info < (3, 6):
+            _write_member_chunks(archive, info, source, chunk_size)
+        else:
+            with archive.open(info, 'w') as dest:
+                shutil.copyfileobj(source, dest, chunk_size)
+    if manifest is not None:
+        source.finish()
 
-def archive_directory(source_path, archive_path):
+
+def archive_directory(source_path, archive_path, ignore=None,
+                      compression=ZIP_STORED, compresslevel=None,
+                      deterministic=False, manifest=False):
+    """
+    Zip the contents of ``source_path`` into ``archive_path``, stored
+    uncompressed unless another ``compression`` (and, on Python 3.7 and
+    later, ``compresslevel``) is given.
+
+    If given, ``ignore`` is called as ``ignore(relative_path, is_dir)``
+    for every directory and file found during the walk; entries for
+    which it returns true are left out of the archive, and ignored
+    directories are not descended into.
+
+    With ``deterministic`` the members are added in sorted order with
+    :data:`DETERMINISTIC_DATE_TIME` and normalized permissions instead
+    of what the filesystem reports, so the same tree always gives a
+    byte-identical archive for the same compression settings.
+
+    With ``manifest`` the archive ends with a :data:`MANIFEST_NAME`
+    member giving the size and SHA-256 of every other member, digested
+    as the files are written.
+    """
     if not os.path.isdir(source_path):
         raise ValueError("Invalid source path")
     base_path = source_path + os.sep
     logger.debug("Archiving %s", source_path)
 
-    with ZipFile(archive_path, 'w') as archive:
+    kwargs = {}
+    if compresslevel is not None:
+        kwargs['compresslevel'] = compresslevel
+    with span('archive', os.path.basename(archive_path)) as timing, \
+            ZipFile(archive_path, 'w', compression, **kwargs) as archive:
         logger.debug('Creating archive %s' % (archive_path,))
-        for root, _, files in os.walk(source_path):
+        digests = ArchiveManifest() if manifest else None
+        for root, dirs, files in os.walk(source_path):
+            if deterministic:
+                dirs.sort()
+                files = sorted(files)
+            if ignore is not None:
+                relative_root = root.replace(base_path, '', 1) \
+                    if root != source_path else ''
+                for name in list(dirs):
+                    path = os.path.join(relative_root, name)
+                    if ignore(path.replace(os.sep, '/'), True):
+                        logger.debug('Ignoring directory %s', path)
+                        dirs.remove(name)
             for source in files or ():
                 file_path = os.path.join(root, source)
                 archive_file_path = file_path.replace(base_path, '', 1)
+                if ignore is not None \
+                        and ignore(archive_file_path.replace(os.sep, '/'), False):
+                    logger.debug('Ignoring %s', archive_file_path)
+                    continue
+                if manifest and archive_file_path == MANIFEST_NAME:
+                    # Replaced by the one written below.
+                    continue
                 logger.debug('Adding %s to the archive as %s.' %
                              (file_path, archive_file_path))
-                archive.write(file_path, archive_file_path)
+                write_archive_member(archive, file_path, archive_file_path,
+                                     deterministic, digests)
+                timing.add_file(file_path)
+        if digests is not None:
+            digests.write(archive, deterministic)
     return archive_path
 
 
+def file_crc32(path, chunk_size=1024 * 1024):
+    """
+    Return the CRC32 of the file at ``path`` as stored in zip archives.
+    """
+    crc = 0
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc & 0xffffffff
+
+
+def _strip_zip64_extra(extra):
+    result = []
+    while len(extra) >= 4:
+        header_id, size = struct.unpack('<HH', extra[:4])
+        if header_id != 1:
+            result.append(extra[:4 + size])
+        extra = extra[4 + size:]
+    return b''.join(result)
+
+
+def _inflater(compress_type):
+    if compress_type == ZIP_STORED:
+        return lambda data: data
+    if compress_type == ZIP_DEFLATED:
+        return zlib.decompressobj(-15).decompress
+    return None
+
+
+def copy_archive_member(source, info, dest, chunk_size=1024 * 1024,
+                        manifest=None):
+    """
+    Copy the member ``info`` of the open :class:`ZipFile` ``source`` into
+    ``dest`` as its raw compressed bytes, without decompressing and
+    re-encoding it.
+
+    If given, ``manifest`` records the digest of the member, inflating
+    stored and deflated members from the bytes being copied.
+    """
+    source.fp.seek(info.header_offset)
+    header = source.fp.read(30)
+    if header[:4] != b'PK\x03\x04':
+        raise BadZipfile("Bad local file header for %s" % info.filename)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    source.fp.seek(info.header_offset + 30 + name_length + extra_length)
+
+    target = copy.copy(info)
+    # The sizes and CRC are written in the local header, so any data
+    # descriptor that followed the original member is not copied.
+    target.flag_bits &= ~0x08
+    target.extra = _strip_zip64_extra(info.extra)
+    if getattr(dest, 'start_dir', None) is not None:
+        dest.fp.seek(dest.start_dir)
+    target.header_offset = dest.fp.tell()
+    zip64 = info.file_size > ZIP64_LIMIT or info.compress_size > ZIP64_LIMIT
+    dest.fp.write(target.FileHeader(zip64))
+    inflate = _inflater(info.compress_type) if manifest is not None else None
+    digest = hashlib.sha256()
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = source.fp.read(min(chunk_size, remaining))
+        if not chunk:
+            raise BadZipfile("Truncated member %s" % info.filename)
+        dest.fp.write(chunk)
+        if inflate is not None:
+            digest.update(inflate(chunk))
+        remaining -= len(chunk)
+    if getattr(dest, 'start_dir', None) is not None:
+        dest.start_dir = dest.fp.tell()
+    dest.filelist.append(target)
+    dest.NameToInfo[target.filename] = target
+    dest._didModify = True
+    if inflate is not None:
+        manifest.add(info.filename, info.file_size, digest.hexdigest())
+    elif manifest is not None:
+        reader = manifest.reader(info.filename, source.open(info))
+        for _ in iter(lambda: reader.read(chunk_size), b''):
+            pass
+        reader.finish()
+    return target
+
+
 DEFAULT_LOG_FORMAT = '[%(asctime)-15s] [%(name)s] %(levelname)s: %(message)s'
 
 
 def configure_logging(level=logging.INFO, fmt=DEFAULT_LOG_FORMAT):
     level = logging.INFO if not isinstance(level, int) else level
+    from zope.exceptions.log import Formatter as ZopeLogFormatter
     logging.basicConfig(level=level)
     logging.root.handlers[0].setFormatter(ZopeLogFormatter(fmt))
 
 
 CHUNK_SIZE = 1024 * 1024
 
+#: Bounds of the read size :func:`read_response` adapts as it goes.
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
+#: How long :func:`read_response` aims to spend on each read.
+TARGET_READ_SECONDS = 0.25
+
+LOGON_PATH = '/dataserver2/logon.nti'
+
+#: The path the tools take to mean standard input or output.
+STDIO = '-'
+
+
+def binary_stdio(name):
+    """
+    Return the binary stream under ``sys.stdin`` or ``sys.stdout``.
+    """
+    stream = getattr(sys, name)
+    return getattr(stream, 'buffer', stream)
+
+
+class MultipartBody(object):
+    """
+    A ``multipart/form-data`` request body holding the form ``fields``
+    and the file ``fp``, read as the request is sent rather than loaded
+    into memory first.  Fields whose value is None are left out, as
+    requests leaves them out of the forms it encodes.
+
+    With the file ``size`` known the body has a ``len`` and goes out
+    with a ``Content-Length``; otherwise it is sent chunked, one
+    ``chunk_size`` read at a time.
+    """
+
+    def __init__(self, fields, name, fp, filename, size=None,
+                 chunk_size=CHUNK_SIZE):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary=%s' % self.boundary
+        self.chunk_size = chunk_size
+        #: The bytes of the file read so far.
+        self.sent = 0
+        head = []
+        for key, value in sorted(fields.items()):
+            if value is None:
+                continue
+            head.append('--%s\r\nContent-Disposition: form-data; name="%s"'
+                        '\r\n\r\n%s\r\n' % (self.boundary, key, value))
+        head.append('--%s\r\nContent-Disposition: form-data; name="%s"; '
+                    'filename="%s"\r\nContent-Type: application/octet-stream'
+                    '\r\n\r\n' % (self.boundary, name, filename))
+        head = ''.join(head).encode('utf-8')
+        tail = ('\r\n--%s--\r\n' % self.boundary).encode('utf-8')
+        self._fp = fp
+        self._start = fp.tell() if size is not None else None
+        self._parts = [BytesIO(head), fp, BytesIO(tail)]
+        self._part = 0
+        if size is not None:
+            self.len = len(head) + size + len(tail)
+
+    def read(self, size=-1):
+        result = []
+        while self._part < len(self._parts) and size != 0:
+            part = self._parts[self._part]
+            data = part.read(size)
+            if not data or size < 0:
+                self._part += 1
+            if data:
+                if part is self._fp:
+                    self.sent += len(data)
+                result.append(data)
+                if size > 0:
+                    size -= len(data)
+        return b''.join(result)
+
+    def __iter__(self):
+        return iter(lambda: self.read(self.chunk_size), b'')
+
+    def rewind(self):
+        """
+        Start the body over, to send it again.  Only possible when the
+        file is seekable.
+        """
+        if self._start is None:
+            raise ValueError("Unable to resend a streamed upload")
+        self._fp.seek(self._start)
+        for part in self._parts:
+            if part is not self._fp:
+                part.seek(0)
+        self._part = 0
+        self.sent = 0
+
+
+
+_url_scheme = 'https'
 
-def download_rendered_content(content_ntiid, host, username, password, ua_string):
-    url = 'https://%s/dataserver2/Objects/%s/@@Export' % (host, content_ntiid)
+
+def set_url_scheme(scheme):
+    """
+    Talk to dataservers over ``scheme``. Only local stand-in servers,
+    such as the one the benchmarks run against, should need ``http``.
+    """
+    global _url_scheme
+    _url_scheme = scheme
+
+
+def server_url(host, path=''):
+    return '%s://%s%s' % (_url_scheme, host, path)
+
+SESSION_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.nti', 'sessions')
+
+def enable_session_cache(cache_dir=SESSION_CACHE_DIR):
+    """
+    Persist session cookies in ``cache_dir`` so later runs can skip the
+    password prompt until the cookie expires.
+    """
+    from nti.deploymenttools.content import session
+    session.enable_session_cache(cache_dir)
+
+
+def has_session(host, username):
+    """
+    Return whether requests to ``host`` can be authenticated without a
+    password, either from this run or from the session cache.
+    """
+    from nti.deploymenttools.content import session
+    return session.has_session(host, username)
+
+
+def get_session(host, username, password=None):
+    """
+    Return the shared, authenticated session for ``username`` on ``host``,
+    logging on the first time it is requested.
+    """
+    from nti.deploymenttools.content import session
+    return session.get_session(host, username, password)
+
+
+def get_password(host, username):
+    """
+    Prompt for the password of ``username`` on ``host`` unless there is
+    already a usable session for it, in which case ``None`` is returned.
+    """
+    if has_session(host, username):
+        return None
+    return getpass('Password for %s@%s: ' % (username, host))
+
+
+def _body_stream(response):
+    # The underlying http.client response reads straight into a caller's
+    # buffer; urllib3's readinto copies through a bytes object of its own.
+    # Encoded bodies have to go through urllib3 to be decoded.
+    if response.headers.get('Content-Encoding', 'identity') not in ('identity', ''):
+        return None
+    raw = response.raw
+    stream = getattr(raw, '_fp', None) or raw
+    return stream if hasattr(stream, 'readinto') else None
+
+
+def _next_chunk_size(nbytes, elapsed):
+    """
+    The power of two read size that takes about
+    :data:`TARGET_READ_SECONDS` at the throughput of the last read.
+    """
+    wanted = nbytes * TARGET_READ_SECONDS / max(elapsed, 1e-6)
+    size = MIN_CHUNK_SIZE
+    while size < wanted and size < MAX_CHUNK_SIZE:
+        size *= 2
+    return size
+
+
+def read_response(response, out, chunk_size=CHUNK_SIZE):
+    """
+    Write the body of the streamed ``response`` to the binary file
+    ``out``, returning the number of bytes written.
+
+    The body is read into a reusable buffer, so no object is allocated
+    per chunk, and the size of each read follows the observed throughput
+    between :data:`MIN_CHUNK_SIZE` and :data:`MAX_CHUNK_SIZE`.  The
+    buffer is only replaced when the read size outgrows it.  A body sent
+    without a ``Content-Length`` is counted in the request metrics here.
+    """
+    stream = _body_stream(response)
+    total = 0
+    if stream is None:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if chunk:
+                out.write(chunk)
+                total += len(chunk)
+        record_received(response, total)
+        return total
+    size = min(max(chunk_size, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+    view = memoryview(bytearray(size))
+    while True:
+        if size > len(view):
+            view = memoryview(bytearray(size))
+        start = default_timer()
+        nbytes = stream.readinto(view[:size])
+        if not nbytes:
+            break
+        out.write(view[:nbytes])
+        total += nbytes
+        if nbytes == size:
+            size = _next_chunk_size(nbytes, default_timer() - start)
+    if stream is not response.raw:
+        # Reading around urllib3 means it neither checks the length of the
+        # body nor sees its end, so both are left to us.
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit() and total != int(length):
+            response.close()
+            raise requests.exceptions.ChunkedEncodingError(
+                'Connection broken: %s bytes read, %s expected'
+                % (total, length))
+        response.raw.release_conn()
+    record_received(response, total)
+    return total
+
+
+def _preallocate(fp, size):
+    try:
+        os.posix_fallocate(fp.fileno(), 0, size)
+    except (AttributeError, OSError):
+        # Not on this platform or filesystem; the file grows as written.
+        pass
+
+
+def save_response(response, path, chunk_size=CHUNK_SIZE):
+    """
+    Write the body of the streamed ``response`` to ``path`` with
+    :func:`read_response`, reserving the space up front when the server
+    sends a ``Content-Length``.  The file is removed if the body cannot
+    be read in full.
+    """
+    length = response.headers.get('Content-Length')
+    try:
+        with open(path, 'wb') as fp:
+            if length and _body_stream(response) is not None:
+                _preallocate(fp, int(length))
+            total = read_response(response, fp, chunk_size)
+            fp.truncate(total)
+    except Exception:
+        # Never leave a partial archive behind to pass for a whole one
+        os.remove(path)
+        raise
+    return total
+
+
+def download_rendered_content(content_ntiid, host, username, password, ua_string,
+                              output_dir=None):
+    url = server_url(host, '/dataserver2/Objects/%s/@@Export' % content_ntiid)
     headers = {
         'user-agent': ua_string
     }
     content_archive = '.'.join([content_ntiid, 'zip'])
-    response = requests.get(url, stream=True, headers=headers,
-                            auth=(username, password))
-    response.raise_for_status()
-    if response.status_code == requests_codes.ok:
-        with open(content_archive, 'wb') as archive:
-            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
-                if chunk:
-                    archive.write(chunk)
-        return content_archive
+    if output_dir:
+        content_archive = os.path.join(output_dir, content_archive)
+    session = get_session(host, username, password)
+    with span('download', content_ntiid) as timing:
+        response = session.get(url, stream=True, headers=headers)
+        response.raise_for_status()
+        if response.status_code == requests.codes.ok:
+            timing.bytes = save_response(response, content_archive)
+            return content_archive
 
 def get_course_info(course_ntiid, host, username, password, ua_string):
-    url = 'https://%s/dataserver2/Objects/%s' % (host, course_ntiid)
+    url = server_url(host, '/dataserver2/Objects/%s' % course_ntiid)
     headers = {
         'user-agent': ua_string
     }
-    response = requests.get(url, stream=True, headers=headers,
-                            auth=(username, password))
+    session = get_session(host, username, password)
+    response = session.get(url, stream=True, headers=headers)
     response.raise_for_status()
-    if response.status_code == requests_codes.ok:
+    if response.status_code == requests.codes.ok:
         return response.json()
 
 
-def export_course(course_ntiid, host, username, password, ua_string, backup=False):
-    url = 'https://%s/dataserver2/Objects/%s/@@Export' % (host, course_ntiid)
+def export_course(course_ntiid, host, username, password, ua_string, backup=False,
+                  output_dir=None, output=None):
+    """
+    Export the course ``course_ntiid`` from ``host`` to
+    ``<course_ntiid>.zip`` in ``output_dir``, or to the binary file
+    ``output`` if one is given, and return where it was written.
+    """
+    url = server_url(host, '/dataserver2/Objects/%s/@@Export' % course_ntiid)
     headers = {
         'user-agent': ua_string
     }
@@ -90,83 +680,108 @@ def export_course(course_ntiid, host, username, password, ua_string, backup=Fals
         'backup': backup
     }
     course_archive = '.'.join([course_ntiid, 'zip'])
-    response = requests.get(url, stream=True, headers=headers,
-                            params=body, auth=(username, password))
-    response.raise_for_status()
-    if response.status_code == requests_codes.ok:
-        with open(course_archive, 'wb') as archive:
-            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
-                if chunk:
-                    archive.write(chunk)
-        return course_archive
+    if output_dir:
+        course_archive = os.path.join(output_dir, course_archive)
+    session = get_session(host, username, password)
+    with span('export', course_ntiid) as timing:
+        response = session.get(url, stream=True, headers=headers, params=body)
+        response.raise_for_status()
+        if response.status_code == requests.codes.ok:
+            if output is not None:
+                timing.bytes = read_response(response, output)
+                output.flush()
+                return output
+            timing.bytes = save_response(response, course_archive)
+            return course_archive
 
 
-def import_course(course, host, username, password, site_library, 
-                  admin_level, provider_id, ua_string):
-    url = 'https://%s/dataserver2/CourseAdmin/@@ImportCourse' % host
-    headers = {
-        'user-agent': ua_string
-    }
-    with open(course, "rb") as fp:
-        files = {'data': fp}
-        data = {
-            'admin': admin_level,
-            'key': provider_id,
-            'writeout': "True",
-            'site': site_library,
-        }
+def _upload_name(content):
+    name = content if not hasattr(content, 'read') \
+        else getattr(content, 'name', None)
+    if not isinstance(name, six.string_types) or name.startswith('<'):
+        return 'upload.zip'
+    return os.path.basename(name)
+
+
+@contextlib.contextmanager
+def _upload_body(content, fields):
+    """
+    Yield a :class:`MultipartBody` for ``content``, the path of an
+    archive or a binary file such as standard input.
+    """
+    fp = content if hasattr(content, 'read') else open(content, 'rb')
+    try:
+        size = None
+        try:
+            st = os.fstat(fp.fileno())
+            if stat.S_ISREG(st.st_mode):
+                size = st.st_size - fp.tell()
+        except (AttributeError, OSError, ValueError):
+            pass
+        yield MultipartBody(fields, 'data', fp, _upload_name(content), size)
+    finally:
+        if fp is not content:
+            fp.close()
+
+
+def _post_upload(url, host, username, password, ua_string, content, fields,
+                 timing):
+    with _upload_body(content, fields) as body:
         kwargs = {'url': url,
-                  'headers': headers,
-                  'files': files,
-                  'data': data,
-                  'auth': (username, password)}
+                  'headers': {'user-agent': ua_string,
+                              'Content-Type': body.content_type},
+                  'data': body}
         if '.dev' in url:
             kwargs['verify'] = False
-        response = requests.post(**kwargs)
+        session = get_session(host, username, password)
+        response = session.post(**kwargs)
+        timing.bytes = (timing.bytes or 0) + body.sent
         response.raise_for_status()
-        if response.status_code == requests_codes.ok:
-            return response.json()
+    return response
 
 
-def restore_course(course, host, username, password, ntiid, ua_string):
-    url = 'https://%s/dataserver2/Objects/%s/@@Import' % (host, ntiid)
-    headers = {
-        'user-agent': ua_string
+def import_course(course, host, username, password, site_library, 
+                  admin_level, provider_id, ua_string):
+    """
+    Import ``course``, the path of a course bundle or a binary file
+    to read one from, into ``site_library`` on ``host``.
+    """
+    url = server_url(host, '/dataserver2/CourseAdmin/@@ImportCourse')
+    data = {
+        'admin': admin_level,
+        'key': provider_id,
+        'writeout': "True",
+        'site': site_library,
     }
-    with open(course, "rb") as fp:
-        files = {'data': fp}
-        kwargs = {'url': url,
-                  'headers': headers,
-                  'files': files,
-                  'auth': (username, password)}
-        if '.dev' in url:
-            kwargs['verify'] = False
-        response = requests.post(**kwargs)
-        response.raise_for_status()
-        if response.status_code == requests_codes.ok:
-            return response.json()
+    with span('import', provider_id or _upload_name(course)) as timing:
+        response = _post_upload(url, host, username, password, ua_string,
+                                course, data, timing)
+    if response.status_code == requests.codes.ok:
+        return response.json()
+
+
+def restore_course(course, host, username, password, ntiid, ua_string):
+    """
+    Restore the course ``ntiid`` on ``host`` from ``course``, the path
+    of a course bundle or a binary file to read one from.
+    """
+    url = server_url(host, '/dataserver2/Objects/%s/@@Import' % ntiid)
+    with span('import', ntiid) as timing:
+        response = _post_upload(url, host, username, password, ua_string,
+                                course, {}, timing)
+    if response.status_code == requests.codes.ok:
+        return response.json()
 
 
 def upload_rendered_content(content, host, username, password, 
                             site_library, ua_string):
-    url = 'https://%s/dataserver2/Library/@@ImportRenderedContent' % host
-    headers = {
-        'user-agent': ua_string
+    url = server_url(host, '/dataserver2/Library/@@ImportRenderedContent')
+    data = {
+        'obfuscate': True,
+        'site': site_library
     }
-    with open(content, "rb") as fp:
-        files = {'data': fp}
-        data = {
-            'obfuscate': True,
-            'site': site_library
-        }
-        kwargs = {'url': url,
-                  'headers': headers,
-                  'files': files,
-                  'data': data,
-                  'auth': (username, password)}
-        if '.dev' in url:
-            kwargs['verify'] = False
-        response = requests.post(**kwargs)
-        response.raise_for_status()
-        if response.status_code == requests_codes.ok:
-            return response.json()
+    with span('upload', _upload_name(content)) as timing:
+        response = _post_upload(url, host, username, password, ua_string,
+                                content, data, timing)
+    if response.status_code == requests.codes.ok:
+        return response.json()
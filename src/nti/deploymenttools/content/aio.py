@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Asyncio versions of the dataserver helpers.
+
+The helpers of :mod:`nti.deploymenttools.content` block a thread per
+request, which is fine for a tool moving one course but not for
+orchestrating hundreds of catalog lookups or status polls at once.  The
+coroutines here do the same requests on an event loop over
+:mod:`aiohttp`, so a single thread can keep any number of them in
+flight, bounded only by the connection ``limit`` of the session.
+
+They mirror their synchronous counterparts, returning the decoded JSON
+of a successful response, except that they take an open
+:class:`AsyncDataserverSession` in place of the host, user and password,
+and raise :class:`aiohttp.ClientResponseError` on HTTP errors.  For
+example::
+
+    async with AsyncDataserverSession(host, username, password) as session:
+        infos = await asyncio.gather(*[get_course_info(session, ntiid, UA)
+                                       for ntiid in ntiids])
+
+This module needs Python 3 and the ``async`` extra.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import base64
+import asyncio
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    raise ImportError("nti.deploymenttools.content.aio requires aiohttp; "
+                      "install the 'async' extra")
+
+from nti.deploymenttools.content import CHUNK_SIZE
+from nti.deploymenttools.content import LOGON_PATH
+from nti.deploymenttools.content import server_url
+
+from nti.deploymenttools.content.timing import span
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Connections an :class:`AsyncDataserverSession` keeps open at most.
+DEFAULT_LIMIT = 100
+
+
+class AsyncDataserverSession(object):
+    """
+    An :class:`aiohttp.ClientSession` for one dataserver that, like
+    :class:`~nti.deploymenttools.content.session.DataserverSession`,
+    logs on once with basic auth and then relies on the session cookie,
+    falling back to basic auth if the server hands out none.  When the
+    cookie expires mid-run the first request to notice logs on again
+    while the others wait for it.
+    """
+
+    def __init__(self, host, username, password=None, limit=DEFAULT_LIMIT):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.limit = limit
+        self.auth = None
+        self.session = None
+        self._logon_lock = None
+        self._generation = 0
+
+    async def open(self):
+        # Dataservers are often reached by address, which the default
+        # cookie jar would not keep cookies for.
+        self.session = aiohttp.ClientSession(
+            cookie_jar=aiohttp.CookieJar(unsafe=True),
+            connector=aiohttp.TCPConnector(limit=self.limit))
+        self._logon_lock = asyncio.Lock()
+        if self.password:
+            await self.logon()
+        return self
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *unused):
+        await self.close()
+
+    def url(self, path):
+        return server_url(self.host, path)
+
+    def _ssl(self, url):
+        return False if '.dev' in url else None
+
+    def _basic_auth(self):
+        credentials = '%s:%s' % (self.username, self.password)
+        return 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+
+    async def logon(self):
+        if not self.password:
+            raise ValueError("No password for %s@%s" % (self.username, self.host))
+        url = self.url(LOGON_PATH)
+        logger.debug('Logging on to %s as %s', self.host, self.username)
+        self.session.cookie_jar.clear()
+        auth = self._basic_auth()
+        async with self.session.get(url, headers={'Authorization': auth},
+                                    ssl=self._ssl(url)) as response:
+            response.raise_for_status()
+        if not len(self.session.cookie_jar):
+            logger.debug('No session cookie from %s, using basic auth.',
+                         self.host)
+            self.auth = auth
+        self._generation += 1
+
+    async def _relogon(self, generation):
+        async with self._logon_lock:
+            # Someone else may have logged on while we waited
+            if generation == self._generation:
+                logger.info('Session for %s@%s expired, logging on again.',
+                            self.username, self.host)
+                await self.logon()
+
+    async def request(self, method, url, data=None, **kwargs):
+        """
+        Send a request and return the response, which the caller must
+        release.  ``data`` may be a callable returning the body, so that
+        a body that can only be sent once is built again for a retry.
+        """
+        kwargs.setdefault('ssl', self._ssl(url))
+        headers = kwargs['headers'] = dict(kwargs.get('headers') or {})
+        if self.auth is not None:
+            headers['Authorization'] = self.auth
+        generation = self._generation
+        body = data() if callable(data) else data
+        response = await self.session.request(method, url, data=body, **kwargs)
+        if response.status == 401 and self.auth is None and self.password:
+            response.release()
+            await self._relogon(generation)
+            if self.auth is not None:
+                headers['Authorization'] = self.auth
+            body = data() if callable(data) else data
+            response = await self.session.request(method, url, data=body,
+                                                  **kwargs)
+        return response
+
+    async def get_json(self, url, ua_string, **kwargs):
+        response = await self.request('GET', url,
+                                      headers={'user-agent': ua_string},
+                                      **kwargs)
+        async with response:
+            response.raise_for_status()
+            if response.status == 200:
+                return await response.json(content_type=None)
+
+
+async def _save_response(response, path, output=None):
+    loop = asyncio.get_running_loop()
+    total = 0
+    fp = output if output is not None else open(path, 'wb')
+    try:
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            # Writes go to a thread so a slow disk does not stall the loop
+            await loop.run_in_executor(None, fp.write, chunk)
+            total += len(chunk)
+    finally:
+        if output is None:
+            fp.close()
+        else:
+            output.flush()
+    return total
+
+
+async def _download(session, path, ua_string, archive, output, params=None):
+    response = await session.request('GET', session.url(path), params=params,
+                                     headers={'user-agent': ua_string})
+    async with response:
+        response.raise_for_status()
+        if response.status == 200:
+            return await _save_response(response, archive, output)
+
+
+async def get_course_info(session, course_ntiid, ua_string):
+    return await session.get_json(
+        session.url('/dataserver2/Objects/%s' % course_ntiid), ua_string)
+
+
+async def download_rendered_content(session, content_ntiid, ua_string,
+                                    output_dir=None):
+    content_archive = '.'.join([content_ntiid, 'zip'])
+    if output_dir:
+        content_archive = os.path.join(output_dir, content_archive)
+    with span('download', content_ntiid) as timing:
+        timing.bytes = await _download(
+            session, '/dataserver2/Objects/%s/@@Export' % content_ntiid,
+            ua_string, content_archive, None)
+    if timing.bytes is not None:
+        return content_archive
+
+
+async def export_course(session, course_ntiid, ua_string, backup=False,
+                        output_dir=None, output=None):
+    """
+    Export the course ``course_ntiid`` to ``<course_ntiid>.zip`` in
+    ``output_dir``, or to the binary file ``output`` if one is given,
+    and return where it was written.
+    """
+    course_archive = '.'.join([course_ntiid, 'zip'])
+    if output_dir:
+        course_archive = os.path.join(output_dir, course_archive)
+    # aiohttp only takes str, int or float query values
+    params = {'backup': str(backup)}
+    with span('export', course_ntiid) as timing:
+        timing.bytes = await _download(
+            session, '/dataserver2/Objects/%s/@@Export' % course_ntiid,
+            ua_string, course_archive, output, params)
+    if timing.bytes is not None:
+        return output if output is not None else course_archive
+
+
+def _upload_form(content, fields, name='data', filename=None, opened=None):
+    """
+    Return a callable building the multipart form for ``content``, the
+    path of an archive or a binary file, so a retry can rebuild it.
+    Fields whose value is None are left out.  The files opened for
+    ``content`` are added to the list ``opened`` for the caller to close.
+    """
+    def build():
+        form = aiohttp.FormData()
+        for key, value in sorted(fields.items()):
+            if value is not None:
+                form.add_field(key, str(value))
+        if hasattr(content, 'read'):
+            fp, default = content, 'upload.zip'
+            if hasattr(fp, 'seek'):
+                fp.seek(0)
+        else:
+            fp, default = open(content, 'rb'), os.path.basename(content)
+            if opened is not None:
+                opened.append(fp)
+        form.add_field(name, fp, filename=filename or default,
+                       content_type='application/octet-stream')
+        return form
+    return build
+
+
+async def _post_upload(session, path, ua_string, content, fields, timing,
+                       name='data', filename=None):
+    if not hasattr(content, 'read'):
+        timing.add_file(content)
+    opened = []
+    try:
+        response = await session.request('POST', session.url(path),
+                                         headers={'user-agent': ua_string},
+                                         data=_upload_form(content, fields, name,
+                                                           filename, opened))
+        async with response:
+            response.raise_for_status()
+            if response.status == 200:
+                return await response.json(content_type=None)
+    finally:
+        for fp in opened:
+            fp.close()
+
+
+async def import_course(session, course, site_library, admin_level,
+                        provider_id, ua_string):
+    data = {
+        'admin': admin_level,
+        'key': provider_id,
+        'writeout': "True",
+        'site': site_library,
+    }
+    name = provider_id or os.path.basename(getattr(course, 'name', course))
+    with span('import', name) as timing:
+        return await _post_upload(session, '/dataserver2/CourseAdmin/@@ImportCourse',
+                                  ua_string, course, data, timing)
+
+
+async def restore_course(session, course, ntiid, ua_string):
+    with span('import', ntiid) as timing:
+        return await _post_upload(session, '/dataserver2/Objects/%s/@@Import' % ntiid,
+                                  ua_string, course, {}, timing)
+
+
+async def upload_rendered_content(session, content, site_library, ua_string):
+    data = {
+        'obfuscate': True,
+        'site': site_library
+    }
+    name = os.path.basename(getattr(content, 'name', content))
+    with span('upload', name) as timing:
+        return await _post_upload(session, '/dataserver2/Library/@@ImportRenderedContent',
+                                  ua_string, content, data, timing)
+
+
+async def wait_for_render(session, job, ua_string, poll_interval=10):
+    """
+    Poll the render ``job``, an item of the response to a render
+    submission, until it is neither pending nor running, and return its
+    final status.  The error of a failed render is logged.
+    """
+    links = dict((link['rel'], session.url(link['href'])) for link in job['Links'])
+    status = (await session.get_json(links['status'], ua_string))['status']
+    while status in ('Pending', 'Running'):
+        logger.debug("Render %s is %s", job.get('JobId'), status)
+        await asyncio.sleep(poll_interval)
+        status = (await session.get_json(links['status'], ua_string))['status']
+    if status == 'Failed':
+        error = await session.get_json(links['error'], ua_string)
+        logger.error('Render %s failed.\n%s', job.get('JobId'), error['message'])
+    return status
+
+
+async def render_content(session, content_archive, job_name, site_library,
+                         ua_string, poll_interval=10):
+    """
+    Submit the render source ``content_archive`` as ``job_name`` and
+    wait for the render, returning its final status.
+    """
+    with span('upload', job_name) as timing:
+        result = await _post_upload(session, '/dataserver2/Library/@@RenderContentSource',
+                                    ua_string, content_archive,
+                                    {'site': site_library}, timing,
+                                    name=job_name, filename=job_name + '.zip')
+    with span('poll', job_name):
+        return await wait_for_render(session, result['Items'][job_name + '.zip'],
+                                     ua_string, poll_interval)
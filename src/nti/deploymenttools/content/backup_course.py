@@ -11,22 +11,45 @@ from __future__ import absolute_import
 import codecs
 import os
 import logging
-from shutil import rmtree
-from getpass import getpass
 from zipfile import ZipFile
-from tempfile import mkdtemp
 from argparse import ArgumentParser
 
-import requests
-
 import simplejson as json
 
+from nti.deploymenttools.content import requests
 from nti.deploymenttools.content import export_course
 from nti.deploymenttools.content import get_course_info
 from nti.deploymenttools.content import archive_directory
+from nti.deploymenttools.content import get_password
 from nti.deploymenttools.content import configure_logging
+from nti.deploymenttools.content import enable_session_cache
 from nti.deploymenttools.content import download_rendered_content
 
+from nti.deploymenttools.content.cold_storage import FORMATS
+from nti.deploymenttools.content.cold_storage import index_path
+from nti.deploymenttools.content.cold_storage import codec_for_format
+from nti.deploymenttools.content.cold_storage import write_cold_archive
+
+from nti.deploymenttools.content.journal import JobJournal
+
+from nti.deploymenttools.content.plan import format_plan
+from nti.deploymenttools.content.plan import plan_transfer
+
+from nti.deploymenttools.content.s3 import is_s3_url
+from nti.deploymenttools.content.s3 import s3_options
+from nti.deploymenttools.content.s3 import upload_to_url
+from nti.deploymenttools.content.s3 import add_s3_arguments
+
+from nti.deploymenttools.content.timing import span
+from nti.deploymenttools.content.timing import report_timing
+from nti.deploymenttools.content.timing import add_timing_arguments
+
+from nti.deploymenttools.content.metrics import write_metrics
+from nti.deploymenttools.content.metrics import add_metrics_arguments
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
+
 logger = __import__('logging').getLogger(__name__)
 logging.captureWarnings(True)
 
@@ -39,70 +62,108 @@ def _get_content_packages(course_archive):
         content_packages = bundle_metadata['ContentPackages']
     return content_packages or ()
 
-def _remove_path(path):
-    if path and os.path.exists(path):
-        rmtree(path)
-
 def _extract_archive(archive, location):
-    with ZipFile(archive, 'r') as zip:
+    with span('extract', os.path.basename(archive)) as timing, \
+            ZipFile(archive, 'r') as zip:
         for name in zip.namelist():
             zip.extract(name, location)
+        timing.bytes = sum(info.file_size for info in zip.infolist())
 
 def backup_course(course_ntiid, source_host, username, output_dir,
-                cleanup=True):
-    cwd = os.getcwd()
-    course_archive = None
+                cleanup=True, job=None, password=None, s3=None,
+                archive_format='zip', compression_level=None,
+                deterministic=False, manifest=False):
+    if job is None:
+        if not is_s3_url(output_dir):
+            output_dir = os.path.abspath(output_dir or os.getcwd())
+        job = JobJournal.create('backup_course', {
+            'course_ntiid': course_ntiid,
+            'source_host': source_host,
+            'username': username,
+            'output_dir': output_dir,
+            's3': s3,
+            'archive_format': archive_format,
+            'compression_level': compression_level,
+            'deterministic': deterministic,
+            'manifest': manifest,
+        })
     content_archives = []
-    working_dir = mkdtemp()
-    staging_dir = mkdtemp()
+    working_dir = job.working_dir
+    staging_dir = job.path('staging')
     try:
-        os.chdir(working_dir)
         logger.info('Using %s as the working directory', working_dir)
-        password = getpass('Password for %s@%s: ' % (username, source_host))
         logger.info("Exporting %s from %s", course_ntiid, source_host)
-        course_info = get_course_info(course_ntiid, source_host,
-                                      username, password, UA_STRING)
+        course_info = job.run('info', get_course_info, course_ntiid,
+                              source_host, username, password, UA_STRING)
         admin_level = course_info['AdminLevel']
         provider_id = course_info['ProviderUniqueID']
         course_title = course_info['title']
-        course_archive = export_course(course_ntiid, source_host,
-                                       username, password, UA_STRING)
+        course_archive = job.run('export', export_course, course_ntiid,
+                                 source_host, username, password, UA_STRING,
+                                 output_dir=working_dir)
         staging_dir = os.path.join(staging_dir, provider_id)
         logger.info("Unzipping course bundle %s", course_archive)
         course_path = os.path.join(staging_dir,"course")
-        _extract_archive(course_archive, course_path)
+        job.run('extract', _extract_archive, course_archive, course_path)
 
         for content_package in _get_content_packages(course_archive):
             logger.info("Downloading content package %s", content_package)
-            content_archive = download_rendered_content(content_package, source_host,
-                                                        username, password, UA_STRING)
+            content_archive = job.run('download:' + content_package,
+                                      download_rendered_content,
+                                      content_package, source_host,
+                                      username, password, UA_STRING,
+                                      output_dir=working_dir)
             content_archives.append((content_package, content_archive))
 
         for content_archive in content_archives:
             logger.info("Unzipping content package %s", content_archive[0])
             content_path = os.path.join(staging_dir,"content",content_archive[0])
-            _extract_archive(content_archive[1], content_path)
+            job.run('extract:' + content_archive[0], _extract_archive,
+                    content_archive[1], content_path)
 
-        archive_path = os.path.join(admin_level, '.'.join([provider_id,'zip']))
+        archive_path = os.path.join(admin_level,
+                                    provider_id + FORMATS[archive_format])
         index_info = u'"{0}", "{1}", "{2}"\n'.format(provider_id, course_title, archive_path)
-        index_file = os.path.join(output_dir, '.'.join([provider_id,'csv']))
+        # Object store backups are staged in the job before uploading
+        local_dir = job.path('output') if is_s3_url(output_dir) else output_dir
+        if not os.path.isdir(local_dir):
+            os.makedirs(local_dir)
+        index_file = os.path.join(local_dir, '.'.join([provider_id,'csv']))
 
         with codecs.open(index_file, 'wb', 'utf-8') as fp:
             fp.write(index_info)
 
-        out_file = os.path.join(output_dir, archive_path)
+        out_file = os.path.join(local_dir, archive_path)
         if not os.path.exists(os.path.dirname(out_file)):
             os.makedirs(os.path.dirname(out_file))
 
-        archive_directory(os.path.dirname(staging_dir), out_file)
+        uploads = [out_file, index_file]
+        if archive_format == 'zip':
+            job.run('archive', archive_directory, os.path.dirname(staging_dir),
+                    out_file, deterministic=deterministic, manifest=manifest)
+        else:
+            # The course and each package can be restored on their own
+            units = [provider_id + '/course']
+            units.extend(provider_id + '/content/' + package
+                         for package, _ in content_archives)
+            job.run('archive', write_cold_archive, os.path.dirname(staging_dir),
+                    out_file, codec_for_format(archive_format),
+                    compression_level, units, deterministic=deterministic,
+                    manifest=manifest)
+            uploads.append(index_path(out_file))
 
+        if is_s3_url(output_dir):
+            for path in uploads:
+                name = os.path.relpath(path, local_dir).replace(os.sep, '/')
+                job.run('upload:' + name, upload_to_url, path, output_dir,
+                        name, **(s3 or {}))
+        job.finish(cleanup)
     except requests.exceptions.HTTPError as e:
         logger.error(e)
-    finally:
-        os.chdir(cwd)
-        if cleanup:
-            _remove_path(working_dir)
-            _remove_path(staging_dir)
+        job.fail(e)
+    except Exception as e:
+        job.fail(e)
+        raise
 
 
 def _parse_args():
@@ -114,7 +175,7 @@ def _parse_args():
     arg_parser.add_argument('-u', '--user', dest='user',
                             help="User to authenticate with the server.")
     arg_parser.add_argument('-o', '--output', dest='output',
-                            help="Backup output location.")
+                            help="Backup output directory or s3://bucket/prefix URL.")
     arg_parser.add_argument('-v', '--verbose', dest='loglevel',
                             action='store_const',
                             const=logging.DEBUG,
@@ -125,9 +186,37 @@ def _parse_args():
     arg_parser.add_argument('--no-cleanup', dest='no_cleanup', action='store_false',
                             default=True,
                             help="Do not cleanup process files.")
+    arg_parser.add_argument('--cache-session', dest='cache_session',
+                            action='store_true', default=False,
+                            help="Cache the server session between runs until it expires.")
+    arg_parser.add_argument('--plan', dest='plan', action='store_true',
+                            default=False,
+                            help="Print the objects, bytes and estimated time the run would take, then exit.")
+    arg_parser.add_argument('--throughput', dest='throughput', type=float,
+                            help="Expected throughput in MiB/s for --plan. Measured from a content package of the source if omitted; course exports are never sampled.")
+    arg_parser.add_argument('--resume', dest='resume', metavar='JOB_ID',
+                            help="Continue a failed backup from its last completed step.")
+    arg_parser.add_argument('--abort', dest='abort', metavar='JOB_ID',
+                            help="Discard a failed backup and its downloaded files.")
+    arg_parser.add_argument('--format', dest='archive_format', default='zip',
+                            choices=sorted(FORMATS),
+                            help="Backup container. The tar formats are compressed on all cores and come with an index for restoring single courses or packages. Defaults to zip.")
+    arg_parser.add_argument('--compression-level', dest='compression_level', type=int,
+                            help="Compression level for the tar formats.")
+    arg_parser.add_argument('--deterministic', dest='deterministic', action='store_true',
+                            default=False,
+                            help="Sort the members and normalize their timestamps and permissions so the same course always gives a byte-identical backup.")
+    arg_parser.add_argument('--manifest', dest='manifest', action='store_true',
+                            default=False,
+                            help="Record the size and SHA-256 of every member in the backup.")
+    add_s3_arguments(arg_parser)
+    add_timing_arguments(arg_parser)
+    add_metrics_arguments(arg_parser)
+    add_profile_arguments(arg_parser)
     return arg_parser.parse_args()
 
 
+@profile_main
 def main():
     # Parse command line args
     args = _parse_args()
@@ -135,11 +224,48 @@ def main():
     loglevel = args.loglevel or logging.INFO
     configure_logging(level=loglevel)
 
-    backup_course(args.ntiid,
-                args.source_host,
-                args.user,
-                args.output,
-                cleanup=args.no_cleanup)
+    if args.cache_session:
+        enable_session_cache()
+
+    if args.plan:
+        try:
+            password = get_password(args.source_host, args.user)
+            throughput = args.throughput * 1024 * 1024 if args.throughput else None
+            plan = plan_transfer(args.ntiid, args.source_host, args.user,
+                                 password, UA_STRING, throughput=throughput)
+            print(format_plan(plan))
+        except requests.exceptions.HTTPError as e:
+            logger.error(e)
+        return
+
+    if args.abort:
+        JobJournal.load(args.abort).abort()
+        return
+
+    if args.resume:
+        job = JobJournal.load(args.resume)
+        params = job.params
+    else:
+        job = None
+        params = {
+            'course_ntiid': args.ntiid,
+            'source_host': args.source_host,
+            'username': args.user,
+            'output_dir': args.output,
+            's3': s3_options(args),
+            'archive_format': args.archive_format,
+            'compression_level': args.compression_level,
+            'deterministic': args.deterministic,
+            'manifest': args.manifest,
+        }
+
+    password = get_password(params['source_host'], params['username'])
+    backup_course(cleanup=args.no_cleanup,
+                  job=job,
+                  password=password,
+                  **params)
+    report_timing(args)
+    write_metrics(args)
 
 
 if __name__ == '__main__':  # pragma: no cover
@@ -8,14 +8,33 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
+import os
 import logging
-from getpass import getpass
+from shutil import rmtree
+from tempfile import mkdtemp
 from argparse import ArgumentParser
 
-import requests
-
+from nti.deploymenttools.content import STDIO
+from nti.deploymenttools.content import requests
+from nti.deploymenttools.content import binary_stdio
 from nti.deploymenttools.content import export_course
+from nti.deploymenttools.content import get_password
 from nti.deploymenttools.content import configure_logging
+from nti.deploymenttools.content import enable_session_cache
+
+from nti.deploymenttools.content.s3 import is_s3_url
+from nti.deploymenttools.content.s3 import s3_options
+from nti.deploymenttools.content.s3 import upload_to_url
+from nti.deploymenttools.content.s3 import add_s3_arguments
+
+from nti.deploymenttools.content.timing import report_timing
+from nti.deploymenttools.content.timing import add_timing_arguments
+
+from nti.deploymenttools.content.metrics import write_metrics
+from nti.deploymenttools.content.metrics import add_metrics_arguments
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
 
 UA_STRING = 'NextThought Course Backup Utility'
 
@@ -23,17 +42,33 @@ logger = __import__('logging').getLogger(__name__)
 logging.captureWarnings(True)
 
 
-def backup_course(course_ntiid, source_host, username, unused_cleanup=True):
+def backup_course(course_ntiid, source_host, username, unused_cleanup=True,
+                  password=None, output_dir=None, s3=None):
     course_archive = None
+    staging_dir = mkdtemp() if is_s3_url(output_dir) else None
     try:
-        password = getpass('Password for %s@%s:' % (username, source_host))
         logger.info("Backing up %s from %s", course_ntiid, source_host)
+        if output_dir == STDIO:
+            export_course(course_ntiid, source_host, username, password,
+                          UA_STRING, backup=True, output=binary_stdio('stdout'))
+            logger.info('Course %s written to standard output.', course_ntiid)
+            return STDIO
+        if output_dir and not staging_dir and not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
         course_archive = export_course(course_ntiid, source_host, username, 
-                                       password, UA_STRING, backup=True)
+                                       password, UA_STRING, backup=True,
+                                       output_dir=staging_dir or output_dir)
+        if staging_dir:
+            course_archive = upload_to_url(course_archive, output_dir,
+                                           **(s3 or {}))
         logger.info('Course %s backed up at %s.',
                     course_ntiid, course_archive)
+        return course_archive
     except requests.exceptions.HTTPError as e:
         logger.error(e)
+    finally:
+        if staging_dir:
+            rmtree(staging_dir)
 
 
 def _parse_args(args=None):
@@ -44,6 +79,8 @@ def _parse_args(args=None):
                             help="Source server.")
     arg_parser.add_argument('-u', '--user', dest='user',
                             help="User to authenticate with the server.")
+    arg_parser.add_argument('-o', '--output', dest='output',
+                            help="Backup output directory, s3://bucket/prefix URL, or - for standard output. Defaults to the current directory.")
     arg_parser.add_argument('-v', '--verbose', dest='loglevel', action='store_const', 
                             const=logging.DEBUG, help="Print debugging logs.")
     arg_parser.add_argument('-q', '--quiet', dest='loglevel', action='store_const', 
@@ -52,9 +89,17 @@ def _parse_args(args=None):
     arg_parser.add_argument('--no-cleanup', dest='no_cleanup', action='store_false', 
                             default=True,
                             help="Do not cleanup process files.")
+    arg_parser.add_argument('--cache-session', dest='cache_session',
+                            action='store_true', default=False,
+                            help="Cache the server session between runs until it expires.")
+    add_s3_arguments(arg_parser)
+    add_timing_arguments(arg_parser)
+    add_metrics_arguments(arg_parser)
+    add_profile_arguments(arg_parser)
     return arg_parser.parse_args(args)
 
 
+@profile_main
 def main(args=None):
     # Parse command line args
     args = _parse_args(args)
@@ -62,10 +107,19 @@ def main(args=None):
     loglevel = args.loglevel or logging.INFO
     configure_logging(level=loglevel)
 
+    if args.cache_session:
+        enable_session_cache()
+
+    password = get_password(args.source_host, args.user)
     backup_course(args.ntiid,
                   args.source_host,
                   args.user,
-                  args.no_cleanup)
+                  args.no_cleanup,
+                  password=password,
+                  output_dir=args.output,
+                  s3=s3_options(args))
+    report_timing(args)
+    write_metrics(args)
 
 
 if __name__ == '__main__':  # pragma: no cover
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Import or restore many course bundles in one run.
+
+The archives to process come from a manifest (CSV with a header row, or
+a JSON list of objects) with the columns ``archive``, ``admin_level``,
+``provider_id`` and ``ntiid``, or from glob patterns given on the
+command line. When restoring from a glob the course NTIID is taken from
+the archive name, which is how ``nti_backup_course`` names its output.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import csv
+import glob
+import time
+import codecs
+import logging
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+import simplejson as json
+
+from nti.deploymenttools.content import requests
+from nti.deploymenttools.content import server_url
+from nti.deploymenttools.content import get_session
+from nti.deploymenttools.content import get_password
+from nti.deploymenttools.content import import_course
+from nti.deploymenttools.content import restore_course
+from nti.deploymenttools.content import configure_logging
+from nti.deploymenttools.content import enable_session_cache
+
+from nti.deploymenttools.content.timing import report_timing
+from nti.deploymenttools.content.timing import add_timing_arguments
+
+from nti.deploymenttools.content.metrics import record_retry
+from nti.deploymenttools.content.metrics import write_metrics
+from nti.deploymenttools.content.metrics import add_metrics_arguments
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
+
+UA_STRING = 'NextThought Course Batch Utility'
+
+logger = __import__('logging').getLogger(__name__)
+logging.captureWarnings(True)
+
+#: HTTP statuses worth retrying a restore on; anything else is reported
+#: as a failure.
+TRANSIENT_STATUS_CODES = (429, 500, 502, 503, 504)
+
+#: HTTP statuses that mean the server turned an import away without
+#: starting it. Imports are not idempotent, so a failure that may have
+#: created the course is never retried.
+REJECTED_STATUS_CODES = (429, 503)
+
+MANIFEST_FIELDS = ('archive', 'admin_level', 'provider_id', 'ntiid')
+
+_PAST_TENSE = {'import': 'imported', 'restore': 'restored'}
+
+
+def _not_sent(e):
+    """
+    Whether ``e`` is a failure to connect, raised before any of the
+    request was sent.
+    """
+    from urllib3.exceptions import NewConnectionError
+    if isinstance(e, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(e.args[0] if e.args else None, 'reason', None)
+    return isinstance(e, requests.exceptions.ConnectionError) \
+        and isinstance(reason, NewConnectionError)
+
+
+def _is_transient(action, e):
+    if action == 'import':
+        status_codes = REJECTED_STATUS_CODES
+        if _not_sent(e):
+            return True
+    else:
+        status_codes = TRANSIENT_STATUS_CODES
+        if isinstance(e, (requests.exceptions.ConnectionError,
+                          requests.exceptions.Timeout)):
+            return True
+    if isinstance(e, requests.exceptions.HTTPError):
+        response = e.response
+        return response is not None and response.status_code in status_codes
+    return False
+
+
+def _normalize_entry(entry, base_dir):
+    entry = dict((k, (entry.get(k) or None)) for k in MANIFEST_FIELDS)
+    if not entry['archive']:
+        raise ValueError("Manifest entry without an archive")
+    archive = os.path.expanduser(entry['archive'])
+    entry['archive'] = os.path.abspath(os.path.join(base_dir, archive))
+    return entry
+
+
+def read_manifest(manifest_path):
+    """
+    Read the batch entries from a CSV or JSON manifest.  Relative archive
+    paths are resolved against the manifest's directory.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, 'r') as fp:
+        if manifest_path.lower().endswith('.json'):
+            entries = json.load(fp)
+        else:
+            entries = list(csv.DictReader(fp))
+    return [_normalize_entry(entry, base_dir) for entry in entries]
+
+
+def glob_entries(patterns):
+    """
+    Build batch entries for every archive matching ``patterns``.
+    """
+    entries = []
+    for pattern in patterns or ():
+        for path in sorted(glob.glob(os.path.expanduser(pattern))):
+            ntiid = os.path.splitext(os.path.basename(path))[0]
+            entries.append(_normalize_entry({'archive': path, 'ntiid': ntiid},
+                                            os.getcwd()))
+    return entries
+
+
+def _process(action, entry, host, username, password, site_library,
+             admin_level, retries, retry_delay):
+    result = {
+        'archive': entry['archive'],
+        'action': action,
+        'attempts': 0,
+    }
+    if action == 'import':
+        url = server_url(host, '/dataserver2/CourseAdmin/@@ImportCourse')
+    else:
+        url = server_url(host, '/dataserver2/Objects/%s/@@Import' % entry['ntiid'])
+    start = time.time()
+    while True:
+        result['attempts'] += 1
+        try:
+            if action == 'import':
+                course = import_course(entry['archive'], host, username,
+                                       password, site_library,
+                                       entry['admin_level'] or admin_level,
+                                       entry['provider_id'], UA_STRING)
+            else:
+                course = restore_course(entry['archive'], host, username,
+                                        password, entry['ntiid'], UA_STRING)
+            result['status'] = 'success'
+            result['ntiid'] = course['Course']['NTIID']
+            logger.info('%s %s as %s.', entry['archive'], _PAST_TENSE[action],
+                        result['ntiid'])
+            break
+        except Exception as e:  # pylint: disable=broad-except
+            if _is_transient(action, e) and result['attempts'] <= retries:
+                delay = retry_delay * 2 ** (result['attempts'] - 1)
+                logger.warning('Attempt %s to %s %s failed (%s), retrying in %ss.',
+                               result['attempts'], action, entry['archive'],
+                               e, delay)
+                record_retry('POST', url)
+                time.sleep(delay)
+                continue
+            logger.error('Unable to %s %s: %s', action, entry['archive'], e)
+            result['status'] = 'failed'
+            result['error'] = str(e)
+            break
+    result['elapsed'] = round(time.time() - start, 3)
+    return result
+
+
+def run_batch(action, entries, host, username, password, site_library,
+              admin_level, jobs=4, retries=3, retry_delay=5):
+    """
+    Import or restore every entry with at most ``jobs`` requests in
+    flight, returning one result per entry in manifest order.  Nothing
+    is restored unless every entry names the course to restore.  An
+    import is only retried when it never reached the server or was
+    turned away with a 429 or 503, so a course is not created twice.
+    """
+    if action not in ('import', 'restore'):
+        raise ValueError("Unknown batch action %s" % action)
+    if action == 'restore':
+        unnamed = [entry['archive'] for entry in entries if not entry['ntiid']]
+        if unnamed:
+            raise ValueError("No course ntiid to restore %s"
+                             % ', '.join(unnamed))
+    # Log on once before fanning out so every worker shares the session.
+    get_session(host, username, password)
+    executor = ThreadPoolExecutor(max_workers=max(1, jobs))
+    try:
+        futures = [executor.submit(_process, action, entry, host, username,
+                                   password, site_library, admin_level,
+                                   retries, retry_delay)
+                   for entry in entries]
+        return [future.result() for future in futures]
+    finally:
+        executor.shutdown(wait=True)
+
+
+def write_report(results, report_path):
+    with codecs.open(report_path, 'w', 'utf-8') as fp:
+        json.dump(results, fp, indent=2)
+
+
+def _parse_args():
+    arg_parser = ArgumentParser(description=UA_STRING)
+    arg_parser.add_argument('action', choices=('import', 'restore'),
+                            help="Whether to import new courses or restore existing ones.")
+    arg_parser.add_argument('archives', nargs='*',
+                            help="Glob patterns of course archives to process.")
+    arg_parser.add_argument('-m', '--manifest', dest='manifest',
+                            help="CSV or JSON manifest of course archives to process.")
+    arg_parser.add_argument('-d', '--dest-server', dest='dest_host',
+                            help="Destination server.")
+    arg_parser.add_argument('-u', '--user', dest='user',
+                            help="User to authenticate with the server.")
+    arg_parser.add_argument('-a', '--admin-level', dest='admin_level',
+                            default='DefaultAPIRestored',
+                            help="Admin level for imported courses without one in the manifest.")
+    arg_parser.add_argument('--site-library', dest='site_library',
+                            help="Site library to add content to. Defaults to the hostname of the destination server.")
+    arg_parser.add_argument('-j', '--jobs', dest='jobs', default=4, type=int,
+                            help="Number of archives to process concurrently. Defaults to 4.")
+    arg_parser.add_argument('--retries', dest='retries', default=3, type=int,
+                            help="Times to retry transient failures. Defaults to 3.")
+    arg_parser.add_argument('--retry-delay', dest='retry_delay', default=5,
+                            type=float,
+                            help="Seconds before the first retry, doubled after each attempt. Defaults to 5.")
+    arg_parser.add_argument('-r', '--report', dest='report',
+                            help="Write a JSON result report to this file.")
+    arg_parser.add_argument('-v', '--verbose', dest='loglevel',
+                            action='store_const', const=logging.DEBUG,
+                            help="Print debugging logs.")
+    arg_parser.add_argument('-q', '--quiet', dest='loglevel',
+                            action='store_const', const=logging.WARNING,
+                            help="Print warning and error logs only.")
+    arg_parser.add_argument('--cache-session', dest='cache_session',
+                            action='store_true', default=False,
+                            help="Cache the server session between runs until it expires.")
+    add_timing_arguments(arg_parser)
+    add_metrics_arguments(arg_parser)
+    add_profile_arguments(arg_parser)
+    return arg_parser.parse_args()
+
+
+@profile_main
+def main():
+    # Parse command line args
+    args = _parse_args()
+
+    site_library = args.site_library or args.dest_host
+
+    loglevel = args.loglevel or logging.INFO
+    configure_logging(level=loglevel)
+
+    if args.cache_session:
+        enable_session_cache()
+
+    entries = read_manifest(args.manifest) if args.manifest else []
+    entries.extend(glob_entries(args.archives))
+    if not entries:
+        logger.warning('No course archives to %s.', args.action)
+        return
+
+    password = get_password(args.dest_host, args.user)
+    results = run_batch(args.action, entries, args.dest_host, args.user,
+                        password, site_library, args.admin_level,
+                        jobs=args.jobs, retries=args.retries,
+                        retry_delay=args.retry_delay)
+    failed = [r for r in results if r['status'] != 'success']
+    logger.info('%s of %s archives %s successfully.',
+                len(results) - len(failed), len(results),
+                _PAST_TENSE[args.action])
+    if args.report:
+        write_report(results, args.report)
+    report_timing(args)
+    write_metrics(args)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
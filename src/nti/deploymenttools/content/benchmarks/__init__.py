@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the deployment tools.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import sys
+
+
+def peak_rss():
+    """
+    Return the peak resident set size of this process in bytes, or
+    ``None`` where the :mod:`resource` module is not available.
+    """
+    try:
+        import resource
+    except ImportError:  # pragma: no cover
+        return None
+    value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return value if sys.platform == 'darwin' else value * 1024
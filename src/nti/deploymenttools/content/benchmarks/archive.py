@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks of the local archive code paths.
+
+:func:`~nti.deploymenttools.content.archive_directory`, the cold storage
+writer, bundle extraction and both bundle patchers (full re-zip in
+``nti_copy_course``, member copy in ``nti_manage_course``) are run over
+trees of different shapes with different compression settings.  Each
+configuration records median wall time, CPU time, input and output
+size, and, in a separate run so tracing does not skew the timings, the
+peak of Python memory allocations.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+from zipfile import ZIP_STORED
+from zipfile import ZIP_DEFLATED
+from timeit import default_timer
+
+import simplejson as json
+
+from nti.deploymenttools.content import archive_directory
+
+from nti.deploymenttools.content.benchmarks.generate import DataGenerator
+
+from nti.deploymenttools.content.timing import format_bytes
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Tree shapes as lists of ``(count, size, kind, depth)`` file groups.
+SHAPES = {
+    'small-files': [(5000, 2 * 1024, 'text', 2)],
+    'huge-files': [(3, 32 * 1024 * 1024, 'binary', 1)],
+    'deep-tree': [(2000, 8 * 1024, 'text', 12)],
+    'mixed-media': [(500, 12 * 1024, 'text', 3),
+                    (300, 100 * 1024, 'binary', 2),
+                    (2, 16 * 1024 * 1024, 'binary', 1),
+                    (200, 1024, 'json', 2)],
+}
+
+#: Zip compression settings as ``(compression, compresslevel)``.
+ZIP_CONFIGS = {
+    'stored': (ZIP_STORED, None),
+    'deflate-1': (ZIP_DEFLATED, 1),
+    'deflate-6': (ZIP_DEFLATED, 6),
+    'deflate-9': (ZIP_DEFLATED, 9),
+}
+
+#: Cold storage codecs as ``(codec, level)``.
+COLD_CONFIGS = {
+    'xz-6': ('xz', 6),
+    'zst-3': ('zst', 3),
+    'zst-19': ('zst', 19),
+}
+
+OPERATIONS = ('archive', 'extract', 'patch-copy', 'patch-manage')
+
+
+def build_tree(path, shape, scale=1.0, seed=0):
+    """
+    Write the files of ``shape`` below ``path``, with file counts
+    multiplied by ``scale``.  A ``course_info.json`` is always included
+    so the tree can be patched like a course bundle.
+    """
+    generator = DataGenerator(seed)
+    os.makedirs(path)
+    with open(os.path.join(path, 'course_info.json'), 'w') as fp:
+        json.dump({'id': 'BENCH', 'startDate': '2020-01-13T06:00:00Z'}, fp)
+    for group, (count, size, kind, depth) in enumerate(SHAPES[shape]):
+        for i in range(max(1, int(count * scale))):
+            parts = ['g%s' % group] + ['d%s' % ((i // 10 + level) % 7)
+                                       for level in range(depth - 1)]
+            directory = os.path.join(path, *parts)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            if kind == 'binary':
+                data = generator.binary(size)
+            elif kind == 'json':
+                data = json.dumps({'text': generator.text(size)}).encode('utf-8')
+            else:
+                data = generator.text(size).encode('utf-8')
+            with open(os.path.join(directory, 'f%s.%s' % (i, kind)), 'wb') as fp:
+                fp.write(data)
+    return path
+
+
+def tree_size(path):
+    total = 0
+    files = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            total += os.path.getsize(os.path.join(root, name))
+            files += 1
+    return total, files
+
+
+def _peak_memory(func):
+    try:
+        import tracemalloc
+    except ImportError:  # pragma: no cover
+        return None
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(func, repeat=3, setup=None):
+    """
+    Call ``func`` ``repeat`` times (after ``setup`` each time) and return
+    the median wall and CPU seconds, the last result, and the peak
+    traced memory of one more call.
+    """
+    walls = []
+    cpus = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        cpu = os.times()
+        start = default_timer()
+        result = func()
+        walls.append(default_timer() - start)
+        end = os.times()
+        cpus.append((end[0] - cpu[0]) + (end[1] - cpu[1]))
+    if setup is not None:
+        setup()
+    memory = _peak_memory(func)
+    walls.sort()
+    cpus.sort()
+    return {
+        'median_seconds': walls[len(walls) // 2],
+        'min_seconds': walls[0],
+        'cpu_seconds': cpus[len(cpus) // 2],
+        'peak_memory': memory,
+    }, result
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _bench_shape(shape, work_dir, zip_configs, cold_configs, operations,
+                 repeat, scale):
+    from nti.deploymenttools.content.backup_course import _extract_archive
+    from nti.deploymenttools.content.copy_course import _update_course_archive as patch_copy
+    from nti.deploymenttools.content.manage_course import _update_course_archive as patch_manage
+    from nti.deploymenttools.content.cold_storage import write_cold_archive
+
+    source = build_tree(os.path.join(work_dir, 'tree'), shape, scale)
+    input_bytes, files = tree_size(source)
+    vendor_info = os.path.join(work_dir, 'vendor_info.json')
+    with open(vendor_info, 'w') as fp:
+        json.dump({'NTI': {'benchmark': True}}, fp)
+
+    results = []
+
+    def record(operation, config, stats, output_bytes):
+        stats.update({
+            'key': '%s/%s/%s' % (shape, operation, config),
+            'shape': shape,
+            'operation': operation,
+            'config': config,
+            'files': files,
+            'input_bytes': input_bytes,
+            'output_bytes': output_bytes,
+            'bytes_per_second': input_bytes / stats['median_seconds']
+                if stats['median_seconds'] else None,
+        })
+        logger.info('%s: %.3fs', stats['key'], stats['median_seconds'])
+        results.append(stats)
+
+    for config in sorted(zip_configs):
+        compression, level = ZIP_CONFIGS[config]
+        archive = os.path.join(work_dir, '%s.zip' % config)
+        if 'archive' in operations:
+            stats, _ = measure(lambda: archive_directory(source, archive,
+                                                         compression=compression,
+                                                         compresslevel=level),
+                               repeat, lambda: _remove(archive))
+            record('archive', config, stats, os.path.getsize(archive))
+        else:
+            archive_directory(source, archive, compression=compression,
+                              compresslevel=level)
+        if 'extract' in operations:
+            target = os.path.join(work_dir, 'extracted')
+            stats, _ = measure(lambda: _extract_archive(archive, target),
+                               repeat, lambda: _remove(target))
+            record('extract', config, stats, tree_size(target)[0])
+            _remove(target)
+        if 'patch-copy' in operations:
+            stats, patched = measure(lambda: patch_copy(archive, 'BENCH_COPY',
+                                                        '2021-01-11T06:00:00Z', None),
+                                     repeat)
+            record('patch-copy', config, stats, os.path.getsize(patched))
+            _remove(patched)
+        if 'patch-manage' in operations:
+            stats, patched = measure(lambda: patch_manage(archive, vendor_path=vendor_info),
+                                     repeat)
+            record('patch-manage', config, stats, os.path.getsize(patched))
+            _remove(patched)
+        _remove(archive)
+
+    if 'archive' in operations:
+        for config in sorted(cold_configs):
+            codec, level = COLD_CONFIGS[config]
+            archive = os.path.join(work_dir, 'cold.tar.' + codec)
+            try:
+                stats, _ = measure(lambda: write_cold_archive(source, archive, codec, level),
+                                   repeat, lambda: _remove(archive))
+            except ValueError as e:
+                logger.warning('Skipping %s: %s', config, e)
+                continue
+            record('archive', config, stats, os.path.getsize(archive))
+            _remove(archive)
+    return results
+
+
+def run_archive_benchmarks(shapes=None, zip_configs=None, cold_configs=None,
+                           operations=OPERATIONS, repeat=3, scale=1.0,
+                           work_dir=None):
+    """
+    Benchmark every operation and configuration for each of ``shapes``,
+    returning one result per combination.
+    """
+    shapes = shapes or sorted(SHAPES)
+    zip_configs = zip_configs if zip_configs is not None else sorted(ZIP_CONFIGS)
+    cold_configs = cold_configs if cold_configs is not None else sorted(COLD_CONFIGS)
+    root = work_dir or tempfile.mkdtemp(prefix='nti-archive-benchmark-')
+    results = []
+    try:
+        for shape in shapes:
+            shape_dir = os.path.join(root, shape)
+            os.makedirs(shape_dir)
+            try:
+                results.extend(_bench_shape(shape, shape_dir, zip_configs,
+                                            cold_configs, operations, repeat,
+                                            scale))
+            finally:
+                shutil.rmtree(shape_dir, True)
+    finally:
+        if work_dir is None:
+            shutil.rmtree(root, True)
+    return results
+
+
+def format_results(results):
+    lines = ['%-36s %9s %9s %11s %11s %12s %11s'
+             % ('Benchmark', 'Median s', 'CPU s', 'Input', 'Output',
+                'Throughput', 'Peak mem')]
+    for row in results:
+        rate = row['bytes_per_second']
+        lines.append('%-36s %9.3f %9.3f %11s %11s %12s %11s'
+                     % (row['key'], row['median_seconds'], row['cpu_seconds'],
+                        format_bytes(row['input_bytes']),
+                        format_bytes(row['output_bytes']),
+                        format_bytes(rate) + '/s' if rate else '-',
+                        format_bytes(row['peak_memory'])))
+    return '\n'.join(lines)
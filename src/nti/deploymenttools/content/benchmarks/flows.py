@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+The end-to-end flows the benchmark measures.
+
+Each flow runs the library code against a :mod:`fake dataserver
+<nti.deploymenttools.content.benchmarks.server>`.  The runner starts
+every flow in a fresh interpreter (``python -m`` this module with a
+JSON spec) so peak RSS is measured per flow; the result is printed as
+JSON on the last line of stdout.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sys
+import time
+import logging
+from timeit import default_timer
+
+import simplejson as json
+
+from nti.deploymenttools.content import import_course
+from nti.deploymenttools.content import set_url_scheme
+from nti.deploymenttools.content import configure_logging
+
+from nti.deploymenttools.content.benchmarks import peak_rss
+
+from nti.deploymenttools.content.journal import JobJournal
+
+from nti.deploymenttools.content.timing import TIMINGS
+
+logger = __import__('logging').getLogger(__name__)
+
+UA_STRING = 'NextThought Benchmark Utility'
+
+USERNAME = 'benchmark'
+
+PASSWORD = 'benchmark'
+
+#: Phases whose bytes went over the network.
+TRANSFER_PHASES = ('export', 'download', 'upload', 'import')
+
+
+def _check_job(job):
+    if job.status == 'failed':
+        raise RuntimeError(job.state.get('error'))
+
+
+def copy_flow(spec):
+    from nti.deploymenttools.content.copy_course import copy_course
+    params = {
+        'course_ntiid': spec['course'],
+        'source_host': spec['host'],
+        # A second name for the same server, so packages are copied too.
+        'dest_host': spec['alias'],
+        'username': USERNAME,
+        'site_library': spec['alias'],
+        'admin_level': 'DefaultAPIBenchmark',
+    }
+    job = JobJournal.create('copy_course', params,
+                            os.path.join(spec['work_dir'], 'jobs'))
+    copy_course(job=job, source_password=PASSWORD, dest_password=PASSWORD,
+                **params)
+    _check_job(job)
+
+
+def backup_flow(spec):
+    from nti.deploymenttools.content.backup_course import backup_course
+    params = {
+        'course_ntiid': spec['course'],
+        'source_host': spec['host'],
+        'username': USERNAME,
+        'output_dir': os.path.join(spec['work_dir'], 'output'),
+        'archive_format': spec.get('archive_format') or 'zip',
+    }
+    job = JobJournal.create('backup_course', params,
+                            os.path.join(spec['work_dir'], 'jobs'))
+    backup_course(job=job, password=PASSWORD, **params)
+    _check_job(job)
+
+
+def import_flow(spec):
+    import_course(spec['bundle'], spec['host'], USERNAME, PASSWORD,
+                  spec['host'], 'DefaultAPIBenchmark', None, UA_STRING)
+
+
+def render_flow(spec):
+    from nti.deploymenttools.content.remote_render import remote_render
+    remote_render(spec['host'], USERNAME, PASSWORD, spec['host'],
+                  spec['source'], spec.get('poll_interval', 0.1))
+
+
+FLOWS = {
+    'copy': copy_flow,
+    'backup': backup_flow,
+    'import': import_flow,
+    'render': render_flow,
+}
+
+
+def run_flow(spec):
+    """
+    Run the flow named in ``spec`` and return its measurements.
+    """
+    set_url_scheme('http')
+    TIMINGS.reset()
+    cpu = os.times()
+    start = default_timer()
+    FLOWS[spec['flow']](spec)
+    seconds = default_timer() - start
+    cpu_end = os.times()
+    phases = TIMINGS.summary()
+    moved = sum(row['bytes'] or 0 for row in phases
+                if row['phase'] in TRANSFER_PHASES)
+    return {
+        'flow': spec['flow'],
+        'finished': time.time(),
+        'seconds': seconds,
+        'cpu_seconds': (cpu_end[0] - cpu[0]) + (cpu_end[1] - cpu[1]),
+        'bytes': moved,
+        'bytes_per_second': moved / seconds if seconds else None,
+        'peak_rss': peak_rss(),
+        'phases': phases,
+    }
+
+
+def main():
+    configure_logging(level=logging.WARNING)
+    result = run_flow(json.loads(sys.argv[1]))
+    print(json.dumps(result))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
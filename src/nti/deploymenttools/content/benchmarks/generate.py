@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Synthetic course bundles, rendered content packages and render sources.
+
+The data is deterministic for a given seed.  Pages and metadata are
+compressible text, while images and other media are random bytes that
+deflate cannot shrink, mirroring real bundles.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import random
+import binascii
+from zipfile import ZipFile
+from zipfile import ZIP_DEFLATED
+
+import simplejson as json
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Dataset shapes. Sizes are in bytes; counts are per package.
+SIZES = {
+    'tiny': {
+        'assets': 10, 'asset_size': 8 * 1024,
+        'packages': 1, 'pages': 10, 'page_size': 4 * 1024,
+        'images': 5, 'image_size': 8 * 1024,
+    },
+    'small': {
+        'assets': 50, 'asset_size': 20 * 1024,
+        'packages': 2, 'pages': 100, 'page_size': 8 * 1024,
+        'images': 50, 'image_size': 30 * 1024,
+    },
+    'medium': {
+        'assets': 400, 'asset_size': 64 * 1024,
+        'packages': 3, 'pages': 600, 'page_size': 12 * 1024,
+        'images': 400, 'image_size': 80 * 1024,
+    },
+    'large': {
+        'assets': 2000, 'asset_size': 128 * 1024,
+        'packages': 5, 'pages': 2000, 'page_size': 16 * 1024,
+        'images': 1500, 'image_size': 160 * 1024,
+    },
+}
+
+WORDS = ('course', 'lesson', 'reading', 'assignment', 'discussion', 'the',
+         'of', 'and', 'student', 'history', 'science', 'analysis', 'video',
+         'chapter', 'section', 'figure', 'question', 'answer', 'review')
+
+#: Random bytes that media files are cut from.
+POOL_SIZE = 4 * 1024 * 1024
+
+
+class DataGenerator(object):
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        value = self.rng.getrandbits(8 * POOL_SIZE)
+        self.pool = binascii.unhexlify('%0*x' % (2 * POOL_SIZE, value))
+
+    def binary(self, size):
+        result = []
+        while size > 0:
+            length = min(size, POOL_SIZE)
+            start = self.rng.randint(0, POOL_SIZE - length)
+            result.append(self.pool[start:start + length])
+            size -= length
+        return b''.join(result)
+
+    def text(self, size):
+        words = []
+        length = 0
+        while length < size:
+            word = self.rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return ' '.join(words)[:size]
+
+    def html(self, title, size):
+        body = self.text(max(size - 100, 0))
+        return ('<html><head><title>%s</title></head><body><p>%s</p></body></html>'
+                % (title, body)).encode('utf-8')
+
+    def size(self, average):
+        return max(1, int(self.rng.uniform(0.5, 1.5) * average))
+
+
+def write_course_bundle(path, provider_id, packages, assets, asset_size,
+                        generator=None):
+    """
+    Write a course export bundle to ``path`` that references
+    ``packages`` and carries ``assets`` presentation assets.
+    """
+    generator = generator or DataGenerator()
+    course_info = {
+        'id': provider_id,
+        'title': 'Benchmark %s' % provider_id,
+        'startDate': '2020-01-13T06:00:00Z',
+        'endDate': '2020-05-08T05:00:00Z',
+    }
+    with ZipFile(path, 'w', ZIP_DEFLATED) as archive:
+        archive.writestr('course_info.json', json.dumps(course_info))
+        archive.writestr('bundle_meta_info.json',
+                         json.dumps({'ContentPackages': list(packages)}))
+        archive.writestr('dc_metadata.xml',
+                         '<metadata><dc:title>%s</dc:title></metadata>' % provider_id)
+        archive.writestr('vendor_info.json', json.dumps({'NTI': {}}))
+        archive.writestr('course_outline.xml', generator.text(16 * 1024))
+        for i in range(max(assets // 10, 1)):
+            archive.writestr('Discussions/discussion_%s.json' % i,
+                             json.dumps({'title': generator.text(40),
+                                         'body': [generator.text(2048)]}))
+        for i in range(assets):
+            archive.writestr('presentation-assets/webapp/v1/asset_%s.png' % i,
+                             generator.binary(generator.size(asset_size)))
+    return path
+
+
+def write_content_package(path, ntiid, pages, page_size, images, image_size,
+                          generator=None):
+    """
+    Write a rendered content package export to ``path``.
+    """
+    generator = generator or DataGenerator()
+    with ZipFile(path, 'w', ZIP_DEFLATED) as archive:
+        archive.writestr('index.html', generator.html(ntiid, page_size))
+        archive.writestr('eclipse-toc.xml',
+                         '<toc ntiid="%s">%s</toc>' % (ntiid, '<topic/>' * pages))
+        archive.writestr('styles/site.css', generator.text(8 * 1024))
+        archive.writestr('js/site.js', generator.text(32 * 1024))
+        for i in range(pages):
+            archive.writestr('page_%s.html' % i,
+                             generator.html('Page %s' % i, generator.size(page_size)))
+        for i in range(images):
+            archive.writestr('images/figure_%s.png' % i,
+                             generator.binary(generator.size(image_size)))
+    return path
+
+
+def write_render_source(path, pages, page_size, images, image_size,
+                        generator=None):
+    """
+    Write a LaTeX content source directory, including the kind of build
+    clutter the default ignore rules leave out, to ``path``.
+    """
+    generator = generator or DataGenerator()
+    for directory in ('images', '.git', 'chapters'):
+        os.makedirs(os.path.join(path, directory))
+    with open(os.path.join(path, 'benchmark.tex'), 'w') as fp:
+        fp.write('\\documentclass{book}\n\\begin{document}\n')
+        for i in range(pages):
+            fp.write('\\include{chapters/chapter_%s}\n' % i)
+        fp.write('\\end{document}\n')
+    for i in range(pages):
+        with open(os.path.join(path, 'chapters', 'chapter_%s.tex' % i), 'w') as fp:
+            fp.write(generator.text(generator.size(page_size)))
+    for i in range(images):
+        with open(os.path.join(path, 'images', 'figure_%s.png' % i), 'wb') as fp:
+            fp.write(generator.binary(generator.size(image_size)))
+    with open(os.path.join(path, 'benchmark.aux'), 'w') as fp:
+        fp.write(generator.text(4096))
+    with open(os.path.join(path, '.git', 'pack'), 'wb') as fp:
+        fp.write(generator.binary(256 * 1024))
+    return path
+
+
+def generate_dataset(root, size='small', seed=0):
+    """
+    Generate a course with its content packages and a render source
+    below ``root``, returning their NTIIDs and paths.
+    """
+    shape = SIZES[size]
+    generator = DataGenerator(seed)
+    provider_id = 'BENCH_%s' % size.upper()
+    course_ntiid = 'tag:nextthought.com,2011-10:NTI-CourseInfo-%s' % provider_id
+    packages = {}
+    for i in range(shape['packages']):
+        ntiid = 'tag:nextthought.com,2011-10:NTI-HTML-%s_%s' % (provider_id, i)
+        packages[ntiid] = write_content_package(
+            os.path.join(root, 'package_%s.zip' % i), ntiid, shape['pages'],
+            shape['page_size'], shape['images'], shape['image_size'], generator)
+    bundle = write_course_bundle(os.path.join(root, 'course.zip'), provider_id,
+                                 sorted(packages), shape['assets'],
+                                 shape['asset_size'], generator)
+    source = write_render_source(os.path.join(root, 'source'), shape['pages'],
+                                 shape['page_size'], shape['images'],
+                                 shape['image_size'], generator)
+    logger.debug('Generated %s dataset in %s', size, root)
+    return {
+        'size': size,
+        'course': course_ntiid,
+        'provider_id': provider_id,
+        'bundle': bundle,
+        'packages': packages,
+        'source': source,
+    }
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Command line front end of the benchmarks.
+
+``nti_benchmark e2e`` generates a synthetic dataset, serves it from a
+local fake dataserver with the requested latency and bandwidth, and runs
+the copy, backup, import and render-submit flows, reporting wall time,
+throughput and peak RSS per flow.  ``nti_benchmark archive`` runs the
+:mod:`archive microbenchmarks <nti.deploymenttools.content.benchmarks.archive>`
+and ``nti_benchmark startup`` times the
+:mod:`startup <nti.deploymenttools.content.benchmarks.startup>` of
+every console script.
+``--output`` saves the results with the environment they were taken in,
+and ``nti_benchmark compare OLD NEW`` shows how two such reports differ,
+so releases can be compared.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sys
+import codecs
+import shutil
+import logging
+import platform
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+
+import simplejson as json
+
+from nti.deploymenttools.content import configure_logging
+
+from nti.deploymenttools.content.benchmarks import archive
+from nti.deploymenttools.content.benchmarks import startup
+
+from nti.deploymenttools.content.benchmarks.generate import SIZES
+from nti.deploymenttools.content.benchmarks.generate import generate_dataset
+
+from nti.deploymenttools.content.benchmarks.server import FakeDataserver
+
+from nti.deploymenttools.content.cli import COMMANDS
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
+
+from nti.deploymenttools.content.timing import format_bytes
+
+logger = __import__('logging').getLogger(__name__)
+
+FLOW_ORDER = ('copy', 'backup', 'import', 'render')
+
+
+def environment():
+    try:
+        import pkg_resources
+        version = pkg_resources.get_distribution('nti.deploymenttools.content').version
+    except Exception:  # pylint: disable=broad-except
+        version = None
+    return {
+        'version': version,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+    }
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def run_child(spec):
+    """
+    Run one flow in a fresh interpreter and return its measurements.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(p for p in sys.path if p)
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'nti.deploymenttools.content.benchmarks.flows',
+         json.dumps(spec)], env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def summarize(flow, runs):
+    seconds = [run['seconds'] for run in runs]
+    median = _median(seconds)
+    moved = runs[0]['bytes']
+    rss = [run['peak_rss'] for run in runs if run['peak_rss']]
+    return {
+        'flow': flow,
+        'runs': len(runs),
+        'median_seconds': median,
+        'min_seconds': min(seconds),
+        'max_seconds': max(seconds),
+        'cpu_seconds': _median([run['cpu_seconds'] for run in runs]),
+        'bytes': moved,
+        'bytes_per_second': moved / median if median else None,
+        'peak_rss': max(rss) if rss else None,
+    }
+
+
+def run_e2e(flows=FLOW_ORDER, size='small', latency=0.0, bandwidth=None,
+            repeat=3, archive_format='zip', render_time=0.5, work_dir=None):
+    """
+    Run each of ``flows`` ``repeat`` times against a fake dataserver and
+    return the summary and individual runs of each.
+    """
+    root = work_dir or tempfile.mkdtemp(prefix='nti-benchmark-')
+    results = []
+    try:
+        logger.info('Generating %s dataset in %s', size, root)
+        data_dir = os.path.join(root, 'data')
+        os.makedirs(data_dir)
+        dataset = generate_dataset(data_dir, size)
+        server = FakeDataserver(latency=latency, bandwidth=bandwidth,
+                                render_time=render_time)
+        server.add_course(dataset['course'], dataset['bundle'],
+                          dataset['provider_id'], sorted(dataset['packages']))
+        for ntiid, path in dataset['packages'].items():
+            server.add_package(ntiid, path)
+        with server:
+            for flow in flows:
+                runs = []
+                for i in range(repeat):
+                    spec = {
+                        'flow': flow,
+                        'host': server.host,
+                        'alias': server.alias,
+                        'course': dataset['course'],
+                        'bundle': dataset['bundle'],
+                        'source': dataset['source'],
+                        'archive_format': archive_format,
+                        'work_dir': os.path.join(root, 'runs', '%s-%s' % (flow, i)),
+                    }
+                    os.makedirs(spec['work_dir'])
+                    runs.append(run_child(spec))
+                    shutil.rmtree(spec['work_dir'], True)
+                summary = summarize(flow, runs)
+                logger.info('%s: %.2fs median', flow, summary['median_seconds'])
+                results.append({'summary': summary, 'runs': runs})
+    finally:
+        if work_dir is None:
+            shutil.rmtree(root, True)
+    return results
+
+
+def format_e2e_results(results):
+    lines = ['%-8s %5s %10s %10s %12s %14s %12s'
+             % ('Flow', 'Runs', 'Median s', 'CPU s', 'Moved', 'Throughput', 'Peak RSS')]
+    for result in results:
+        row = result['summary']
+        rate = row['bytes_per_second']
+        lines.append('%-8s %5d %10.2f %10.2f %12s %14s %12s'
+                     % (row['flow'], row['runs'], row['median_seconds'],
+                        row['cpu_seconds'], format_bytes(row['bytes']),
+                        format_bytes(rate) + '/s' if rate else '-',
+                        format_bytes(row['peak_rss'])))
+    return '\n'.join(lines)
+
+
+def write_results(path, benchmark, results, options):
+    report = {
+        'benchmark': benchmark,
+        'environment': environment(),
+        'options': options,
+        'results': results,
+    }
+    with codecs.open(path, 'w', 'utf-8') as fp:
+        json.dump(report, fp, indent=2)
+
+
+def _medians(report):
+    result = {}
+    for row in report['results']:
+        if 'summary' in row:
+            row = dict(row['summary'], key=row['summary']['flow'])
+        result[row['key']] = row['median_seconds']
+    return result
+
+
+def compare_reports(old, new):
+    """
+    Return ``(key, old seconds, new seconds, relative change)`` for the
+    benchmarks in either report.
+    """
+    old_medians = _medians(old)
+    new_medians = _medians(new)
+    rows = []
+    for key in sorted(set(old_medians) | set(new_medians)):
+        before = old_medians.get(key)
+        after = new_medians.get(key)
+        change = (after - before) / before if before and after is not None else None
+        rows.append((key, before, after, change))
+    return rows
+
+
+def format_comparison(rows):
+    lines = ['%-36s %10s %10s %9s' % ('Benchmark', 'Old s', 'New s', 'Change')]
+    for key, before, after, change in rows:
+        lines.append('%-36s %10s %10s %9s'
+                     % (key,
+                        '-' if before is None else '%.3f' % before,
+                        '-' if after is None else '%.3f' % after,
+                        '-' if change is None else '%+.1f%%' % (change * 100)))
+    return '\n'.join(lines)
+
+
+def _load_report(path):
+    with codecs.open(path, 'r', 'utf-8') as fp:
+        return json.load(fp)
+
+
+def _parse_args():
+    arg_parser = ArgumentParser(description="NextThought Deployment Tools Benchmarks")
+    arg_parser.add_argument('-v', '--verbose', dest='loglevel',
+                            action='store_const', const=logging.DEBUG,
+                            help="Print debugging logs.")
+    arg_parser.add_argument('-q', '--quiet', dest='loglevel',
+                            action='store_const', const=logging.WARNING,
+                            help="Print warning and error logs only.")
+    subparsers = arg_parser.add_subparsers(dest='benchmark')
+    subparsers.required = True
+
+    e2e_parser = subparsers.add_parser('e2e',
+                                       description='End-to-end flows against a fake dataserver')
+    e2e_parser.add_argument('--flow', dest='flows', action='append',
+                            choices=FLOW_ORDER,
+                            help="Flow to run. May be repeated. Defaults to all.")
+    e2e_parser.add_argument('--size', dest='size', default='small',
+                            choices=sorted(SIZES),
+                            help="Dataset size. Defaults to small.")
+    e2e_parser.add_argument('--latency', dest='latency', type=float, default=0,
+                            help="Milliseconds the server waits before each response.")
+    e2e_parser.add_argument('--bandwidth', dest='bandwidth', type=float,
+                            help="Server bandwidth in MiB/s. Unlimited by default.")
+    e2e_parser.add_argument('--render-time', dest='render_time', type=float,
+                            default=0.5,
+                            help="Seconds each render job reports as running. Defaults to 0.5.")
+    e2e_parser.add_argument('-r', '--repeat', dest='repeat', type=int, default=3,
+                            help="Runs of each flow. Defaults to 3.")
+    e2e_parser.add_argument('--format', dest='archive_format', default='zip',
+                            help="Backup format for the backup flow. Defaults to zip.")
+    e2e_parser.add_argument('-o', '--output', dest='output',
+                            help="Write the results as JSON to this file.")
+    add_profile_arguments(e2e_parser)
+
+    archive_parser = subparsers.add_parser('archive',
+                                           description='Archive, extract and patch microbenchmarks')
+    archive_parser.add_argument('--shape', dest='shapes', action='append',
+                                choices=sorted(archive.SHAPES),
+                                help="Tree shape to run. May be repeated. Defaults to all.")
+    archive_parser.add_argument('--zip', dest='zip_configs', action='append',
+                                choices=sorted(archive.ZIP_CONFIGS),
+                                help="Zip compression setting. May be repeated. Defaults to all.")
+    archive_parser.add_argument('--cold', dest='cold_configs', action='append',
+                                choices=sorted(archive.COLD_CONFIGS),
+                                help="Cold storage codec. May be repeated. Defaults to all.")
+    archive_parser.add_argument('--no-cold', dest='no_cold', action='store_true',
+                                default=False,
+                                help="Skip the cold storage codecs.")
+    archive_parser.add_argument('--operation', dest='operations', action='append',
+                                choices=archive.OPERATIONS,
+                                help="Operation to run. May be repeated. Defaults to all.")
+    archive_parser.add_argument('--scale', dest='scale', type=float, default=1.0,
+                                help="Multiply the file counts of every shape. Defaults to 1.")
+    archive_parser.add_argument('-r', '--repeat', dest='repeat', type=int, default=3,
+                                help="Runs of each benchmark. Defaults to 3.")
+    archive_parser.add_argument('-o', '--output', dest='output',
+                                help="Write the results as JSON to this file.")
+    add_profile_arguments(archive_parser)
+
+    startup_parser = subparsers.add_parser('startup',
+                                           description='Console script startup time')
+    startup_parser.add_argument('--command', dest='commands', action='append',
+                                choices=sorted(COMMANDS),
+                                help="Command to time. May be repeated. Defaults to all.")
+    startup_parser.add_argument('-r', '--repeat', dest='repeat', type=int, default=5,
+                                help="Runs of each command. Defaults to 5.")
+    startup_parser.add_argument('-o', '--output', dest='output',
+                                help="Write the results as JSON to this file.")
+    add_profile_arguments(startup_parser)
+
+    compare_parser = subparsers.add_parser('compare',
+                                           description='Compare two benchmark reports')
+    compare_parser.add_argument('old', help="Baseline report.")
+    compare_parser.add_argument('new', help="Report to compare with the baseline.")
+    return arg_parser.parse_args()
+
+
+@profile_main
+def main():
+    args = _parse_args()
+
+    loglevel = args.loglevel or logging.INFO
+    configure_logging(level=loglevel)
+
+    if args.benchmark == 'compare':
+        rows = compare_reports(_load_report(args.old), _load_report(args.new))
+        print(format_comparison(rows))
+        return
+
+    if args.benchmark == 'archive':
+        options = {
+            'shapes': args.shapes,
+            'zip_configs': args.zip_configs,
+            'cold_configs': [] if args.no_cold else args.cold_configs,
+            'operations': args.operations or archive.OPERATIONS,
+            'repeat': args.repeat,
+            'scale': args.scale,
+        }
+        results = archive.run_archive_benchmarks(**options)
+        print(archive.format_results(results))
+    elif args.benchmark == 'startup':
+        options = {
+            'commands': args.commands,
+            'repeat': args.repeat,
+        }
+        results = startup.run_startup_benchmarks(**options)
+        print(startup.format_results(results))
+    else:
+        options = {
+            'flows': args.flows or list(FLOW_ORDER),
+            'size': args.size,
+            'latency': args.latency / 1000,
+            'bandwidth': args.bandwidth * 1024 * 1024 if args.bandwidth else None,
+            'repeat': args.repeat,
+            'archive_format': args.archive_format,
+            'render_time': args.render_time,
+        }
+        results = run_e2e(**options)
+        print(format_e2e_results(results))
+    if args.output:
+        write_results(args.output, args.benchmark, results, options)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
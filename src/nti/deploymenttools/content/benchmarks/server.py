@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A local stand-in for the dataserver endpoints the tools use.
+
+It logs on with a session cookie, serves course info, the course
+catalog, the content library and exports from registered archives,
+accepts course, restore and rendered content imports, and runs fake
+render jobs that report ``Running`` for a while before succeeding.
+Every response can be delayed by ``latency`` seconds and request and
+response bodies are throttled to ``bandwidth`` bytes per second.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import re
+import time
+import uuid
+import threading
+
+import simplejson as json
+
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+from six.moves.urllib.parse import unquote
+from six.moves.urllib.parse import urlparse
+
+logger = __import__('logging').getLogger(__name__)
+
+BLOCK_SIZE = 64 * 1024
+
+SESSION_COOKIE = 'nti.auth_tkt'
+
+_FILENAME = re.compile(br'filename="([^"]+)"')
+
+_PROVIDER_ID = re.compile(br'name="key"\r\n\r\n([^\r]*)\r\n')
+
+_SESSION_TICKET = re.compile(r'(?:^|;)\s*%s=([^;]+)' % re.escape(SESSION_COOKIE))
+
+
+class _Throttle(object):
+
+    def __init__(self, bandwidth):
+        self.bandwidth = bandwidth
+        self.start = time.time()
+        self.sent = 0
+
+    def __call__(self, size):
+        if not self.bandwidth:
+            return
+        self.sent += size
+        delay = self.sent / self.bandwidth - (time.time() - self.start)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class DataserverHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.dataserver.count('connections', 1)
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt, *args)
+
+    @property
+    def dataserver(self):
+        return self.server.dataserver
+
+    def _path(self):
+        return unquote(urlparse(self.path).path)
+
+    def _read_body(self):
+        throttle = _Throttle(self.dataserver.bandwidth)
+        head = b''
+        received = 0
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                remaining = size
+                while remaining:
+                    data = self.rfile.read(min(remaining, BLOCK_SIZE))
+                    remaining -= len(data)
+                    if len(head) < BLOCK_SIZE:
+                        head += data[:BLOCK_SIZE]
+                    throttle(len(data))
+                received += size
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get('Content-Length') or 0)
+            while remaining:
+                data = self.rfile.read(min(remaining, BLOCK_SIZE))
+                if not data:
+                    break
+                remaining -= len(data)
+                received += len(data)
+                if len(head) < BLOCK_SIZE:
+                    head += data[:BLOCK_SIZE]
+                throttle(len(data))
+        self.dataserver.count('received', received)
+        return head
+
+    def _send_json(self, value, status=200, headers=()):
+        body = json.dumps(value).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, header in headers:
+            self.send_header(name, header)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status):
+        self._send_json({'message': self.responses[status][0]}, status)
+
+    def _send_file(self, path, head=False):
+        size = os.path.getsize(path)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        if head:
+            return
+        throttle = _Throttle(self.dataserver.bandwidth)
+        with open(path, 'rb') as fp:
+            while True:
+                data = fp.read(BLOCK_SIZE)
+                if not data:
+                    break
+                self.wfile.write(data)
+                throttle(len(data))
+        self.dataserver.count('sent', size)
+
+    def _authenticated(self):
+        match = _SESSION_TICKET.search(self.headers.get('Cookie') or '')
+        if match is not None and match.group(1) in self.dataserver.tickets:
+            return True
+        return bool(self.headers.get('Authorization'))
+
+    def _dispatch(self, method):
+        time.sleep(self.dataserver.latency)
+        self.dataserver.count('requests', 1)
+        path = self._path()
+        body = self._read_body() if method == 'POST' else b''
+        if path.endswith('/logon.nti'):
+            if not self.headers.get('Authorization'):
+                return self._send_error(401)
+            ticket = uuid.uuid4().hex
+            self.dataserver.tickets.add(ticket)
+            cookie = '%s=%s; Path=/' % (SESSION_COOKIE, ticket)
+            return self._send_json({}, headers=[('Set-Cookie', cookie)])
+        if not self._authenticated():
+            return self._send_error(401)
+        return self.dataserver.route(self, method, path, body)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_HEAD(self):
+        self._dispatch('HEAD')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeDataserver(object):
+    """
+    Serve the registered courses and packages on ``127.0.0.1``.  Use as
+    a context manager or call :meth:`start` and :meth:`stop`.
+    """
+
+    def __init__(self, latency=0.0, bandwidth=None, render_time=0.5, port=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.render_time = render_time
+        self.objects = {}
+        self.jobs = {}
+        self.stats = {}
+        self.tickets = set()
+        self.lock = threading.Lock()
+        self.httpd = _ThreadingHTTPServer(('127.0.0.1', port), DataserverHandler)
+        self.httpd.dataserver = self
+        self.thread = None
+
+    @property
+    def host(self):
+        return '127.0.0.1:%s' % self.httpd.server_address[1]
+
+    @property
+    def alias(self):
+        """
+        A second host name for the same server, for copies that must not
+        look like they stay on one host.
+        """
+        return 'localhost:%s' % self.httpd.server_address[1]
+
+    def count(self, name, value):
+        with self.lock:
+            self.stats[name] = self.stats.get(name, 0) + value
+
+    def add_course(self, ntiid, archive, provider_id, packages=(),
+                   admin_level='DefaultAPIBenchmark', title=None, modified=None):
+        self.objects[ntiid] = {
+            'archive': archive,
+            'info': {
+                'NTIID': ntiid,
+                'AdminLevel': admin_level,
+                'ProviderUniqueID': provider_id,
+                'title': title or provider_id,
+                'ContentPackages': list(packages),
+                'Last Modified': modified or time.time(),
+            },
+        }
+
+    def touch(self, ntiid):
+        """
+        Mark the course ``ntiid`` as modified now.
+        """
+        self.objects[ntiid]['info']['Last Modified'] = time.time()
+
+    def add_package(self, ntiid, archive, modified=None):
+        self.objects[ntiid] = {'archive': archive, 'info': {
+            'NTIID': ntiid,
+            'Last Modified': modified or time.time(),
+        }}
+
+    def route(self, handler, method, path, body):
+        parts = [p for p in path.split('/') if p]
+        if parts[:2] == ['dataserver2', 'Objects'] and len(parts) >= 3:
+            item = self.objects.get(parts[2])
+            if item is None:
+                return handler._send_error(404)
+            view = parts[3] if len(parts) > 3 else None
+            if view is None and method == 'GET':
+                return handler._send_json(item['info'])
+            if view == '@@Export' and method in ('GET', 'HEAD'):
+                if method == 'GET':
+                    self.count('Export', 1)
+                return handler._send_file(item['archive'], method == 'HEAD')
+            if view == '@@Import' and method == 'POST':
+                self.count('Import', 1)
+                return handler._send_json({'Course': {'NTIID': parts[2]}})
+        elif parts[:2] == ['dataserver2', 'users'] and parts[3:] == ['Courses', 'AllCourses']:
+            return handler._send_json({'Items': [
+                {'CourseNTIID': ntiid,
+                 'ProviderUniqueID': item['info']['ProviderUniqueID'],
+                 'Last Modified': item['info']['Last Modified']}
+                for ntiid, item in sorted(self.objects.items())
+                if 'AdminLevel' in item['info']]})
+        elif parts[:2] == ['dataserver2', 'users'] and parts[3:] == ['Library', 'Main']:
+            return handler._send_json({'titles': [
+                item['info'] for _, item in sorted(self.objects.items())
+                if 'AdminLevel' not in item['info']]})
+        elif path == '/dataserver2/CourseAdmin/@@ImportCourse' and method == 'POST':
+            self.count('ImportCourse', 1)
+            ntiid = 'tag:nextthought.com,2011-10:NTI-CourseInfo-%s' % uuid.uuid4().hex
+            match = _PROVIDER_ID.search(body)
+            return handler._send_json({'Course': {
+                'NTIID': ntiid,
+                'ProviderUniqueID': match.group(1).decode('utf-8') if match else None}})
+        elif path == '/dataserver2/Library/@@ImportRenderedContent' and method == 'POST':
+            self.count('ImportRenderedContent', 1)
+            ntiid = 'tag:nextthought.com,2011-10:NTI-HTML-%s' % uuid.uuid4().hex
+            return handler._send_json({'Items': {ntiid: {'NTIID': ntiid}}})
+        elif path == '/dataserver2/Library/@@RenderContentSource' and method == 'POST':
+            return self._submit_render(handler, body)
+        elif parts[:3] == ['dataserver2', 'Library', 'jobs'] and len(parts) == 5:
+            return self._render_status(handler, parts[3], parts[4])
+        return handler._send_error(404)
+
+    def _submit_render(self, handler, body):
+        match = _FILENAME.search(body)
+        if match is None:
+            return handler._send_error(422)
+        filename = match.group(1).decode('utf-8')
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.jobs[job_id] = time.time() + self.render_time
+        href = '/dataserver2/Library/jobs/%s/' % job_id
+        return handler._send_json({'Items': {filename: {
+            'JobId': job_id,
+            'Links': [{'rel': 'status', 'href': href + 'status'},
+                      {'rel': 'error', 'href': href + 'error'}],
+        }}})
+
+    def _render_status(self, handler, job_id, view):
+        done = self.jobs.get(job_id)
+        if done is None:
+            return handler._send_error(404)
+        if view == 'error':
+            return handler._send_json({'message': 'No error'})
+        status = 'Success' if time.time() >= done else 'Running'
+        return handler._send_json({'status': status})
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       name='FakeDataserver')
+        self.thread.daemon = True
+        self.thread.start()
+        logger.debug('Fake dataserver listening on %s', self.host)
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *unused):
+        self.stop()
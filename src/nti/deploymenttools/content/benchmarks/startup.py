@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Console script startup time.
+
+Each tool is run as ``nti_content <command> --help`` in a fresh
+interpreter, which is all the work a mistyped option or a ``--help``
+costs.  The median wall time is reported next to the bare interpreter
+startup, along with whether the heavy dependencies (:mod:`requests`,
+:mod:`zope.exceptions`, :mod:`nti.contentrendering`) got imported.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sys
+import subprocess
+from timeit import default_timer
+
+import simplejson as json
+
+from nti.deploymenttools.content.cli import COMMANDS
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Modules a tool should not need just to print its help.
+HEAVY_MODULES = ('requests', 'zope.exceptions', 'nti.contentrendering')
+
+_PROBE = """\
+import sys, json
+sys.argv = ['nti_content'] + %r
+try:
+    from nti.deploymenttools.content.cli import main
+    main()
+except SystemExit:
+    pass
+sys.stdout.write('\\n' + json.dumps(sorted(m for m in %r if m in sys.modules)))
+"""
+
+
+def _environment():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(p for p in sys.path if p)
+    return env
+
+
+def _time(args, env):
+    start = default_timer()
+    output = subprocess.check_output([sys.executable] + args, env=env,
+                                     stderr=subprocess.STDOUT)
+    return default_timer() - start, output
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def run_startup_benchmarks(commands=None, repeat=5):
+    """
+    Time ``--help`` of each of ``commands`` (default: all tools) and of
+    a bare interpreter, returning one result per command.
+    """
+    env = _environment()
+    results = []
+    baseline = _median([_time(['-c', 'pass'], env)[0] for _ in range(repeat)])
+    results.append({'key': 'startup/python', 'command': None,
+                    'median_seconds': baseline, 'overhead_seconds': 0.0,
+                    'heavy_modules': []})
+    for command in commands or sorted(COMMANDS):
+        seconds = []
+        loaded = []
+        for _ in range(repeat):
+            elapsed, output = _time(['-c', _PROBE % ([command, '--help'],
+                                                     HEAVY_MODULES)], env)
+            seconds.append(elapsed)
+            loaded = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        median = _median(seconds)
+        logger.info('%s: %.3fs', command, median)
+        results.append({
+            'key': 'startup/%s' % command,
+            'command': command,
+            'median_seconds': median,
+            'overhead_seconds': median - baseline,
+            'heavy_modules': loaded,
+        })
+    return results
+
+
+def format_results(results):
+    lines = ['%-30s %9s %10s  %s' % ('Command', 'Median s', 'Overhead', 'Heavy imports')]
+    for row in results:
+        lines.append('%-30s %9.3f %10.3f  %s'
+                     % (row['command'] or '(python)', row['median_seconds'],
+                        row['overhead_seconds'],
+                        ', '.join(row['heavy_modules']) or '-'))
+    return '\n'.join(lines)
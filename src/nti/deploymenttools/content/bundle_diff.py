@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare two course bundles or zip backups.
+
+The members of both archives are matched by name and compared by size
+and CRC32 from their central directories, which costs no
+decompression at all.  Only members whose CRCs differ are read: the
+JSON files that describe a course (:data:`JSON_MEMBERS`) are compared
+key by key, and with ``--patch`` other text members get a unified
+diff.  A member that was removed under one name and added under another
+with the same size and CRC is reported as moved.
+
+The exit status is 0 when the archives match and 1 when they differ,
+as with :command:`diff`.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import difflib
+import logging
+from zipfile import ZipFile
+from argparse import ArgumentParser
+
+import simplejson as json
+
+from nti.deploymenttools.content import MANIFEST_NAME
+from nti.deploymenttools.content import configure_logging
+
+from nti.deploymenttools.content.timing import format_bytes
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Members compared key by key rather than line by line, by basename.
+JSON_MEMBERS = ('course_info.json', 'bundle_meta_info.json')
+
+#: Text members larger than this are not given a unified diff.
+MAX_PATCH_SIZE = 1024 * 1024
+
+_MISSING = object()
+
+
+def _members(archive):
+    return dict((info.filename, info) for info in archive.infolist()
+                if not info.filename.endswith('/')
+                and info.filename != MANIFEST_NAME)
+
+
+def diff_json(old, new, path=''):
+    """
+    Return ``(path, old, new)`` for every value that differs between
+    the decoded JSON documents ``old`` and ``new``.  Paths join object
+    keys and list indexes with dots; a value missing on one side is
+    None there.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        result = []
+        for key in sorted(set(old) | set(new)):
+            child = '%s.%s' % (path, key) if path else key
+            result.extend(diff_json(old.get(key, _MISSING),
+                                    new.get(key, _MISSING), child))
+        return result
+    if isinstance(old, list) and isinstance(new, list):
+        result = []
+        for i in range(max(len(old), len(new))):
+            child = '%s.%s' % (path, i) if path else str(i)
+            result.extend(diff_json(old[i] if i < len(old) else _MISSING,
+                                    new[i] if i < len(new) else _MISSING,
+                                    child))
+        return result
+    if old == new:
+        return []
+    return [(path, None if old is _MISSING else old,
+             None if new is _MISSING else new)]
+
+
+def _text_patch(name, old, new):
+    try:
+        old_lines = old.decode('utf-8').splitlines(True)
+        new_lines = new.decode('utf-8').splitlines(True)
+    except UnicodeDecodeError:
+        return None
+    return ''.join(difflib.unified_diff(old_lines, new_lines,
+                                        'a/' + name, 'b/' + name))
+
+
+def diff_archives(left, right, patch=False):
+    """
+    Compare the zip archives ``left`` and ``right``.
+
+    Returns a dict of sorted member names under ``added``, ``removed``,
+    ``changed`` and ``unchanged``, ``(old, new)`` name pairs under
+    ``moved``, and under ``details`` the :func:`diff_json` result (or,
+    with ``patch``, a unified diff) of each changed member that has one.
+    """
+    with ZipFile(left) as old_zip, ZipFile(right) as new_zip:
+        old_members = _members(old_zip)
+        new_members = _members(new_zip)
+        changed, unchanged = [], []
+        for name in set(old_members) & set(new_members):
+            old, new = old_members[name], new_members[name]
+            if old.file_size != new.file_size or old.CRC != new.CRC:
+                changed.append(name)
+            else:
+                unchanged.append(name)
+        removed = set(old_members) - set(new_members)
+        added = set(new_members) - set(old_members)
+
+        moved = []
+        by_content = dict(((new_members[name].file_size, new_members[name].CRC), name)
+                          for name in sorted(added, reverse=True))
+        for name in sorted(removed):
+            info = old_members[name]
+            target = by_content.pop((info.file_size, info.CRC), None)
+            if target is not None:
+                moved.append((name, target))
+        removed -= set(old for old, _ in moved)
+        added -= set(new for _, new in moved)
+
+        details = {}
+        for name in changed:
+            if os.path.basename(name) in JSON_MEMBERS:
+                logger.debug('Comparing %s', name)
+                try:
+                    details[name] = diff_json(json.loads(old_zip.read(name)),
+                                              json.loads(new_zip.read(name)))
+                except ValueError as e:
+                    logger.warning('Unable to compare %s: %s', name, e)
+            elif patch and max(old_members[name].file_size,
+                               new_members[name].file_size) <= MAX_PATCH_SIZE:
+                text = _text_patch(name, old_zip.read(name), new_zip.read(name))
+                if text is not None:
+                    details[name] = text
+    return {
+        'added': sorted(added),
+        'removed': sorted(removed),
+        'changed': sorted(changed),
+        'unchanged': sorted(unchanged),
+        'moved': moved,
+        'details': details,
+        'sizes': dict((name, [old_members[name].file_size,
+                              new_members[name].file_size])
+                      for name in changed),
+    }
+
+
+def is_different(result):
+    return any(result[key] for key in ('added', 'removed', 'changed', 'moved'))
+
+
+def format_diff(result):
+    lines = []
+    for name in result['removed']:
+        lines.append('- %s' % name)
+    for name in result['added']:
+        lines.append('+ %s' % name)
+    for old, new in result['moved']:
+        lines.append('> %s -> %s' % (old, new))
+    for name in result['changed']:
+        old_size, new_size = result['sizes'][name]
+        lines.append('M %s (%s -> %s)' % (name, format_bytes(old_size),
+                                          format_bytes(new_size)))
+        detail = result['details'].get(name)
+        if isinstance(detail, list):
+            for path, old, new in detail:
+                lines.append('    %s: %s -> %s' % (path or '.', json.dumps(old),
+                                                   json.dumps(new)))
+        elif detail:
+            lines.extend('    ' + line for line in detail.splitlines())
+    lines.append('%s added, %s removed, %s moved, %s changed, %s unchanged.'
+                 % (len(result['added']), len(result['removed']),
+                    len(result['moved']), len(result['changed']),
+                    len(result['unchanged'])))
+    return '\n'.join(lines)
+
+
+def _parse_args():
+    arg_parser = ArgumentParser(description="NextThought Bundle Diff Utility")
+    arg_parser.add_argument('left', help="Original course bundle or zip backup.")
+    arg_parser.add_argument('right', help="Course bundle or zip backup to compare it with.")
+    arg_parser.add_argument('-p', '--patch', dest='patch', action='store_true',
+                            default=False,
+                            help="Show a unified diff of changed text members.")
+    arg_parser.add_argument('--json', dest='json', action='store_true',
+                            default=False,
+                            help="Print the differences as JSON.")
+    arg_parser.add_argument('-v', '--verbose', dest='loglevel',
+                            action='store_const', const=logging.DEBUG,
+                            help="Print debugging logs.")
+    arg_parser.add_argument('-q', '--quiet', dest='loglevel',
+                            action='store_const', const=logging.WARNING,
+                            help="Print warning and error logs only.")
+    add_profile_arguments(arg_parser)
+    return arg_parser.parse_args()
+
+
+@profile_main
+def main():
+    args = _parse_args()
+
+    loglevel = args.loglevel or logging.WARNING
+    configure_logging(level=loglevel)
+
+    result = diff_archives(os.path.expanduser(args.left),
+                           os.path.expanduser(args.right), args.patch)
+    if args.json:
+        result.pop('unchanged')
+        print(json.dumps(result, indent=1, sort_keys=True))
+    else:
+        print(format_diff(result))
+    if is_different(result):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
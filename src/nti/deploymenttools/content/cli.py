@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+``nti_content``, a single front end for the console scripts.
+
+``nti_content copy-course ...`` behaves exactly like ``nti_copy_course
+...``.  Only the module of the chosen tool is imported, so listing the
+tools or asking one of them for ``--help`` stays fast however many
+tools there are.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import sys
+import importlib
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Tool name to ``(module:function, description)``.
+COMMANDS = {
+    'backup-course': ('nti.deploymenttools.content.backup_course_bundle:main',
+                      "Export a course bundle."),
+    'backup-full-course': ('nti.deploymenttools.content.backup_course:main',
+                           "Back up a course with its content packages."),
+    'backup-scheduler': ('nti.deploymenttools.content.scheduler:main',
+                         "Plan and run backups from a policy file."),
+    'batch-course-bundle': ('nti.deploymenttools.content.batch_course_bundle:main',
+                            "Import or restore many course bundles."),
+    'benchmark': ('nti.deploymenttools.content.benchmarks.run:main',
+                  "Run the benchmarks."),
+    'cold-storage': ('nti.deploymenttools.content.cold_storage:main',
+                     "List and extract cold storage archives."),
+    'copy-content-package': ('nti.deploymenttools.content.copy_content_package:main',
+                             "Copy a rendered content package between servers."),
+    'copy-course': ('nti.deploymenttools.content.copy_course:main',
+                    "Copy a course between servers."),
+    'diff': ('nti.deploymenttools.content.bundle_diff:main',
+             "Compare two course bundles or zip backups."),
+    'import-course': ('nti.deploymenttools.content.import_course_bundle:main',
+                      "Import a course bundle."),
+    'manage-course': ('nti.deploymenttools.content.manage_course:main',
+                      "Update course metadata, discussions, assets and vendor info."),
+    'mirror-site': ('nti.deploymenttools.content.mirror:main',
+                    "Copy what changed in a site library to another server."),
+    'remote-render': ('nti.deploymenttools.content.remote_render:main',
+                      "Render content on a dataserver."),
+    'render-content': ('nti.deploymenttools.content.render:main',
+                       "Render content locally and upload it."),
+    'restore-course': ('nti.deploymenttools.content.restore_course_bundle:main',
+                       "Restore a course from a bundle or cold archive."),
+    'worker': ('nti.deploymenttools.content.worker:main',
+               "Queue jobs and run them in a long-running worker."),
+}
+
+PROG = 'nti_content'
+
+
+def usage():
+    lines = ['usage: %s <command> [options]' % PROG, '',
+             'NextThought Deployment Tools', '', 'commands:']
+    for name in sorted(COMMANDS):
+        lines.append('  %-22s %s' % (name, COMMANDS[name][1]))
+    lines.extend(['', "Run '%s <command> --help' for the options of a command." % PROG])
+    return '\n'.join(lines)
+
+
+def load_command(name):
+    """
+    Import and return the ``main`` of the tool ``name``.  Underscores
+    may be used in place of dashes.
+    """
+    target = COMMANDS[name.replace('_', '-')][0]
+    module, function = target.split(':')
+    return getattr(importlib.import_module(module), function)
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0 if argv else 2
+    name = argv.pop(0)
+    try:
+        command = load_command(name)
+    except KeyError:
+        print("%s: unknown command '%s'\n" % (PROG, name), file=sys.stderr)
+        print(usage(), file=sys.stderr)
+        return 2
+    # The tools parse sys.argv themselves.
+    sys.argv = ['%s %s' % (PROG, name)] + argv
+    return command()
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
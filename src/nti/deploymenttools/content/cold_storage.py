@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compressed tar containers for cold storage backups.
+
+The tar stream is cut into frames of ``frame_size`` uncompressed bytes
+that are compressed independently, in parallel, with xz or zstd and
+written back to back.  The result is an ordinary ``.tar.xz`` or
+``.tar.zst`` that the stock command line tools can read.  Each unit (a
+course or content package directory) starts on a new frame, and a
+sidecar ``<archive>.idx.json`` records where every frame, unit and
+member lives, so one unit or file can be restored by decompressing only
+the frames that hold it.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import bisect
+import codecs
+import calendar
+import shutil
+import logging
+import tarfile
+import tempfile
+from collections import deque
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+import simplejson as json
+
+from nti.deploymenttools.content import ArchiveManifest
+from nti.deploymenttools.content import archive_directory
+from nti.deploymenttools.content import configure_logging
+from nti.deploymenttools.content import deterministic_mode
+from nti.deploymenttools.content import DETERMINISTIC_DATE_TIME
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
+
+from nti.deploymenttools.content.timing import span
+
+logger = __import__('logging').getLogger(__name__)
+
+INDEX_VERSION = 1
+
+INDEX_SUFFIX = '.idx.json'
+
+DEFAULT_FRAME_SIZE = 16 * 1024 * 1024
+
+#: Backup formats and the extension of the files they produce.
+FORMATS = {
+    'zip': '.zip',
+    'tar.xz': '.tar.xz',
+    'tar.zst': '.tar.zst',
+}
+
+DEFAULT_LEVELS = {
+    'xz': 6,
+    'zst': 19,
+}
+
+
+def _default_threads():
+    try:
+        return os.cpu_count() or 1
+    except AttributeError:  # pragma: no cover
+        import multiprocessing
+        return multiprocessing.cpu_count()
+
+
+def _xz_codec(level):
+    try:
+        import lzma
+    except ImportError:  # pragma: no cover
+        try:
+            from backports import lzma
+        except ImportError:
+            raise ValueError("The tar.xz format requires the backports.lzma "
+                             "package on Python 2")
+
+    def compress(data):
+        return lzma.compress(data, format=lzma.FORMAT_XZ, preset=level)
+
+    return compress, lzma.decompress
+
+
+def _zst_codec(level):
+    try:
+        import zstandard
+    except ImportError:  # pragma: no cover
+        raise ValueError("The tar.zst format requires the zstandard package")
+
+    # Compressor objects are not thread safe, so each frame gets its own.
+    def compress(data):
+        return zstandard.ZstdCompressor(level=level).compress(data)
+
+    def decompress(data):
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    return compress, decompress
+
+
+_CODECS = {
+    'xz': _xz_codec,
+    'zst': _zst_codec,
+}
+
+
+def get_codec(name, level=None):
+    """
+    Return the ``(compress, decompress)`` functions of codec ``name``.
+    """
+    if name not in _CODECS:
+        raise ValueError("Unknown codec %s" % name)
+    if level is None:
+        level = DEFAULT_LEVELS[name]
+    return _CODECS[name](level)
+
+
+def codec_for_format(archive_format):
+    if archive_format not in FORMATS or archive_format == 'zip':
+        raise ValueError("Not a cold storage format: %s" % archive_format)
+    return archive_format.split('.', 1)[1]
+
+
+def is_cold_archive(path):
+    return path.endswith(FORMATS['tar.xz']) or path.endswith(FORMATS['tar.zst'])
+
+
+def index_path(archive_path):
+    return archive_path + INDEX_SUFFIX
+
+
+class FrameWriter(object):
+    """
+    File-like sink for :mod:`tarfile` that compresses its input in
+    independent frames on a pool of threads and writes them in order.
+    """
+
+    def __init__(self, fp, compress, frame_size=DEFAULT_FRAME_SIZE,
+                 threads=None):
+        self.fp = fp
+        self.compress = compress
+        self.frame_size = frame_size
+        self.threads = threads or _default_threads()
+        self.executor = ThreadPoolExecutor(max_workers=self.threads)
+        self.buffer = bytearray()
+        self.pending = deque()
+        self.frames = []
+        self.offset = 0
+        self.frame_offset = 0
+        self.compressed_offset = 0
+
+    def tell(self):
+        return self.offset
+
+    def write(self, data):
+        self.buffer.extend(data)
+        self.offset += len(data)
+        while len(self.buffer) >= self.frame_size:
+            chunk = bytes(self.buffer[:self.frame_size])
+            del self.buffer[:self.frame_size]
+            self._submit(chunk)
+        return len(data)
+
+    def cut(self):
+        """
+        End the current frame so the next write starts a new one.
+        """
+        if self.buffer:
+            chunk = bytes(self.buffer)
+            self.buffer = bytearray()
+            self._submit(chunk)
+
+    def _submit(self, chunk):
+        future = self.executor.submit(self.compress, chunk)
+        self.pending.append((self.frame_offset, len(chunk), future))
+        self.frame_offset += len(chunk)
+        # Bound memory by keeping a couple of frames per thread in flight.
+        while len(self.pending) > self.threads * 2:
+            self._drain()
+
+    def _drain(self):
+        offset, size, future = self.pending.popleft()
+        data = future.result()
+        self.fp.write(data)
+        self.frames.append([offset, size, self.compressed_offset, len(data)])
+        self.compressed_offset += len(data)
+
+    def close(self):
+        try:
+            self.cut()
+            while self.pending:
+                self._drain()
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+def _unit_of(name, units):
+    for unit in units:
+        if name == unit or name.startswith(unit + '/'):
+            return unit
+    return name.split('/', 1)[0] if '/' in name else ''
+
+
+def _collect_files(source_path, units):
+    base_path = source_path + os.sep
+    result = []
+    for root, dirs, files in os.walk(source_path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            archive_name = file_path.replace(base_path, '', 1).replace(os.sep, '/')
+            result.append((_unit_of(archive_name, units), archive_name, file_path))
+    # Keep each unit contiguous so it occupies its own run of frames.
+    result.sort(key=lambda item: item[0])
+    return result
+
+
+def _add_member(tar, file_path, archive_name, deterministic=False,
+                manifest=None):
+    if not deterministic and manifest is None:
+        tar.add(file_path, archive_name, recursive=False)
+        return
+    tarinfo = tar.gettarinfo(file_path, archive_name)
+    if deterministic:
+        tarinfo.mtime = calendar.timegm(DETERMINISTIC_DATE_TIME + (0, 0, 0))
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = ''
+    if not tarinfo.isreg():
+        tar.addfile(tarinfo)
+        return
+    if deterministic:
+        tarinfo.mode = deterministic_mode(file_path)
+    with open(file_path, 'rb') as fp:
+        source = fp if manifest is None else manifest.reader(archive_name, fp)
+        tar.addfile(tarinfo, source)
+    if manifest is not None:
+        source.finish()
+
+
+def write_cold_archive(source_path, archive_path, codec='zst', level=None,
+                       units=(), frame_size=DEFAULT_FRAME_SIZE, threads=None,
+                       deterministic=False, manifest=False):
+    """
+    Write the contents of ``source_path`` to ``archive_path`` as a tar
+    compressed with ``codec`` (``xz`` or ``zst``) and write its index
+    next to it.
+
+    ``units`` are the relative directories that can be restored on their
+    own; files outside of them are grouped by their top level directory.
+    With ``deterministic`` the members get a fixed timestamp and owner
+    and normalized permissions, as in
+    :func:`~nti.deploymenttools.content.archive_directory`.  With
+    ``manifest`` the index also gives the size and SHA-256 of every
+    member under ``manifest``, digested as the tar is written.
+    Returns ``archive_path``.
+    """
+    if not os.path.isdir(source_path):
+        raise ValueError("Invalid source path")
+    compress, _ = get_codec(codec, level)
+    # Longest prefixes first so nested units win.
+    units = sorted(units, key=len, reverse=True)
+    index = {
+        'version': INDEX_VERSION,
+        'codec': codec,
+        'frame_size': frame_size,
+        'frames': None,
+        'units': {},
+        'members': {},
+    }
+    logger.debug('Creating archive %s', archive_path)
+    with span('archive', os.path.basename(archive_path)) as timing, \
+            open(archive_path, 'wb') as fp:
+        writer = FrameWriter(fp, compress, frame_size, threads)
+        try:
+            tar = tarfile.open(fileobj=writer, mode='w',
+                               format=tarfile.PAX_FORMAT)
+            current = None
+            digests = ArchiveManifest() if manifest else None
+            for unit, archive_name, file_path in _collect_files(source_path, units):
+                if unit != current:
+                    if current is not None:
+                        index['units'][current][1] = writer.tell()
+                    writer.cut()
+                    index['units'][unit] = [writer.tell(), None]
+                    current = unit
+                start = writer.tell()
+                logger.debug('Adding %s to the archive as %s.',
+                             file_path, archive_name)
+                _add_member(tar, file_path, archive_name, deterministic,
+                            digests)
+                index['members'][archive_name] = [start, writer.tell()]
+            if current is not None:
+                index['units'][current][1] = writer.tell()
+            tar.close()
+        finally:
+            writer.close()
+        timing.bytes = writer.tell()
+    index['frames'] = writer.frames
+    if digests is not None:
+        index['manifest'] = digests.members
+    with codecs.open(index_path(archive_path), 'w', 'utf-8') as fp:
+        json.dump(index, fp, indent=1, sort_keys=True)
+    return archive_path
+
+
+def read_index(archive_path):
+    path = index_path(archive_path)
+    if not os.path.isfile(path):
+        raise ValueError("No index found for %s" % archive_path)
+    with codecs.open(path, 'r', 'utf-8') as fp:
+        index = json.load(fp)
+    if index.get('version') != INDEX_VERSION:
+        raise ValueError("Unsupported index version in %s" % path)
+    return index
+
+
+def _read_frame(archive_path, frame):
+    with open(archive_path, 'rb') as fp:
+        fp.seek(frame[2])
+        return fp.read(frame[3])
+
+
+def read_range(archive_path, index, start, end, out, threads=None):
+    """
+    Write the uncompressed tar bytes ``[start, end)`` of ``archive_path``
+    to ``out``, decompressing only the frames that overlap the range.
+    """
+    _, decompress = get_codec(index['codec'])
+    frames = index['frames']
+    first = max(bisect.bisect_right([f[0] for f in frames], start) - 1, 0)
+    selected = []
+    for frame in frames[first:]:
+        if frame[0] >= end:
+            break
+        selected.append(frame)
+
+    def load(frame):
+        return frame, decompress(_read_frame(archive_path, frame))
+
+    threads = threads or _default_threads()
+    executor = ThreadPoolExecutor(max_workers=threads)
+    try:
+        for batch in range(0, len(selected), threads):
+            for frame, data in executor.map(load, selected[batch:batch + threads]):
+                lower = max(start - frame[0], 0)
+                upper = min(end - frame[0], frame[1])
+                out.write(data[lower:upper])
+    finally:
+        executor.shutdown(wait=True)
+
+
+def _extract_tar(fp, dest_dir, names=None):
+    kwargs = {}
+    if hasattr(tarfile, 'data_filter'):
+        kwargs['filter'] = 'data'
+    with tarfile.open(fileobj=fp, mode='r:') as tar:
+        members = tar.getmembers()
+        if names is not None:
+            members = [m for m in members if m.name in names]
+        tar.extractall(dest_dir, members, **kwargs)
+        return [m.name for m in members]
+
+
+def _extract_range(archive_path, index, start, end, dest_dir, names=None):
+    with tempfile.TemporaryFile() as fp:
+        read_range(archive_path, index, start, end, fp)
+        fp.seek(0)
+        return _extract_tar(fp, dest_dir, names)
+
+
+def extract_unit(archive_path, unit, dest_dir, index=None):
+    """
+    Extract the members of ``unit`` below ``dest_dir``.
+    """
+    index = index or read_index(archive_path)
+    if unit not in index['units']:
+        raise ValueError("No unit %s in %s" % (unit, archive_path))
+    start, end = index['units'][unit]
+    logger.info('Extracting %s from %s', unit, archive_path)
+    return _extract_range(archive_path, index, start, end, dest_dir)
+
+
+def extract_member(archive_path, name, dest_dir, index=None):
+    """
+    Extract the single member ``name`` below ``dest_dir``.
+    """
+    index = index or read_index(archive_path)
+    if name not in index['members']:
+        raise ValueError("No member %s in %s" % (name, archive_path))
+    start, end = index['members'][name]
+    return _extract_range(archive_path, index, start, end, dest_dir, (name,))
+
+
+def extract_all(archive_path, dest_dir, index=None):
+    index = index or read_index(archive_path)
+    frames = index['frames']
+    end = frames[-1][0] + frames[-1][1] if frames else 0
+    return _extract_range(archive_path, index, 0, end, dest_dir)
+
+
+def unit_to_zip(archive_path, unit, zip_path, index=None):
+    """
+    Rebuild the zip bundle of ``unit`` (such as a course directory) at
+    ``zip_path`` so it can be imported or restored.
+    """
+    temp_dir = tempfile.mkdtemp()
+    try:
+        extract_unit(archive_path, unit, temp_dir, index)
+        return archive_directory(os.path.join(temp_dir, *unit.split('/')),
+                                 zip_path)
+    finally:
+        shutil.rmtree(temp_dir, True)
+
+
+def find_course_unit(index):
+    """
+    Return the course unit of a full course backup.
+    """
+    for unit in sorted(index['units']):
+        if unit == 'course' or unit.endswith('/course'):
+            return unit
+    raise ValueError("No course found in the archive index")
+
+
+def _parse_args():
+    arg_parser = ArgumentParser(description="NextThought Cold Storage Utility")
+    add_profile_arguments(arg_parser)
+    subparsers = arg_parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    list_parser = subparsers.add_parser('list', help="List the units of a cold storage archive.")
+    list_parser.add_argument('archive', help="Archive to list.")
+    list_parser.add_argument('-m', '--members', dest='members', action='store_true',
+                             default=False, help="List every member instead of the units.")
+
+    extract_parser = subparsers.add_parser('extract', help="Extract from a cold storage archive.")
+    extract_parser.add_argument('archive', help="Archive to extract from.")
+    extract_parser.add_argument('-d', '--dest', dest='dest', default='.',
+                                help="Directory to extract to. Defaults to the current directory.")
+    extract_parser.add_argument('--unit', dest='units', action='append', default=[],
+                                help="Unit to extract. May be given more than once.")
+    extract_parser.add_argument('--member', dest='members', action='append', default=[],
+                                help="Single file to extract. May be given more than once.")
+    extract_parser.add_argument('--zip', dest='zip',
+                                help="Write the single --unit as a zip bundle to this path instead.")
+
+    for sub_parser in (list_parser, extract_parser):
+        sub_parser.add_argument('-v', '--verbose', dest='loglevel', action='store_const',
+                                const=logging.DEBUG, help="Print debugging logs.")
+        sub_parser.add_argument('-q', '--quiet', dest='loglevel', action='store_const',
+                                const=logging.WARNING, help="Print warning and error logs only.")
+    return arg_parser.parse_args()
+
+
+@profile_main
+def main():
+    args = _parse_args()
+
+    loglevel = args.loglevel or logging.INFO
+    configure_logging(level=loglevel)
+
+    archive_path = os.path.abspath(os.path.expanduser(args.archive))
+    index = read_index(archive_path)
+
+    if args.command == 'list':
+        entries = index['members'] if args.members else index['units']
+        for name in sorted(entries):
+            start, end = entries[name]
+            print('%12d  %s' % (end - start, name or '.'))
+        return
+
+    dest_dir = os.path.abspath(os.path.expanduser(args.dest))
+    if args.zip:
+        if len(args.units) != 1:
+            raise SystemExit("--zip requires exactly one --unit")
+        unit_to_zip(archive_path, args.units[0], args.zip, index)
+        return
+    if not args.units and not args.members:
+        extract_all(archive_path, dest_dir, index)
+    for unit in args.units:
+        extract_unit(archive_path, unit, dest_dir, index)
+    for member in args.members:
+        extract_member(archive_path, member, dest_dir, index)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -10,15 +10,24 @@ from __future__ import absolute_import
 
 import os
 import logging
-from getpass import getpass
 from argparse import ArgumentParser
 
-from requests import exceptions as requests_exceptions
-
+from nti.deploymenttools.content import requests
+from nti.deploymenttools.content import get_password
 from nti.deploymenttools.content import configure_logging
+from nti.deploymenttools.content import enable_session_cache
 from nti.deploymenttools.content import download_rendered_content
 from nti.deploymenttools.content import upload_rendered_content
 
+from nti.deploymenttools.content.timing import report_timing
+from nti.deploymenttools.content.timing import add_timing_arguments
+
+from nti.deploymenttools.content.metrics import write_metrics
+from nti.deploymenttools.content.metrics import add_metrics_arguments
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
+
 UA_STRING = 'NextThought Content Package Copy Utility'
 
 logger = __import__('logging').getLogger(__name__)
@@ -31,21 +40,21 @@ def _remove_path(path):
 
 
 def copy_content_package(content_ntiid, source_host, dest_host, username,
-                         site_library, cleanup=True):
+                         site_library, cleanup=True, source_password=None,
+                         dest_password=None, output_dir=None):
     content_archive = None
     try:
         logger.info("Downloading content package from %s", source_host)
-        password = getpass('Password for %s@%s: ' % (username, source_host))
         content_archive = download_rendered_content(content_ntiid, source_host,
-                                                    username, password, UA_STRING)
+                                                    username, source_password,
+                                                    UA_STRING, output_dir=output_dir)
 
         logger.info("Uploading content package to %s", dest_host)
-        password = getpass('Password for %s@%s: ' % (username, dest_host))
         content = upload_rendered_content(content_archive, dest_host,
-                                          username, password, site_library, UA_STRING)
+                                          username, dest_password, site_library, UA_STRING)
         logger.info('Successfully uploaded as %s',
                     list(content['Items'].keys())[0])
-    except requests_exceptions.HTTPError as e:
+    except requests.exceptions.HTTPError as e:
         logger.error(e)
     finally:
         if cleanup:
@@ -73,9 +82,16 @@ def _parse_args():
     arg_parser.add_argument('--no-cleanup', dest='no_cleanup', action='store_false',
                             default=True,
                             help="Do not cleanup process files.")
+    arg_parser.add_argument('--cache-session', dest='cache_session',
+                            action='store_true', default=False,
+                            help="Cache the server session between runs until it expires.")
+    add_timing_arguments(arg_parser)
+    add_metrics_arguments(arg_parser)
+    add_profile_arguments(arg_parser)
     return arg_parser.parse_args()
 
 
+@profile_main
 def main():
     # Parse command line args
     args = _parse_args()
@@ -85,9 +101,22 @@ def main():
     loglevel = args.loglevel or logging.INFO
     configure_logging(level=loglevel)
 
+    if args.cache_session:
+        enable_session_cache()
+
+    source_password = get_password(args.source_host, args.user)
+    if args.dest_host == args.source_host:
+        dest_password = source_password
+    else:
+        dest_password = get_password(args.dest_host, args.user)
+
     copy_content_package(args.content_ntiid, args.source_host,
                          args.dest_host, args.user, site_library,
-                         cleanup=args.no_cleanup)
+                         cleanup=args.no_cleanup,
+                         source_password=source_password,
+                         dest_password=dest_password)
+    report_timing(args)
+    write_metrics(args)
 
 
 if __name__ == '__main__':  # pragma: no cover
@@ -11,25 +11,41 @@ from __future__ import absolute_import
 import os
 import logging
 from shutil import rmtree
-from getpass import getpass
 from zipfile import ZipFile
 from tempfile import mkdtemp
 from argparse import ArgumentParser
 
-import requests
-
 import simplejson as json
 
 from isodate import parse_datetime
 from isodate import datetime_isoformat
 
+from nti.deploymenttools.content import requests
 from nti.deploymenttools.content import export_course
 from nti.deploymenttools.content import import_course
+from nti.deploymenttools.content import MANIFEST_NAME
 from nti.deploymenttools.content import archive_directory
+from nti.deploymenttools.content import get_password
 from nti.deploymenttools.content import configure_logging
+from nti.deploymenttools.content import enable_session_cache
 from nti.deploymenttools.content import upload_rendered_content
 from nti.deploymenttools.content import download_rendered_content
 
+from nti.deploymenttools.content.journal import JobJournal
+
+from nti.deploymenttools.content.plan import format_plan
+from nti.deploymenttools.content.plan import plan_transfer
+
+from nti.deploymenttools.content.timing import timed
+from nti.deploymenttools.content.timing import report_timing
+from nti.deploymenttools.content.timing import add_timing_arguments
+
+from nti.deploymenttools.content.metrics import write_metrics
+from nti.deploymenttools.content.metrics import add_metrics_arguments
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
+
 logger = __import__('logging').getLogger(__name__)
 logging.captureWarnings(True)
 
@@ -55,6 +71,7 @@ def _remove_path(path):
         rmtree(path)
 
 
+@timed('patch')
 def _update_course_archive(course_archive, provider_id, start_date, end_date):
     temp_dir = mkdtemp()
 
@@ -84,57 +101,73 @@ def _update_course_archive(course_archive, provider_id, start_date, end_date):
         with open(os.path.join(temp_dir, 'course_info.json'), 'w') as fp:
             json.dump(course_info, fp)
 
-        archive_directory(temp_dir, modified_course_archive)
+        # Keep a checksum manifest the bundle came with up to date
+        manifest = os.path.exists(os.path.join(temp_dir, MANIFEST_NAME))
+        archive_directory(temp_dir, modified_course_archive, manifest=manifest)
     finally:
         _remove_path(temp_dir)
     return modified_course_archive
 
 
 def copy_course(course_ntiid, source_host, dest_host, username, site_library,
-                admin_level, provider_id=None, start_date=None, end_date=None, cleanup=True):
-    cwd = os.getcwd()
-    course_archive = None
+                admin_level, provider_id=None, start_date=None, end_date=None,
+                cleanup=True, job=None, source_password=None, dest_password=None):
+    if job is None:
+        job = JobJournal.create('copy_course', {
+            'course_ntiid': course_ntiid,
+            'source_host': source_host,
+            'dest_host': dest_host,
+            'username': username,
+            'site_library': site_library,
+            'admin_level': admin_level,
+            'provider_id': provider_id,
+            'start_date': start_date,
+            'end_date': end_date,
+        })
+    working_dir = job.working_dir
     content_archives = []
-    working_dir = mkdtemp()
     try:
-        os.chdir(working_dir)
         logger.info('Using %s as the working directory', working_dir)
-        password = getpass('Password for %s@%s: ' % (username, source_host))
         logger.info("Exporting %s from %s", course_ntiid, source_host)
-        course_archive = export_course(course_ntiid, source_host,
-                                       username, password, UA_STRING)
+        course_archive = job.run('export', export_course, course_ntiid,
+                                 source_host, username, source_password,
+                                 UA_STRING, output_dir=working_dir)
         if source_host != dest_host:
             for content_package in _get_content_packages(course_archive):
                 logger.info("Downloading content package %s", content_package)
-                content_archive = download_rendered_content(content_package, source_host,
-                                                            username, password, UA_STRING)
+                content_archive = job.run('download:' + content_package,
+                                          download_rendered_content,
+                                          content_package, source_host,
+                                          username, source_password, UA_STRING,
+                                          output_dir=working_dir)
                 content_archives.append((content_package, content_archive))
 
-            password = getpass('Password for %s@%s: ' % (username, dest_host))
-
             for content_archive in content_archives:
                 logger.info("Uploading content package %s", content_archive[0])
-                upload_rendered_content(content_archive[1], dest_host,
-                                        username, password, site_library, UA_STRING)
+                job.run('upload:' + content_archive[0], upload_rendered_content,
+                        content_archive[1], dest_host, username, dest_password,
+                        site_library, UA_STRING)
 
         # Update course metadata with supplied information
         provider_id = provider_id or _get_provider_id(course_archive)
-        course_archive = _update_course_archive(course_archive, provider_id,
-                                                start_date, end_date)
+        course_archive = job.run('patch', _update_course_archive,
+                                 course_archive, provider_id,
+                                 start_date, end_date)
 
         # TODO: Check if admin level exists on dest server, if not, create it.
         logger.info("Importing %s to %s", course_ntiid, dest_host)
-        course = import_course(course_archive, dest_host, username,
-                               password, site_library, admin_level, provider_id, UA_STRING)
+        course = job.run('import', import_course, course_archive, dest_host,
+                         username, dest_password, site_library, admin_level,
+                         provider_id, UA_STRING)
         logger.info('Course imported sucessfully as %s.',
                     course['Course']['NTIID'])
-
+        job.finish(cleanup)
     except requests.exceptions.HTTPError as e:
         logger.error(e)
-    finally:
-        os.chdir(cwd)
-        if cleanup:
-            _remove_path(working_dir)
+        job.fail(e)
+    except Exception as e:
+        job.fail(e)
+        raise
 
 
 def _parse_args():
@@ -168,9 +201,25 @@ def _parse_args():
     arg_parser.add_argument('--no-cleanup', dest='no_cleanup', action='store_false',
                             default=True,
                             help="Do not cleanup process files.")
+    arg_parser.add_argument('--cache-session', dest='cache_session',
+                            action='store_true', default=False,
+                            help="Cache the server session between runs until it expires.")
+    arg_parser.add_argument('--plan', dest='plan', action='store_true',
+                            default=False,
+                            help="Print the objects, bytes and estimated time the run would take, then exit.")
+    arg_parser.add_argument('--throughput', dest='throughput', type=float,
+                            help="Expected throughput in MiB/s for --plan. Measured from a content package of the source if omitted; course exports are never sampled.")
+    arg_parser.add_argument('--resume', dest='resume', metavar='JOB_ID',
+                            help="Continue a failed copy from its last completed step.")
+    arg_parser.add_argument('--abort', dest='abort', metavar='JOB_ID',
+                            help="Discard a failed copy and its downloaded files.")
+    add_timing_arguments(arg_parser)
+    add_metrics_arguments(arg_parser)
+    add_profile_arguments(arg_parser)
     return arg_parser.parse_args()
 
 
+@profile_main
 def main():
     # Parse command line args
     args = _parse_args()
@@ -180,16 +229,55 @@ def main():
     loglevel = args.loglevel or logging.INFO
     configure_logging(level=loglevel)
 
-    copy_course(args.ntiid,
-                args.source_host,
-                args.dest_host,
-                args.user,
-                site_library,
-                args.admin_level,
-                provider_id=args.provider_id,
-                start_date=args.start_date,
-                end_date=args.end_date,
-                cleanup=args.no_cleanup)
+    if args.cache_session:
+        enable_session_cache()
+
+    if args.plan:
+        try:
+            password = get_password(args.source_host, args.user)
+            throughput = args.throughput * 1024 * 1024 if args.throughput else None
+            plan = plan_transfer(args.ntiid, args.source_host, args.user,
+                                 password, UA_STRING, dest_host=args.dest_host,
+                                 throughput=throughput)
+            print(format_plan(plan))
+        except requests.exceptions.HTTPError as e:
+            logger.error(e)
+        return
+
+    if args.abort:
+        JobJournal.load(args.abort).abort()
+        return
+
+    if args.resume:
+        job = JobJournal.load(args.resume)
+        params = job.params
+    else:
+        job = None
+        params = {
+            'course_ntiid': args.ntiid,
+            'source_host': args.source_host,
+            'dest_host': args.dest_host,
+            'username': args.user,
+            'site_library': site_library,
+            'admin_level': args.admin_level,
+            'provider_id': args.provider_id,
+            'start_date': args.start_date,
+            'end_date': args.end_date,
+        }
+
+    source_password = get_password(params['source_host'], params['username'])
+    if params['dest_host'] == params['source_host']:
+        dest_password = source_password
+    else:
+        dest_password = get_password(params['dest_host'], params['username'])
+
+    copy_course(cleanup=args.no_cleanup,
+                job=job,
+                source_password=source_password,
+                dest_password=dest_password,
+                **params)
+    report_timing(args)
+    write_metrics(args)
 
 
 if __name__ == '__main__':  # pragma: no cover
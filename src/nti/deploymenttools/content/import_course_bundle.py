@@ -1,15 +1,26 @@
 #!/usr/bin/env python
 
 from argparse import ArgumentParser
-from getpass import getpass
 
+from nti.deploymenttools.content import STDIO
+from nti.deploymenttools.content import requests
+from nti.deploymenttools.content import binary_stdio
+from nti.deploymenttools.content import get_password
 from nti.deploymenttools.content import configure_logging
+from nti.deploymenttools.content import enable_session_cache
 from nti.deploymenttools.content import import_course
 
+from nti.deploymenttools.content.timing import report_timing
+from nti.deploymenttools.content.timing import add_timing_arguments
+
+from nti.deploymenttools.content.metrics import write_metrics
+from nti.deploymenttools.content.metrics import add_metrics_arguments
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
+
 import logging
 import os
-import requests
-
 logger = __import__('logging').getLogger(__name__)
 logging.captureWarnings(True)
 
@@ -17,7 +28,7 @@ UA_STRING = 'NextThought Course Import Utility'
 
 def _parse_args():
     arg_parser = ArgumentParser( description=UA_STRING )
-    arg_parser.add_argument( 'coursepath', help="Course archive to import" )
+    arg_parser.add_argument( 'coursepath', help="Course archive to import, or - to read it from standard input" )
     arg_parser.add_argument( '-d', '--dest-server', dest='dest_host',
                              help="Destination server." )
     arg_parser.add_argument( '-u', '--user', dest='user',
@@ -32,26 +43,40 @@ def _parse_args():
                              help="Print debugging logs." )
     arg_parser.add_argument( '-q', '--quiet', dest='loglevel', action='store_const', const=logging.WARNING,
                              help="Print warning and error logs only." )
+    arg_parser.add_argument( '--cache-session', dest='cache_session', action='store_true', default=False,
+                             help="Cache the server session between runs until it expires." )
+    add_timing_arguments( arg_parser )
+    add_metrics_arguments( arg_parser )
+    add_profile_arguments( arg_parser )
     return arg_parser.parse_args()
 
+@profile_main
 def main():
     # Parse command line args
     args = _parse_args()
-    course_archive = os.path.abspath(os.path.expanduser(args.coursepath))
+    if args.coursepath == STDIO:
+        course_archive = binary_stdio('stdin')
+    else:
+        course_archive = os.path.abspath(os.path.expanduser(args.coursepath))
 
     site_library = args.site_library or args.dest_host
 
     loglevel = args.loglevel or logging.INFO
     configure_logging(level=loglevel)
 
+    if args.cache_session:
+        enable_session_cache()
+
     try:
-        password = getpass('Password for %s@%s: ' % (args.user, args.dest_host))
-        logger.info("Importing course from %s to %s" % (course_archive, args.dest_host))
+        password = get_password(args.dest_host, args.user)
+        logger.info("Importing course from %s to %s" % (args.coursepath, args.dest_host))
         course = import_course( course_archive, args.dest_host, args.user, password, site_library, args.admin_level, args.provider_id, UA_STRING)
         logger.info('Course imported sucessfully as %s.' % (course['Course']['NTIID'],))
 
     except requests.exceptions.HTTPError as e:
         logger.error(e)
+    report_timing( args )
+    write_metrics( args )
 
 if __name__ == '__main__': # pragma: no cover
         main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Persistent job journals for multi-step workflows.
+
+A journal lives in its own directory holding ``journal.json`` and the
+working directory of the job. Each completed step is recorded with its
+result (usually the path of a downloaded or generated archive), so a job
+that fails part way can be resumed without repeating finished steps.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import time
+import uuid
+import codecs
+from shutil import rmtree
+
+import simplejson as json
+
+logger = __import__('logging').getLogger(__name__)
+
+JOURNAL_DIR = os.path.join(os.path.expanduser('~'), '.nti', 'jobs')
+
+JOURNAL_FILE = 'journal.json'
+
+
+class JobJournal(object):
+    """
+    The checkpoint record of a single job.
+    """
+
+    def __init__(self, job_dir, state):
+        self.job_dir = job_dir
+        self.state = state
+
+    @classmethod
+    def create(cls, kind, params, journal_dir=JOURNAL_DIR):
+        job_id = '%s-%s' % (time.strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:8])
+        job_dir = os.path.join(journal_dir, job_id)
+        os.makedirs(os.path.join(job_dir, 'work'), 0o700)
+        state = {
+            'id': job_id,
+            'kind': kind,
+            'params': params,
+            'created': time.time(),
+            'status': 'running',
+            'steps': {},
+        }
+        journal = cls(job_dir, state)
+        journal.save()
+        logger.info('Started job %s in %s', job_id, job_dir)
+        return journal
+
+    @classmethod
+    def load(cls, job_id, journal_dir=JOURNAL_DIR):
+        job_dir = os.path.join(journal_dir, job_id)
+        path = os.path.join(job_dir, JOURNAL_FILE)
+        if not os.path.isfile(path):
+            raise ValueError("Unknown job %s" % job_id)
+        with codecs.open(path, 'r', 'utf-8') as fp:
+            return cls(job_dir, json.load(fp))
+
+    @classmethod
+    def list(cls, journal_dir=JOURNAL_DIR):
+        if not os.path.isdir(journal_dir):
+            return []
+        result = []
+        for job_id in sorted(os.listdir(journal_dir)):
+            try:
+                result.append(cls.load(job_id, journal_dir))
+            except ValueError:
+                pass
+        return result
+
+    @property
+    def id(self):
+        return self.state['id']
+
+    @property
+    def kind(self):
+        return self.state['kind']
+
+    @property
+    def params(self):
+        return self.state['params']
+
+    @property
+    def status(self):
+        return self.state['status']
+
+    @property
+    def working_dir(self):
+        return os.path.join(self.job_dir, 'work')
+
+    def path(self, *parts):
+        return os.path.join(self.working_dir, *parts)
+
+    def save(self):
+        path = os.path.join(self.job_dir, JOURNAL_FILE)
+        temp_path = path + '.tmp'
+        with codecs.open(temp_path, 'w', 'utf-8') as fp:
+            json.dump(self.state, fp, indent=2)
+        os.rename(temp_path, path)
+
+    def completed(self, step):
+        return step in self.state['steps']
+
+    def result(self, step):
+        return self.state['steps'][step]['result']
+
+    def run(self, step, func, *args, **kwargs):
+        """
+        Call ``func`` unless ``step`` already completed, in which case
+        the recorded result is returned instead.
+        """
+        if self.completed(step):
+            logger.info('Skipping completed step %s', step)
+            return self.result(step)
+        start = time.time()
+        result = func(*args, **kwargs)
+        self.state['steps'][step] = {
+            'result': result,
+            'finished': time.time(),
+            'elapsed': time.time() - start,
+        }
+        self.save()
+        return result
+
+    def fail(self, error):
+        self.state['status'] = 'failed'
+        self.state['error'] = str(error)
+        self.save()
+        logger.error('Job %s stopped. Continue it with --resume %s '
+                     'or discard it with --abort %s.',
+                     self.id, self.id, self.id)
+
+    def finish(self, cleanup=True):
+        self.state['status'] = 'finished'
+        self.save()
+        if cleanup:
+            self.remove()
+
+    def abort(self):
+        logger.info('Aborting job %s', self.id)
+        self.remove()
+
+    def remove(self):
+        if os.path.exists(self.job_dir):
+            rmtree(self.job_dir)
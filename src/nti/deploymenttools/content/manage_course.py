@@ -4,43 +4,62 @@ import logging
 import os
 
 from argparse import ArgumentParser
-from getpass import getpass
-from shutil import copy2
 from shutil import rmtree
 from tempfile import mkdtemp
 from six.moves.urllib.parse import unquote
 from zipfile import ZipFile
 
-import requests
 import simplejson as json
 
-from nti.deploymenttools.content import archive_directory
+from nti.deploymenttools.content import requests
+from nti.deploymenttools.content import file_crc32
+from nti.deploymenttools.content import MANIFEST_NAME
+from nti.deploymenttools.content import ArchiveManifest
+from nti.deploymenttools.content import server_url
+from nti.deploymenttools.content import copy_archive_member
+from nti.deploymenttools.content import write_archive_member
 from nti.deploymenttools.content import configure_logging
+from nti.deploymenttools.content import enable_session_cache
+from nti.deploymenttools.content import get_session
+from nti.deploymenttools.content import get_password
 from nti.deploymenttools.content import export_course
 from nti.deploymenttools.content import import_course
 from nti.deploymenttools.content import restore_course
 
+from nti.deploymenttools.content.timing import timed
+from nti.deploymenttools.content.timing import report_timing
+from nti.deploymenttools.content.timing import add_timing_arguments
+
+from nti.deploymenttools.content.metrics import write_metrics
+from nti.deploymenttools.content.metrics import add_metrics_arguments
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
+
 logger = __import__('logging').getLogger(__name__)
 logging.captureWarnings(True)
 
-requests_codes = requests.codes
-
 UA_STRING = 'NextThought Course Management Utility'
 
+#: The bundle mutations ``_update_course_archive`` knows how to apply.
+CHANGESET_KEYS = ('asset_path', 'discussion_paths', 'metadata_path',
+                  'vendor_path')
+
 def _remove_path(path):
     if path and os.path.exists(path):
         rmtree(path)
 
 def get_course_catalog_entry(course_ntiid, host, username, password,
                              ua_string):
-    url = 'https://%s/dataserver2/Objects/%s/' % (host, course_ntiid)
+    url = server_url(host, '/dataserver2/Objects/%s/' % course_ntiid)
     headers = {
         'user-agent': ua_string
     }
 
-    response = requests.get(url, headers=headers, auth=(username, password))
+    session = get_session(host, username, password)
+    response = session.get(url, headers=headers)
     response.raise_for_status()
-    if response.status_code == requests_codes.ok:
+    if response.status_code == requests.codes.ok:
         return response.json()
 
 def get_course_instance(course_ntiid, host, username, password, ua_string):
@@ -54,11 +73,12 @@ def get_course_instance(course_ntiid, host, username, password, ua_string):
     url = None
     for link in course_catalog_entry['Links']:
         if link['rel'] == 'CourseInstance':
-            url = 'https://%s%s' % (host,link['href'])
+            url = server_url(host, link['href'])
 
-    response = requests.get(url, headers=headers, auth=(username, password))
+    session = get_session(host, username, password)
+    response = session.get(url, headers=headers)
     response.raise_for_status()
-    if response.status_code == requests_codes.ok:
+    if response.status_code == requests.codes.ok:
         return response.json()
 
 def _get_course_tuple(course_catalog_entry):
@@ -77,11 +97,12 @@ def _is_duplicate_discussion(host, username, password, course_instance,
     url = None
     for link in course_instance['Links']:
         if link['rel'] == 'CourseDiscussions':
-            url = 'https://%s%s' % (host,link['href'])
+            url = server_url(host, link['href'])
 
-    response = requests.get(url, headers=headers, auth=(username, password))
+    session = get_session(host, username, password)
+    response = session.get(url, headers=headers)
     response.raise_for_status()
-    if response.status_code == requests_codes.ok:
+    if response.status_code == requests.codes.ok:
         course_discussions = response.json()
         for course_discussion in course_discussions['Items']:
             if discussion['title'] == course_discussion['title']:
@@ -104,7 +125,7 @@ def register_discussion(course_ntiid, host, username, password,
     url = None
     for link in course_instance['Links']:
         if link['rel'] == 'CourseDiscussions':
-            url = 'https://%s%s' % (host,link['href'])
+            url = server_url(host, link['href'])
     try:
         with open(os.path.abspath(os.path.expanduser(discussion_path)), 'rb') as fp:
             discussion = json.load(fp)
@@ -112,11 +133,11 @@ def register_discussion(course_ntiid, host, username, password,
                                             course_instance, discussion,
                                             ua_string):
                 logger.debug(json.dumps(discussion))
-                response = requests.post(url, headers=headers,
-                                         data=json.dumps(discussion),
-                                         auth=(username, password))
+                session = get_session(host, username, password)
+                response = session.post(url, headers=headers,
+                                        data=json.dumps(discussion))
                 response.raise_for_status()
-                if response.status_code == requests_codes.created:
+                if response.status_code == requests.codes.created:
                     logger.debug(json.dumps(response.json()))
                     return response.json()
             else:
@@ -129,7 +150,7 @@ def create_discussions(course_ntiid, host, username, password,
                        discussion_paths, ua_string):
     course_instance = get_course_instance(course_ntiid, host, username,
                                           password, ua_string)
-    url = 'https://%s%s/@@CreateDiscussionTopics' % (host,course_instance['href'])
+    url = server_url(host, course_instance['href'] + '/@@CreateDiscussionTopics')
     headers = {
         'user-agent': ua_string
     }
@@ -138,75 +159,134 @@ def create_discussions(course_ntiid, host, username, password,
         discussion = register_discussion(course_ntiid, host, username,
                                          password, discussion_path, ua_string)
         if discussion:
-            response = requests.post(url, headers=headers,
-                                     auth=(username, password))
+            session = get_session(host, username, password)
+            response = session.post(url, headers=headers)
             response.raise_for_status()
-            if response.status_code == requests_codes.ok:
+            if response.status_code == requests.codes.ok:
                 logger.info(json.dumps(response.json()))
             else:
                 logger.info(response.status_code)
 
-def _update_course_archive(course_archive, **kwargs):
-    temp_dir = mkdtemp()
+ASSET_PREFIX = 'presentation-assets/'
+
+def _walk_files(source_path, prefix=''):
+    base_path = source_path.rstrip(os.sep) + os.sep
+    for root, _, files in os.walk(source_path):
+        for source in files or ():
+            file_path = os.path.join(root, source)
+            archive_file_path = file_path.replace(base_path, '', 1)
+            yield prefix + archive_file_path.replace(os.sep, '/'), file_path
+
+def diff_presentation_assets(archive, asset_path):
+    """
+    Compare the local presentation assets in ``asset_path`` with the
+    ``presentation-assets`` members of the open bundle ``archive`` by
+    size and CRC32.
+
+    Returns a dict of sorted member names under ``added``, ``changed``,
+    ``removed`` and ``unchanged``, plus a ``files`` mapping of member
+    name to local path.
+    """
+    members = dict((info.filename, info) for info in archive.infolist()
+                   if info.filename.startswith(ASSET_PREFIX)
+                   and not info.filename.endswith('/'))
+    files = dict(_walk_files(asset_path, ASSET_PREFIX))
+    added, changed, unchanged = [], [], []
+    for name, path in files.items():
+        info = members.get(name)
+        if info is None:
+            added.append(name)
+        elif info.file_size != os.path.getsize(path) \
+                or info.CRC != file_crc32(path):
+            changed.append(name)
+        else:
+            unchanged.append(name)
+    removed = set(members) - set(files)
+    return {
+        'added': sorted(added),
+        'changed': sorted(changed),
+        'removed': sorted(removed),
+        'unchanged': sorted(unchanged),
+        'files': files,
+    }
 
+def _log_asset_diff(diff):
+    logger.info('Presentation assets: %s added, %s changed, %s removed, '
+                '%s unchanged.', len(diff['added']), len(diff['changed']),
+                len(diff['removed']), len(diff['unchanged']))
+    for key in ('added', 'changed', 'removed'):
+        for name in diff[key]:
+            logger.info('  %-8s %s', key, name)
+
+@timed('patch')
+def _update_course_archive(course_archive, delta_assets=False, manifest=None,
+                           **kwargs):
     modified_course_archive = os.path.splitext(course_archive)
     modified_course_archive = modified_course_archive[0] + \
         '_modified' + modified_course_archive[1]
-    try:
-        with ZipFile(course_archive, 'r') as archive:
-            for name in archive.namelist():
-                archive.extract(name, temp_dir)
 
+    # Members to write from local files, keyed by archive name, and
+    # members of the original bundle to drop. Everything else is copied
+    # over as is, without being re-encoded.
+    replacements = {}
+    removals = set([MANIFEST_NAME])
+    with ZipFile(course_archive, 'r') as source:
+        # Keep a checksum manifest the bundle came with up to date
+        if manifest is None:
+            manifest = MANIFEST_NAME in source.NameToInfo
+        digests = ArchiveManifest() if manifest else None
         for key in kwargs:
             if key == 'asset_path':
-                logger.debug('Clearing old presentation assets')
-                _remove_path(os.path.join(temp_dir,'presentation-assets'))
+                asset_path = kwargs[key]
+                if delta_assets:
+                    diff = diff_presentation_assets(source, asset_path)
+                    _log_asset_diff(diff)
+                    for name in diff['added'] + diff['changed']:
+                        replacements[name] = diff['files'][name]
+                    removals.update(diff['removed'])
+                else:
+                    logger.debug('Clearing old presentation assets')
+                    removals.update(name for name in source.namelist()
+                                    if name.startswith(ASSET_PREFIX))
+                    logger.debug('Adding presentation assets from %s', asset_path)
+                    replacements.update(_walk_files(asset_path, ASSET_PREFIX))
             if key == 'discussion_paths':
-                discussion_dir = os.path.join(temp_dir, 'Discussions')
-                if not os.path.exists(discussion_dir):
-                    os.mkdir(discussion_dir)
                 for path in kwargs[key]:
-                    logger.debug('Copying %s to %s', path, discussion_dir)
-                    copy2(path, discussion_dir)
+                    name = 'Discussions/' + os.path.basename(path)
+                    logger.debug('Copying %s to %s', path, name)
+                    replacements[name] = path
             if key == 'metadata_path':
                 metadata_path = kwargs[key]
                 for path in ['bundle_dc_metadata.xml', 'dc_metadata.xml']:
-                    logger.debug('Copying %s to %s', metadata_path,
-                                 os.path.join(temp_dir, path))
-                    copy2(metadata_path,os.path.join(temp_dir, path))
+                    logger.debug('Copying %s to %s', metadata_path, path)
+                    replacements[path] = metadata_path
             if key == 'vendor_path':
                 vendor_path = kwargs[key]
-                logger.debug('Copying %s to %s', vendor_path, temp_dir)
-                copy2(vendor_path,temp_dir)
-
-        archive_directory(temp_dir, modified_course_archive)
-    finally:
-        _remove_path(temp_dir)
-
-    with ZipFile(modified_course_archive, 'a') as archive:
-        for key in kwargs:
-            if key == 'asset_path':
-                asset_path = kwargs[key] + '/'
-                logger.debug('Adding presentation assets from %s', asset_path)
-                for root, _, files in os.walk(asset_path):
-                    for source in files or ():
-                        file_path = os.path.join(root, source)
-                        archive_file_path = file_path.replace(asset_path, '', 1)
-                        archive_file_path = os.path.join('presentation-assets',
-                                                     archive_file_path)
-                        logger.debug('Adding %s to the archive as %s.' %
-                                     (file_path, archive_file_path))
-                        archive.write(file_path, archive_file_path)
+                logger.debug('Copying %s to the bundle', vendor_path)
+                replacements[os.path.basename(vendor_path)] = vendor_path
+
+        with ZipFile(modified_course_archive, 'w') as archive:
+            for info in source.infolist():
+                if info.filename in removals or info.filename in replacements:
+                    continue
+                copy_archive_member(source, info, archive, manifest=digests)
+            for archive_file_path in sorted(replacements):
+                file_path = replacements[archive_file_path]
+                logger.debug('Adding %s to the archive as %s.' %
+                             (file_path, archive_file_path))
+                write_archive_member(archive, file_path, archive_file_path,
+                                     manifest=digests)
+            if digests is not None:
+                digests.write(archive)
 
     return modified_course_archive
 
 def update_course(host, username, password, course_ntiid, ua_string, **kwargs):
-    cwd = os.getcwd()
     working_dir = mkdtemp()
     try:
-        os.chdir(working_dir)
         course_archive = export_course(course_ntiid, host, username,
-                                       password, UA_STRING, backup=True)
+                                       password, UA_STRING, backup=True,
+                                       output_dir=working_dir)
         course_archive = _update_course_archive(course_archive, **kwargs)
 
         course_catalog_entry = get_course_catalog_entry(course_ntiid, host,
@@ -218,19 +298,49 @@ def update_course(host, username, password, course_ntiid, ua_string, **kwargs):
     finally:
         _remove_path(working_dir)
 
+def _expand_path(path, base_dir=None):
+    path = os.path.expanduser(path)
+    if base_dir:
+        path = os.path.join(base_dir, path)
+    return os.path.abspath(path)
+
+def read_changeset(changeset_path):
+    """
+    Read the bundle mutations from a JSON changeset file, such as::
+
+        {"metadata_path": "dc_metadata.xml",
+         "discussion_paths": ["discussions/welcome.json"],
+         "asset_path": "presentation-assets",
+         "vendor_path": "vendor_info.json"}
+
+    Relative paths are resolved against the changeset's directory.
+    """
+    base_dir = os.path.dirname(os.path.abspath(changeset_path))
+    with open(changeset_path, 'r') as fp:
+        changeset = json.load(fp)
+    result = {}
+    for key, value in changeset.items():
+        if key not in CHANGESET_KEYS:
+            raise ValueError("Unknown changeset key %s" % key)
+        if key == 'discussion_paths':
+            result[key] = [_expand_path(path, base_dir) for path in value]
+        else:
+            result[key] = _expand_path(value, base_dir)
+    return result
+
 def update_vendor_info(host, username, password, course_ntiid, vendor_info, ua_string):
     course_instance = get_course_instance(course_ntiid, host, username,
                                           password, ua_string)
-    url = 'https://%s%s/VendorInfo' % (host,course_instance['href'])
+    url = server_url(host, course_instance['href'] + '/VendorInfo')
     headers = {
         'user-agent': ua_string,
         'Content-Type': 'application/vnd.nextthought+json'
     }
     with open(vendor_info, "rb") as fp:
-        response = requests.put(url, headers=headers, data=fp.read(), 
-                                 auth=(username, password))
+        session = get_session(host, username, password)
+        response = session.put(url, headers=headers, data=fp.read())
         response.raise_for_status()
-        if response.status_code == requests_codes.ok:
+        if response.status_code == requests.codes.ok:
             return response.json()
 
 def _parse_args():
@@ -241,6 +351,12 @@ def _parse_args():
     arg_parser.add_argument('-q', '--quiet', dest='loglevel',
                             action='store_const', const=logging.WARNING,
                             help="Print warning and error logs only.")
+    arg_parser.add_argument('--cache-session', dest='cache_session',
+                            action='store_true', default=False,
+                            help="Cache the server session between runs until it expires.")
+    add_timing_arguments(arg_parser)
+    add_metrics_arguments(arg_parser)
+    add_profile_arguments(arg_parser)
 
     subparsers =  arg_parser.add_subparsers(dest='subparser_name')
 
@@ -276,6 +392,9 @@ def _parse_args():
                                      help="User to authenticate with the server.")
     presentation_parser.add_argument('-f', '--file', dest='file',
                                      help="Path to new presentation assets.")
+    presentation_parser.add_argument('--delta', dest='delta', action='store_true',
+                                     default=False,
+                                     help="Only replace added or changed assets and drop removed ones.")
 
     vendorinfo_parser = subparsers.add_parser('vendorinfo',
                             description='Vendor Info Management')
@@ -288,8 +407,35 @@ def _parse_args():
     vendorinfo_parser.add_argument('-f', '--file', dest='file',
                                    help="New vendor info file to upload.")
 
+    update_parser = subparsers.add_parser('update',
+                            description='Apply several changes in one export and import')
+    update_parser.add_argument('-n', '--ntiid', dest='ntiid',
+                               help="NTIID of the course.")
+    update_parser.add_argument('-s', '--server', dest='host',
+                               help="Server to connect to.")
+    update_parser.add_argument('-u', '--user', dest='user',
+                               help="User to authenticate with the server.")
+    update_parser.add_argument('-c', '--changeset', dest='changeset',
+                               help="JSON file describing the changes to apply.")
+    update_parser.add_argument('--dcmetadata', dest='metadata',
+                               help="New dc metadata info file.")
+    update_parser.add_argument('--discussion', dest='discussions',
+                               action='append', default=[],
+                               help="Discussion to add. May be repeated.")
+    update_parser.add_argument('--presentation-assets', dest='assets',
+                               help="Path to new presentation assets.")
+    update_parser.add_argument('--delta', dest='delta', action='store_true',
+                               default=False,
+                               help="Only replace added or changed assets and drop removed ones.")
+    update_parser.add_argument('--vendor-info', dest='vendor_info',
+                               help="New vendor info file to include in the bundle.")
+    update_parser.add_argument('--manifest', dest='manifest', action='store_true',
+                               default=None,
+                               help="Record the size and SHA-256 of every member in the bundle. Kept by default if the exported bundle has one.")
+
     return arg_parser.parse_args()
 
+@profile_main
 def main():
     # Parse command line args
     args = _parse_args()
@@ -297,11 +443,14 @@ def main():
     loglevel = args.loglevel or logging.INFO
     configure_logging(level=loglevel)
 
+    if args.cache_session:
+        enable_session_cache()
+
     if args.subparser_name == 'dcmetadata':
         if args.file:
             try:
                 metadata_path = os.path.abspath(os.path.expanduser(args.file))
-                password = getpass('Password for %s@%s: ' % (args.user, args.host))
+                password = get_password(args.host, args.user)
                 update_course(args.host, args.user, password, args.ntiid,
                               UA_STRING, metadata_path=metadata_path)
             except requests.exceptions.HTTPError as e:
@@ -312,7 +461,7 @@ def main():
                 discussions = []
                 for path in args.discussions:
                     discussions.append(os.path.abspath(os.path.expanduser(path)))
-                password = getpass('Password for %s@%s: ' % (args.user, args.host))
+                password = get_password(args.host, args.user)
                 update_course(args.host, args.user, password, args.ntiid,
                               UA_STRING, discussion_paths=discussions)
             except requests.exceptions.HTTPError as e:
@@ -321,20 +470,42 @@ def main():
         if args.file:
             try:
                 asset_path = os.path.abspath(os.path.expanduser(args.file))
-                password = getpass('Password for %s@%s: ' % (args.user, args.host))
+                password = get_password(args.host, args.user)
+                update_course(args.host, args.user, password, args.ntiid,
+                              UA_STRING, asset_path=asset_path,
+                              delta_assets=args.delta)
+            except requests.exceptions.HTTPError as e:
+                logger.error(e)
+    elif args.subparser_name == 'update':
+        changes = read_changeset(args.changeset) if args.changeset else {}
+        if args.metadata:
+            changes['metadata_path'] = _expand_path(args.metadata)
+        if args.discussions:
+            discussions = changes.setdefault('discussion_paths', [])
+            discussions.extend(_expand_path(path) for path in args.discussions)
+        if args.assets:
+            changes['asset_path'] = _expand_path(args.assets)
+        if args.vendor_info:
+            changes['vendor_path'] = _expand_path(args.vendor_info)
+        if changes:
+            try:
+                password = get_password(args.host, args.user)
                 update_course(args.host, args.user, password, args.ntiid,
-                              UA_STRING, asset_path=asset_path)
+                              UA_STRING, delta_assets=args.delta,
+                              manifest=args.manifest, **changes)
             except requests.exceptions.HTTPError as e:
                 logger.error(e)
     elif args.subparser_name == 'vendorinfo':
         if args.file:
             try:
                 vendor_path = os.path.abspath(os.path.expanduser(args.file))
-                password = getpass('Password for %s@%s: ' % (args.user, args.host))
+                password = get_password(args.host, args.user)
                 update_vendor_info(args.host, args.user, password, args.ntiid,
                               vendor_path, UA_STRING)
             except requests.exceptions.HTTPError as e:
                 logger.error(e)
+    report_timing(args)
+    write_metrics(args)
 
 if __name__ == '__main__': # pragma: no cover
         main()
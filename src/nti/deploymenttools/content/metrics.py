@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Per-endpoint HTTP request metrics.
+
+Every :class:`~nti.deploymenttools.content.session.DataserverSession`
+reports its responses here through a response hook.  Latency (time until the
+response headers arrive), status codes, bytes and retries are kept per
+dataserver endpoint, such as ``@@Export`` or ``@@ImportCourse``, and can
+be written in the Prometheus text format for node_exporter's textfile
+collector with ``--metrics-textfile``.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sys
+import time
+import codecs
+import threading
+
+from six.moves.urllib.parse import unquote
+from six.moves.urllib.parse import urlparse
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Upper bounds, in seconds, of the latency histogram buckets. Exports
+#: and imports of large courses can take several minutes.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+METRIC_PREFIX = 'nti_http'
+
+
+def _is_ntiid(segment):
+    return segment.startswith('tag:') or ':' in segment
+
+
+def endpoint_of(url):
+    """
+    Return the endpoint label of ``url``: the last ``@@`` view in its
+    path, or the last path segment that is not an NTIID.
+    """
+    segments = [unquote(s) for s in urlparse(url).path.split('/') if s]
+    for segment in reversed(segments):
+        if segment.startswith('@@'):
+            return segment
+    for segment in reversed(segments):
+        if not _is_ntiid(segment):
+            return segment
+    return '/'
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class HttpMetrics(object):
+    """
+    The request metrics of the current process.  Safe to use from
+    several threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.latency = {}
+            self.requests = {}
+            self.request_bytes = {}
+            self.response_bytes = {}
+            self.retries = {}
+
+    def observe(self, endpoint, method, status, seconds, sent=0, received=0):
+        key = (endpoint, method)
+        with self.lock:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram()
+            histogram.observe(seconds)
+            status_key = key + (str(status),)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            self.request_bytes[key] = self.request_bytes.get(key, 0) + sent
+            self.response_bytes[key] = self.response_bytes.get(key, 0) + received
+
+    def received(self, endpoint, method, nbytes):
+        key = (endpoint, method)
+        with self.lock:
+            self.response_bytes[key] = self.response_bytes.get(key, 0) + nbytes
+
+    def retry(self, endpoint, method):
+        key = (endpoint, method)
+        with self.lock:
+            self.retries[key] = self.retries.get(key, 0) + 1
+
+    def _lines(self, labels):
+        def format_labels(names, values, extra=()):
+            pairs = list(labels) + list(zip(names, values)) + list(extra)
+            return '{%s}' % ','.join('%s="%s"' % (name, _escape(value))
+                                     for name, value in pairs)
+
+        names = ('endpoint', 'method')
+        name = METRIC_PREFIX + '_request_duration_seconds'
+        yield '# HELP %s Time until the response headers arrived.' % name
+        yield '# TYPE %s histogram' % name
+        for key in sorted(self.latency):
+            histogram = self.latency[key]
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                yield '%s_bucket%s %d' % (name, format_labels(names, key,
+                                                              [('le', repr(float(bound)))]),
+                                          count)
+            yield '%s_bucket%s %d' % (name, format_labels(names, key, [('le', '+Inf')]),
+                                      histogram.count)
+            yield '%s_sum%s %.6f' % (name, format_labels(names, key), histogram.sum)
+            yield '%s_count%s %d' % (name, format_labels(names, key), histogram.count)
+
+        counters = (
+            ('_requests_total', 'Requests by response status.',
+             self.requests, names + ('code',)),
+            ('_request_bytes_total', 'Request body bytes sent.',
+             self.request_bytes, names),
+            ('_response_bytes_total', 'Response body bytes received.',
+             self.response_bytes, names),
+            ('_retries_total', 'Requests repeated after logging on again.',
+             self.retries, names),
+        )
+        for suffix, description, values, value_names in counters:
+            name = METRIC_PREFIX + suffix
+            yield '# HELP %s %s' % (name, description)
+            yield '# TYPE %s counter' % name
+            for key in sorted(values):
+                yield '%s%s %d' % (name, format_labels(value_names, key), values[key])
+
+        name = METRIC_PREFIX + '_last_run_timestamp_seconds'
+        yield '# HELP %s When the metrics were written.' % name
+        yield '# TYPE %s gauge' % name
+        yield '%s%s %d' % (name, format_labels((), ()), time.time())
+
+    def to_text(self, labels=()):
+        """
+        Return the metrics in the Prometheus text exposition format, with
+        the ``(name, value)`` pairs of ``labels`` added to every series.
+        """
+        with self.lock:
+            return '\n'.join(self._lines(labels)) + '\n'
+
+    def write_textfile(self, path, labels=()):
+        """
+        Write the metrics to ``path`` atomically, as the textfile
+        collector may read it at any time.
+        """
+        temp_path = '%s.%s.tmp' % (path, os.getpid())
+        with codecs.open(temp_path, 'w', 'utf-8') as fp:
+            fp.write(self.to_text(labels))
+        os.rename(temp_path, path)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+#: The request metrics of the current process.
+METRICS = HttpMetrics()
+
+
+def _content_length(headers):
+    value = headers.get('Content-Length') if headers is not None else None
+    return int(value) if value and value.isdigit() else 0
+
+
+def record_response(response, *unused_args, **kwargs):
+    """
+    :mod:`requests` response hook recording ``response`` in
+    :data:`METRICS`.  The body of a streamed response without a
+    ``Content-Length`` is counted by :func:`record_received` once read.
+    """
+    request = response.request
+    received = _content_length(response.headers)
+    if 'Content-Length' not in response.headers and not kwargs.get('stream', True):
+        # requests reads the body right after the hooks anyway
+        received = len(response.content or b'')
+    METRICS.observe(endpoint_of(request.url), request.method,
+                    response.status_code, response.elapsed.total_seconds(),
+                    _content_length(request.headers), received)
+    return response
+
+
+def record_received(response, nbytes):
+    """
+    Record the ``nbytes`` read from the body of the streamed
+    ``response`` when it came without a ``Content-Length``.
+    """
+    request = getattr(response, 'request', None)
+    if request is not None and 'Content-Length' not in response.headers:
+        METRICS.received(endpoint_of(request.url), request.method, nbytes)
+
+
+def record_retry(method, url):
+    METRICS.retry(endpoint_of(url), method.upper())
+
+
+def add_metrics_arguments(arg_parser):
+    arg_parser.add_argument('--metrics-textfile', dest='metrics_textfile',
+                            metavar='PATH',
+                            help="Write HTTP request metrics to this node_exporter textfile (*.prom).")
+
+
+def write_metrics(args, metrics=METRICS):
+    """
+    Write the ``--metrics-textfile`` if asked, labelled with the name of
+    the running tool so the files of several tools can be collected
+    side by side.
+    """
+    path = getattr(args, 'metrics_textfile', None)
+    if path:
+        tool = os.path.basename(sys.argv[0]) or 'python'
+        metrics.write_textfile(path, [('tool', tool)])
+        logger.debug('Wrote request metrics to %s', path)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Keep the site library of one dataserver in step with another.
+
+The content packages and courses of the source and destination sites
+are listed and compared by NTIID.  Anything the destination lacks is
+copied; anything the source modified after the destination's copy was
+made (by their ``Last Modified`` times) is copied again, courses by
+restoring over the destination course.  Everything else is left alone,
+so keeping a DR or staging host in sync costs bandwidth in proportion
+to what changed.  Packages go first, as the courses refer to them, and
+each phase runs up to ``--jobs`` transfers at once.  Objects only on
+the destination are reported but never removed.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import time
+import shutil
+import logging
+import tempfile
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+from nti.deploymenttools.content import get_session
+from nti.deploymenttools.content import server_url
+from nti.deploymenttools.content import get_password
+from nti.deploymenttools.content import export_course
+from nti.deploymenttools.content import import_course
+from nti.deploymenttools.content import restore_course
+from nti.deploymenttools.content import get_course_info
+from nti.deploymenttools.content import configure_logging
+from nti.deploymenttools.content import enable_session_cache
+from nti.deploymenttools.content import upload_rendered_content
+from nti.deploymenttools.content import download_rendered_content
+
+from nti.deploymenttools.content.timing import format_bytes
+from nti.deploymenttools.content.timing import report_timing
+from nti.deploymenttools.content.timing import add_timing_arguments
+
+from nti.deploymenttools.content.metrics import write_metrics
+from nti.deploymenttools.content.metrics import add_metrics_arguments
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
+
+UA_STRING = 'NextThought Site Mirror Utility'
+
+logger = __import__('logging').getLogger(__name__)
+logging.captureWarnings(True)
+
+MISSING = 'missing'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+EXTRA = 'extra'
+
+
+def _get_json(host, username, password, path):
+    session = get_session(host, username, password)
+    response = session.get(server_url(host, path),
+                           headers={'user-agent': UA_STRING})
+    response.raise_for_status()
+    return response.json()
+
+
+def list_packages(host, username, password):
+    """
+    Return the content packages in the library of the site ``host`` as
+    a mapping of NTIID to last modification time.
+    """
+    library = _get_json(host, username, password,
+                        '/dataserver2/users/%s/Library/Main' % username)
+    return dict((item['NTIID'], item.get('Last Modified'))
+                for item in library.get('titles') or library.get('Items') or ())
+
+
+def list_courses(host, username, password):
+    """
+    Return the courses in the catalog of the site ``host`` as a mapping
+    of NTIID to last modification time.
+    """
+    catalog = _get_json(host, username, password,
+                        '/dataserver2/users/%s/Courses/AllCourses' % username)
+    return dict((item.get('CourseNTIID') or item['NTIID'], item.get('Last Modified'))
+                for item in catalog.get('Items') or ())
+
+
+def diff_catalogs(source, dest):
+    """
+    Compare two NTIID to modification time mappings, returning
+    ``(ntiid, state)`` pairs sorted by NTIID.  Without times on both
+    sides an object is taken to have changed.
+    """
+    result = []
+    for ntiid in sorted(set(source) | set(dest)):
+        if ntiid not in dest:
+            state = MISSING
+        elif ntiid not in source:
+            state = EXTRA
+        elif source[ntiid] is None or dest[ntiid] is None \
+                or source[ntiid] > dest[ntiid]:
+            state = CHANGED
+        else:
+            state = UNCHANGED
+        result.append((ntiid, state))
+    return result
+
+
+def _transfer_package(ntiid, unused_state, source_host, dest_host, username,
+                      site_library, work_dir):
+    archive = download_rendered_content(ntiid, source_host, username, None,
+                                        UA_STRING, output_dir=work_dir)
+    upload_rendered_content(archive, dest_host, username, None, site_library,
+                            UA_STRING)
+    return archive
+
+
+def _transfer_course(ntiid, state, source_host, dest_host, username,
+                     site_library, work_dir):
+    archive = export_course(ntiid, source_host, username, None, UA_STRING,
+                            output_dir=work_dir)
+    if state == MISSING:
+        info = get_course_info(ntiid, source_host, username, None, UA_STRING)
+        import_course(archive, dest_host, username, None, site_library,
+                      info['AdminLevel'], info['ProviderUniqueID'], UA_STRING)
+    else:
+        restore_course(archive, dest_host, username, None, ntiid, UA_STRING)
+    return archive
+
+
+_TRANSFERS = {'package': _transfer_package, 'course': _transfer_course}
+
+
+def _transfer(kind, ntiid, state, source_host, dest_host, username,
+              site_library):
+    result = {'kind': kind, 'ntiid': ntiid, 'state': state}
+    start = time.time()
+    work_dir = tempfile.mkdtemp(prefix='nti-mirror-')
+    try:
+        logger.info('Copying %s %s %s', state, kind, ntiid)
+        archive = _TRANSFERS[kind](ntiid, state, source_host, dest_host,
+                                   username, site_library, work_dir)
+        result['bytes'] = os.path.getsize(archive)
+        result['status'] = 'success'
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error('Unable to copy %s %s: %s', kind, ntiid, e)
+        result['status'] = 'failed'
+        result['error'] = str(e)
+    finally:
+        shutil.rmtree(work_dir, True)
+    result['elapsed'] = round(time.time() - start, 3)
+    return result
+
+
+def plan_mirror(source_host, dest_host, username, source_password=None,
+                dest_password=None, packages=True, courses=True):
+    """
+    Return ``(kind, ntiid, state)`` for every package and course on
+    either site.
+    """
+    get_session(source_host, username, source_password)
+    get_session(dest_host, username, dest_password)
+    plan = []
+    for kind, lister, wanted in (('package', list_packages, packages),
+                                 ('course', list_courses, courses)):
+        if not wanted:
+            continue
+        diff = diff_catalogs(lister(source_host, username, None),
+                             lister(dest_host, username, None))
+        plan.extend((kind, ntiid, state) for ntiid, state in diff)
+    return plan
+
+
+def mirror_site(plan, source_host, dest_host, username, site_library, jobs=4):
+    """
+    Copy the missing and changed objects of ``plan``, all packages
+    before any course, returning one result per copy.
+    """
+    results = []
+    executor = ThreadPoolExecutor(max_workers=max(1, jobs))
+    try:
+        for kind in ('package', 'course'):
+            futures = [executor.submit(_transfer, kind, ntiid, state,
+                                       source_host, dest_host, username,
+                                       site_library)
+                       for item_kind, ntiid, state in plan
+                       if item_kind == kind and state in (MISSING, CHANGED)]
+            results.extend(future.result() for future in futures)
+    finally:
+        executor.shutdown(wait=True)
+    return results
+
+
+def format_plan(plan):
+    lines = []
+    for kind in ('package', 'course'):
+        items = [(ntiid, state) for item_kind, ntiid, state in plan
+                 if item_kind == kind]
+        if not items:
+            continue
+        counts = dict((state, len([1 for _, s in items if s == state]))
+                      for state in (MISSING, CHANGED, UNCHANGED, EXTRA))
+        lines.append('%ss: %s missing, %s changed, %s unchanged, %s only on the destination'
+                     % (kind.capitalize(), counts[MISSING], counts[CHANGED],
+                        counts[UNCHANGED], counts[EXTRA]))
+        lines.extend('  %-9s %s' % (state, ntiid) for ntiid, state in items
+                     if state != UNCHANGED)
+    return '\n'.join(lines)
+
+
+def format_results(results):
+    failed = [r for r in results if r['status'] != 'success']
+    moved = sum(r.get('bytes') or 0 for r in results)
+    lines = ['Copied %s of %s objects (%s).'
+             % (len(results) - len(failed), len(results), format_bytes(moved))]
+    lines.extend('  failed    %s: %s' % (r['ntiid'], r['error']) for r in failed)
+    return '\n'.join(lines)
+
+
+def _parse_args():
+    arg_parser = ArgumentParser(description=UA_STRING)
+    arg_parser.add_argument('-s', '--source-server', dest='source_host',
+                            required=True,
+                            help="Server to mirror from.")
+    arg_parser.add_argument('-d', '--dest-server', dest='dest_host',
+                            required=True,
+                            help="Server to mirror to.")
+    arg_parser.add_argument('-u', '--user', dest='user',
+                            help="User to authenticate with the servers.")
+    arg_parser.add_argument('--site-library', dest='site_library',
+                            help="Site library to add content to. Defaults to the hostname of the destination server.")
+    arg_parser.add_argument('--no-packages', dest='packages', action='store_false',
+                            default=True,
+                            help="Do not mirror content packages.")
+    arg_parser.add_argument('--no-courses', dest='courses', action='store_false',
+                            default=True,
+                            help="Do not mirror courses.")
+    arg_parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=4,
+                            help="Copies to run at once. Defaults to 4.")
+    arg_parser.add_argument('-n', '--dry-run', dest='dry_run', action='store_true',
+                            default=False,
+                            help="Only show what would be copied.")
+    arg_parser.add_argument('-v', '--verbose', dest='loglevel',
+                            action='store_const', const=logging.DEBUG,
+                            help="Print debugging logs.")
+    arg_parser.add_argument('-q', '--quiet', dest='loglevel',
+                            action='store_const', const=logging.WARNING,
+                            help="Print warning and error logs only.")
+    arg_parser.add_argument('--cache-session', dest='cache_session',
+                            action='store_true', default=False,
+                            help="Cache the server sessions between runs until they expire.")
+    add_timing_arguments(arg_parser)
+    add_metrics_arguments(arg_parser)
+    add_profile_arguments(arg_parser)
+    return arg_parser.parse_args()
+
+
+@profile_main
+def main():
+    args = _parse_args()
+
+    site_library = args.site_library or args.dest_host
+
+    loglevel = args.loglevel or logging.INFO
+    configure_logging(level=loglevel)
+
+    if args.cache_session:
+        enable_session_cache()
+
+    source_password = get_password(args.source_host, args.user)
+    dest_password = get_password(args.dest_host, args.user)
+    plan = plan_mirror(args.source_host, args.dest_host, args.user,
+                       source_password, dest_password, args.packages,
+                       args.courses)
+    print(format_plan(plan))
+    failed = False
+    if not args.dry_run:
+        results = mirror_site(plan, args.source_host, args.dest_host,
+                              args.user, site_library, args.jobs)
+        print(format_results(results))
+        failed = any(r['status'] != 'success' for r in results)
+    report_timing(args)
+    write_metrics(args)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
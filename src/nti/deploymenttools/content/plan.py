@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Estimate how much data a course copy or backup will move before
+running it.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import time
+
+from nti.deploymenttools.content import CHUNK_SIZE
+from nti.deploymenttools.content import get_session
+from nti.deploymenttools.content import server_url
+from nti.deploymenttools.content import get_course_info
+
+from nti.deploymenttools.content.timing import format_bytes
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Bytes read from the source to measure throughput.
+SAMPLE_SIZE = 4 * CHUNK_SIZE
+
+
+def _export_url(host, ntiid):
+    return server_url(host, '/dataserver2/Objects/%s/@@Export' % ntiid)
+
+
+def get_content_package_ntiids(course_info):
+    """
+    Return the NTIIDs of the content packages referenced by a course, as
+    found in its ``ContentPackages`` or its content package bundle.
+    """
+    packages = course_info.get('ContentPackages')
+    if packages is None:
+        bundle = course_info.get('ContentPackageBundle') or {}
+        packages = bundle.get('ContentPackages')
+    result = []
+    for package in packages or ():
+        if isinstance(package, dict):
+            package = package.get('NTIID') or package.get('OID')
+        if package:
+            result.append(package)
+    return result
+
+
+def get_export_size(session, url, ua_string, params=None):
+    """
+    Return the size the server reports for ``url`` from a HEAD request,
+    or ``None`` if it does not know it ahead of time.
+    """
+    headers = {
+        'user-agent': ua_string
+    }
+    response = session.head(url, headers=headers, params=params,
+                            allow_redirects=True)
+    response.raise_for_status()
+    length = response.headers.get('Content-Length')
+    return int(length) if length and length.isdigit() else None
+
+
+def measure_throughput(session, url, ua_string, params=None,
+                       sample_size=SAMPLE_SIZE):
+    """
+    Download up to ``sample_size`` bytes of ``url`` and return the
+    observed transfer rate in bytes per second.
+    """
+    headers = {
+        'user-agent': ua_string
+    }
+    start = time.time()
+    received = 0
+    response = session.get(url, headers=headers, params=params, stream=True)
+    try:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            received += len(chunk)
+            if received >= sample_size:
+                break
+    finally:
+        response.close()
+    elapsed = time.time() - start
+    return received / elapsed if received and elapsed > 0 else None
+
+
+def plan_transfer(course_ntiid, source_host, username, password, ua_string,
+                  dest_host=None, backup=False, throughput=None,
+                  sample_size=SAMPLE_SIZE):
+    """
+    Resolve a course and size each object a copy (``dest_host`` given) or
+    a full backup would download.
+
+    Content packages are not transferred when copying within the same
+    host, so they are listed as skipped.  If ``throughput`` (bytes per
+    second) is not given it is measured by sampling the largest content
+    package, a static archive.  Course exports are never sampled, as the
+    server would have to build the whole export, so without a package
+    the throughput stays unknown.
+    """
+    session = get_session(source_host, username, password)
+    course_info = get_course_info(course_ntiid, source_host, username,
+                                  password, ua_string)
+    params = {'backup': backup}
+    items = [{
+        'ntiid': course_ntiid,
+        'kind': 'course',
+        'bytes': get_export_size(session, _export_url(source_host, course_ntiid),
+                                 ua_string, params),
+        'skipped': None,
+    }]
+    same_host = dest_host is not None and dest_host == source_host
+    for ntiid in get_content_package_ntiids(course_info):
+        item = {'ntiid': ntiid, 'kind': 'package', 'bytes': None,
+                'skipped': None}
+        if same_host:
+            item['skipped'] = 'already on %s' % dest_host
+        else:
+            item['bytes'] = get_export_size(session,
+                                            _export_url(source_host, ntiid),
+                                            ua_string)
+        items.append(item)
+
+    transferred = [i for i in items if not i['skipped']]
+    packages = [i for i in items if i['kind'] == 'package']
+    sampled = None
+    if throughput is None and transferred and packages:
+        # Skipped packages are still on the source to sample.
+        largest = max(packages, key=lambda i: i['bytes'] or 0)
+        logger.info('Measuring throughput from %s', source_host)
+        throughput = measure_throughput(session,
+                                        _export_url(source_host, largest['ntiid']),
+                                        ua_string, None, sample_size)
+        sampled = largest['ntiid']
+
+    total = sum(i['bytes'] or 0 for i in transferred)
+    # A copy downloads everything and then uploads it again.
+    moved = total * 2 if dest_host else total
+    return {
+        'course': course_ntiid,
+        'source': source_host,
+        'dest': dest_host,
+        'items': items,
+        'objects': len(transferred),
+        'skipped': len(items) - len(transferred),
+        'unknown': len([i for i in transferred if i['bytes'] is None]),
+        'bytes': total,
+        'transfer_bytes': moved,
+        'throughput': throughput,
+        'sampled': sampled,
+        'seconds': moved / throughput if throughput else None,
+    }
+
+
+def _format_seconds(value):
+    if value is None:
+        return 'unknown'
+    minutes, seconds = divmod(int(round(value)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+
+def format_plan(plan):
+    lines = ['Transfer plan for %s' % plan['course']]
+    for item in plan['items']:
+        size = item['skipped'] and 'skip (%s)' % item['skipped'] \
+            or format_bytes(item['bytes'])
+        lines.append('  %-8s %-20s %s' % (item['kind'], size, item['ntiid']))
+    lines.append('Objects:    %s (%s skipped, %s of unknown size)'
+                 % (plan['objects'], plan['skipped'], plan['unknown']))
+    lines.append('Size:       %s' % format_bytes(plan['bytes']))
+    lines.append('Transfer:   %s' % format_bytes(plan['transfer_bytes']))
+    throughput = plan['throughput']
+    if throughput:
+        lines.append('Throughput: %s/s' % format_bytes(throughput))
+    else:
+        lines.append('Throughput: unknown, give --throughput; course exports'
+                     ' are not sampled')
+    lines.append('Estimate:   %s' % _format_seconds(plan['seconds']))
+    return '\n'.join(lines)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Profiling for the console scripts.
+
+Every script accepts ``--profile PATH`` to run under :mod:`cProfile`,
+writing the raw statistics to ``PATH`` (for ``pstats``, snakeviz and
+friends) and the slowest calls by cumulative time to ``PATH.txt``.
+``--profile-memory`` adds :mod:`tracemalloc` peak memory tracking and
+the top allocation sites.  Only the main thread is profiled; work done
+in thread pools shows up as time spent waiting on it.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import sys
+import pstats
+import codecs
+import cProfile
+import functools
+from argparse import ArgumentParser
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Functions listed in the text report.
+STATS_LIMIT = 50
+
+#: Allocation sites listed in the text report.
+ALLOCATION_LIMIT = 25
+
+
+def add_profile_arguments(arg_parser):
+    arg_parser.add_argument('--profile', dest='profile', metavar='PATH',
+                            help="Profile the run, writing cProfile stats to PATH and a summary to PATH.txt.")
+    arg_parser.add_argument('--profile-memory', dest='profile_memory',
+                            action='store_true', default=False,
+                            help="Also track peak memory and the top allocation sites with tracemalloc.")
+
+
+def _parse_profile_args(argv=None):
+    arg_parser = ArgumentParser(add_help=False)
+    add_profile_arguments(arg_parser)
+    options, _ = arg_parser.parse_known_args(argv)
+    return options
+
+
+def _start_tracemalloc():
+    try:
+        import tracemalloc
+    except ImportError:  # pragma: no cover
+        logger.warning('tracemalloc is not available, not tracking memory.')
+        return None
+    tracemalloc.start()
+    return tracemalloc
+
+
+def _format_memory(tracemalloc):
+    _, peak = tracemalloc.get_traced_memory()
+    lines = ['Peak traced memory: %.1f MiB' % (peak / (1024 * 1024))]
+    snapshot = tracemalloc.take_snapshot()
+    for stat in snapshot.statistics('lineno')[:ALLOCATION_LIMIT]:
+        lines.append(str(stat))
+    return lines
+
+
+def run_profiled(path, memory, func, *args, **kwargs):
+    """
+    Call ``func`` under the profiler, writing the results to ``path``
+    (if given) even when it raises.
+    """
+    tracemalloc = _start_tracemalloc() if memory else None
+    profiler = cProfile.Profile() if path else None
+    try:
+        if profiler is None:
+            return func(*args, **kwargs)
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        memory_lines = []
+        if tracemalloc is not None:
+            memory_lines = _format_memory(tracemalloc)
+            tracemalloc.stop()
+            logger.info(memory_lines[0])
+        if profiler is not None:
+            profiler.dump_stats(path)
+            with codecs.open(path + '.txt', 'w', 'utf-8') as fp:
+                stats = pstats.Stats(profiler, stream=fp)
+                stats.sort_stats('cumulative').print_stats(STATS_LIMIT)
+                if memory_lines:
+                    fp.write('\n'.join(memory_lines) + '\n')
+            logger.info('Wrote profile to %s', path)
+
+
+def profile_main(main):
+    """
+    Decorator letting a console script's ``main`` honour ``--profile``
+    and ``--profile-memory``.  The script's own parser must accept them
+    through :func:`add_profile_arguments`.
+    """
+    @functools.wraps(main)
+    def wrapper(*args, **kwargs):
+        argv = kwargs.get('args', args[0] if args else None)
+        options = _parse_profile_args(argv if argv is not None else sys.argv[1:])
+        if not options.profile and not options.profile_memory:
+            return main(*args, **kwargs)
+        return run_profiled(options.profile, options.profile_memory,
+                            main, *args, **kwargs)
+    return wrapper
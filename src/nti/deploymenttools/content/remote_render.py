@@ -9,24 +9,58 @@ from __future__ import print_function
 from __future__ import absolute_import
 
 import os
+import re
 import logging
 from time import sleep
 from shutil import rmtree
-from getpass import getpass
 from tempfile import mkdtemp
 from argparse import ArgumentParser
 
-import requests
-
+from nti.deploymenttools.content import requests
+from nti.deploymenttools.content import get_session
+from nti.deploymenttools.content import server_url
+from nti.deploymenttools.content import get_password
 from nti.deploymenttools.content import archive_directory
 from nti.deploymenttools.content import configure_logging
+from nti.deploymenttools.content import enable_session_cache
+
+from nti.deploymenttools.content.timing import span
+from nti.deploymenttools.content.timing import report_timing
+from nti.deploymenttools.content.timing import add_timing_arguments
+
+from nti.deploymenttools.content.metrics import write_metrics
+from nti.deploymenttools.content.metrics import add_metrics_arguments
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
 
 UA_STRING = 'NextThought Remote Render Utility'
 
 logger = __import__('logging').getLogger(__name__)
 logging.captureWarnings(True)
 
-requests_codes = requests.codes
+
+IGNORE_FILE = '.ntirenderignore'
+
+#: Files and directories that the remote renderer never needs.  These
+#: use the same syntax as ``.gitignore`` and may be overridden with
+#: ``!pattern`` rules from the command line or the project ignore file.
+DEFAULT_IGNORE_PATTERNS = (
+    '.git/',
+    '.svn/',
+    '.hg/',
+    '.DS_Store',
+    '*.paux',
+    '*.aux',
+    '*.log',
+    '*.pyc',
+    '*.swp',
+    '*.swo',
+    '*~',
+    '.#*',
+    '#*#',
+    IGNORE_FILE,
+)
 
 
 def _remove_path(path):
@@ -34,8 +68,119 @@ def _remove_path(path):
         rmtree(path)
 
 
+def _translate_pattern(pattern):
+    """
+    Convert a gitignore-style glob into a regular expression matched
+    against ``/`` separated paths relative to the content directory.
+    """
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    i, n = 0, len(pattern)
+    result = []
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern[i:i + 3] == '**/':
+                result.append('(?:.*/)?')
+                i += 3
+                continue
+            if pattern[i:i + 2] == '**':
+                result.append('.*')
+                i += 2
+                continue
+            result.append('[^/]*')
+        elif c == '?':
+            result.append('[^/]')
+        elif c == '[':
+            j = pattern.find(']', i + 1)
+            if j == -1:
+                result.append(re.escape(c))
+            else:
+                stuff = pattern[i + 1:j]
+                if stuff.startswith('!'):
+                    stuff = '^' + stuff[1:]
+                result.append('[%s]' % stuff.replace('\\', '\\\\'))
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            result.append(re.escape(pattern[i]))
+        else:
+            result.append(re.escape(c))
+        i += 1
+    prefix = '^' if anchored else '^(?:.*/)?'
+    return re.compile(prefix + ''.join(result) + '$')
+
+
+def compile_ignore_rules(patterns):
+    """
+    Compile an iterable of gitignore-style patterns into a list of
+    ``(regex, negated, directory_only)`` rules.  Blank lines and
+    ``#`` comments are skipped.
+    """
+    rules = []
+    for pattern in patterns or ():
+        pattern = pattern.rstrip('\r\n')
+        if not pattern.endswith('\\ '):
+            pattern = pattern.rstrip()
+        if not pattern or pattern.startswith('#'):
+            continue
+        negated = pattern.startswith('!')
+        if negated:
+            pattern = pattern[1:]
+        elif pattern.startswith('\\#') or pattern.startswith('\\!'):
+            pattern = pattern[1:]
+        directory_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        if pattern:
+            rules.append((_translate_pattern(pattern), negated, directory_only))
+    return rules
+
+
+def is_ignored(rules, path, is_dir=False):
+    """
+    Return whether ``path`` is excluded by ``rules``.  As with git, the
+    last matching rule wins.
+    """
+    ignored = False
+    for regex, negated, directory_only in rules:
+        if directory_only and not is_dir:
+            continue
+        if regex.match(path):
+            ignored = not negated
+    return ignored
+
+
+def _read_ignore_file(path):
+    if not os.path.isfile(path):
+        return ()
+    with open(path, 'r') as fp:
+        return fp.readlines()
+
+
+def get_ignore_rules(working_dir, job_name, excludes=(), includes=(),
+                     use_defaults=True):
+    """
+    Build the ignore rules for ``working_dir``: the defaults, the
+    previous render output of ``job_name``, the project ignore file and
+    finally any rules given on the command line.
+    """
+    patterns = []
+    if use_defaults:
+        patterns.extend(DEFAULT_IGNORE_PATTERNS)
+        patterns.extend(('/%s/' % job_name, '/%s.zip' % job_name))
+    patterns.extend(_read_ignore_file(os.path.join(working_dir, IGNORE_FILE)))
+    patterns.extend(excludes or ())
+    patterns.extend('!' + pattern for pattern in includes or ())
+    return compile_ignore_rules(patterns)
+
+
 def remote_render(host, user, password, site_library, working_dir,
-                  poll_interval, cleanup=True):
+                  poll_interval, cleanup=True, excludes=(), includes=(),
+                  use_default_ignores=True):
+    """
+    Submit ``working_dir`` for rendering on ``host`` and wait for the
+    job, returning its final status (``None`` if it was not submitted).
+    """
 
     def _get_job_name(working_dir):
         for source in os.listdir(working_dir):
@@ -48,45 +193,48 @@ def remote_render(host, user, password, site_library, working_dir,
     def _build_archive(working_dir, temp_dir):
         job_name = _get_job_name(working_dir)
         archive_path = os.path.join(temp_dir, job_name + '.zip')
-        archive_directory(working_dir, archive_path)
+        rules = get_ignore_rules(working_dir, job_name, excludes, includes,
+                                 use_default_ignores)
+        archive_directory(working_dir, archive_path,
+                          ignore=lambda path, is_dir: is_ignored(rules, path, is_dir))
         return archive_path, job_name
 
     def _monitor_job(response, host, user, password, poll_interval):
+        session = get_session(host, user, password)
         response_body = response.json()
         for link in response_body['Items'][job_name + '.zip']['Links']:
             if link['rel'] == 'error':
-                error_link = 'https://%s' % host + link['href']
+                error_link = server_url(host, link['href'])
             elif link['rel'] == 'status':
-                status_link = 'https://%s' % host + link['href']
+                status_link = server_url(host, link['href'])
 
         logger.info('Render job %s submitted.',
                     response_body['Items'][job_name + '.zip']['JobId'])
 
-        response = requests.get(status_link, headers=headers,
-                                auth=(user, password))
+        response = session.get(status_link, headers=headers)
         response.raise_for_status()
         status = response.json()['status']
         while status in ('Pending', 'Running'):
             logger.info("Render is %s", status)
             sleep(poll_interval)
-            response = requests.get(status_link, headers=headers,
-                                    auth=(user, password))
+            response = session.get(status_link, headers=headers)
             response.raise_for_status()
             status = response.json()['status']
         if status == 'Failed':
-            response = requests.get(error_link, headers=headers,
-                                    auth=(user, password))
+            response = session.get(error_link, headers=headers)
             response.raise_for_status()
             logger.error('Render failed.\n%s', response.json()['message'])
         elif status == 'Success':
             logger.info('Render succeeded.')
+        return status
 
-    url = 'https://%s/dataserver2/Library/@@RenderContentSource' % host
+    url = server_url(host, '/dataserver2/Library/@@RenderContentSource')
     headers = {
         'user-agent': UA_STRING
     }
 
     logger.info('Submitting render of %s to %s' % (working_dir, host))
+    status = None
     try:
         temp_dir = mkdtemp()
         logger.info('Using %s to store temporary files' % (temp_dir,))
@@ -95,13 +243,17 @@ def remote_render(host, user, password, site_library, working_dir,
         files = {job_name: open(content_archive, 'rb')}
         data = {'site': site_library}
 
-        response = requests.post(url, headers=headers,
-                                 files=files, data=data,
-                                 auth=(user, password))
-        response.raise_for_status()
+        session = get_session(host, user, password)
+        with span('upload', job_name) as timing:
+            timing.add_file(content_archive)
+            response = session.post(url, headers=headers,
+                                    files=files, data=data)
+            response.raise_for_status()
 
-        if response.status_code == requests_codes.ok:
-            _monitor_job(response, host, user, password, poll_interval)
+        if response.status_code == requests.codes.ok:
+            with span('poll', job_name):
+                status = _monitor_job(response, host, user, password,
+                                      poll_interval)
 
     except requests.HTTPError:
         logger.exception("Request HTTP error")
@@ -111,6 +263,7 @@ def remote_render(host, user, password, site_library, working_dir,
     finally:
         if cleanup:
             _remove_path(temp_dir)
+    return status
 
 
 def _parse_args():
@@ -134,9 +287,25 @@ def _parse_args():
     arg_parser.add_argument('--no-cleanup', dest='cleanup', action='store_false',
                             default=True,
                             help="Do not cleanup process files.")
+    arg_parser.add_argument('--exclude', dest='excludes', action='append',
+                            default=[], metavar='PATTERN',
+                            help="Gitignore-style pattern of files to leave out of the upload. May be repeated.")
+    arg_parser.add_argument('--include', dest='includes', action='append',
+                            default=[], metavar='PATTERN',
+                            help="Gitignore-style pattern of files to upload even if otherwise ignored. May be repeated.")
+    arg_parser.add_argument('--no-default-ignores', dest='default_ignores',
+                            action='store_false', default=True,
+                            help="Do not apply the default ignore rules.")
+    arg_parser.add_argument('--cache-session', dest='cache_session',
+                            action='store_true', default=False,
+                            help="Cache the server session between runs until it expires.")
+    add_timing_arguments(arg_parser)
+    add_metrics_arguments(arg_parser)
+    add_profile_arguments(arg_parser)
     return arg_parser.parse_args()
 
 
+@profile_main
 def main():
     args = _parse_args()
 
@@ -145,14 +314,21 @@ def main():
     loglevel = args.loglevel or logging.INFO
     configure_logging(level=loglevel)
 
-    password = getpass('Password for %s@%s: ' % (args.user, args.host))
+    if args.cache_session:
+        enable_session_cache()
+
+    password = get_password(args.host, args.user)
     working_dir = os.path.abspath(os.path.expanduser(args.contentpath))
     if os.path.isfile(working_dir):
         working_dir = os.path.dirname(working_dir)
     logger.info(working_dir)
 
     remote_render(args.host, args.user, password, site_library,
-                  working_dir, args.poll_interval, cleanup=args.cleanup)
+                  working_dir, args.poll_interval, cleanup=args.cleanup,
+                  excludes=args.excludes, includes=args.includes,
+                  use_default_ignores=args.default_ignores)
+    report_timing(args)
+    write_metrics(args)
 
 
 if __name__ == '__main__':  # pragma: no cover
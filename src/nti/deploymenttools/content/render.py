@@ -1,64 +1,78 @@
 #!/usr/bin/env python
 
 from argparse import ArgumentParser
-from getpass import getpass
 from shutil import rmtree
 
-from nti.contentrendering.nti_render import render
 from nti.deploymenttools.content import archive_directory
+from nti.deploymenttools.content import get_password
 from nti.deploymenttools.content import configure_logging
+from nti.deploymenttools.content import enable_session_cache
 from nti.deploymenttools.content import upload_rendered_content
 
+from nti.deploymenttools.content.timing import timed
+from nti.deploymenttools.content.timing import report_timing
+from nti.deploymenttools.content.timing import add_timing_arguments
+
+from nti.deploymenttools.content.metrics import write_metrics
+from nti.deploymenttools.content.metrics import add_metrics_arguments
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
+
 import logging
 import os
+import subprocess
+import sys
 
 logger = logging.getLogger('nti_render_content')
 logging.captureWarnings(True)
 
 UA_STRING = 'NextThought Local Render Utility'
 
+# nti_render works relative to the current working directory, so each
+# render runs in its own process rather than changing the cwd of ours.
+RENDER_SCRIPT = ( "import sys\n"
+                  "from nti.contentrendering.nti_render import render\n"
+                  "render(sys.argv[1], out_format='xhtml', nochecking=False)\n" )
+
+@timed('render')
+def _render( content_path ):
+    subprocess.check_call( [ sys.executable, '-c', RENDER_SCRIPT, os.path.basename( content_path ) ],
+                           cwd=os.path.dirname( content_path ) )
+
 def render_content( content_path, host, username, password, site_library, cleanup=True ):
+    content_dir = os.path.dirname( content_path )
     content_name = os.path.basename( os.path.splitext( content_path )[0] )
-
-    # Save the current working directory
-    old_cwd = os.getcwd()
-    # Change CWD to the content directory
-    os.chdir( os.path.dirname( content_path ) )
+    render_dir = os.path.join( content_dir, content_name )
+    paux_file = os.path.join( content_dir, '.'.join( [ content_name, 'paux' ] ) )
 
     # Build output archive name
     filename = '.'.join( [ content_name, 'zip' ] )
-    content_archive = os.path.abspath( os.path.join( os.path.dirname( content_path ), filename ) )
+    content_archive = os.path.abspath( os.path.join( content_dir, filename ) )
 
     try:
         logger.info( 'Rendering %s' % os.path.basename(content_path) )
         # Render the content
-        render( os.path.basename(content_path), out_format='xhtml', nochecking=False)
-
-        # Work around for nti_render.render not returning you to the original
-        # working directory.
-        os.chdir( os.path.dirname( content_path ) )
+        _render( content_path )
 
         logger.info( 'Building content archive' )
-        archive_directory(content_name, content_archive)
+        archive_directory(render_dir, content_archive)
 
         logger.info('Uploading render of %s to %s' % (content_name, host))
         content = upload_rendered_content( content_archive, host, username, password, site_library, UA_STRING )
-        logger.info('Successfully uploaded as %s' % (content['Items'].keys()[0],))
+        logger.info('Successfully uploaded as %s' % (list(content['Items'].keys())[0],))
 
     finally:
         # Clean-up
         if cleanup:
-            if os.path.exists( '.'.join( [ content_name , 'paux' ] ) ):
-                os.remove( '.'.join( [ content_name , 'paux' ] ) )
+            if os.path.exists( paux_file ):
+                os.remove( paux_file )
 
             if os.path.exists( content_archive ):
                 os.remove( content_archive )
 
-            if os.path.exists( content_name ):
-                rmtree( content_name )
-
-        # Restore the original CWD
-        os.chdir( old_cwd )
+            if os.path.exists( render_dir ):
+                rmtree( render_dir )
 
 def _parse_args():
     arg_parser = ArgumentParser( description=UA_STRING )
@@ -75,8 +89,14 @@ def _parse_args():
                              help="Print warning and error logs only." )
     arg_parser.add_argument( '--no-cleanup', dest='no_cleanup', action='store_false', default=True,
                              help="Do not cleanup process files." )
+    arg_parser.add_argument( '--cache-session', dest='cache_session', action='store_true', default=False,
+                             help="Cache the server session between runs until it expires." )
+    add_timing_arguments( arg_parser )
+    add_metrics_arguments( arg_parser )
+    add_profile_arguments( arg_parser )
     return arg_parser.parse_args()
 
+@profile_main
 def main():
     # Parse command line args
     args = _parse_args()
@@ -87,9 +107,14 @@ def main():
     loglevel = args.loglevel or logging.INFO
     configure_logging(level=loglevel)
 
-    password = getpass('Password for %s@%s: ' % (args.user, args.host))
+    if args.cache_session:
+        enable_session_cache()
+
+    password = get_password(args.host, args.user)
 
     render_content( content_path, args.host, args.user, password, site_library, cleanup=args.no_cleanup )
+    report_timing( args )
+    write_metrics( args )
 
 if __name__ == '__main__': # pragma: no cover
         main()
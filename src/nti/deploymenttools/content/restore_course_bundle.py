@@ -1,23 +1,61 @@
 #!/usr/bin/env python
 
 from argparse import ArgumentParser
-from getpass import getpass
 
+from nti.deploymenttools.content import STDIO
+from nti.deploymenttools.content import requests
+from nti.deploymenttools.content import binary_stdio
+from nti.deploymenttools.content import get_password
 from nti.deploymenttools.content import configure_logging
+from nti.deploymenttools.content import enable_session_cache
 from nti.deploymenttools.content import restore_course
 
+from nti.deploymenttools.content.timing import report_timing
+from nti.deploymenttools.content.timing import add_timing_arguments
+
+from nti.deploymenttools.content.metrics import write_metrics
+from nti.deploymenttools.content.metrics import add_metrics_arguments
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
+
+from nti.deploymenttools.content.cold_storage import read_index
+from nti.deploymenttools.content.cold_storage import unit_to_zip
+from nti.deploymenttools.content.cold_storage import is_cold_archive
+from nti.deploymenttools.content.cold_storage import find_course_unit
+
 import logging
 import os
-import requests
-
+import shutil
+import tempfile
 logger = __import__('logging').getLogger(__name__)
 logging.captureWarnings(True)
 
 UA_STRING = 'NextThought Course Restore Utility'
 
+def restore_course_archive( course_archive, host, username, password, ntiid ):
+    """
+    Restore the course in ``course_archive``, a course bundle or a cold
+    storage full backup, to ``host``.  A binary file, such as standard
+    input, is read as a course bundle.
+    """
+    temp_dir = None
+    try:
+        if not hasattr(course_archive, 'read') and is_cold_archive(course_archive):
+            # Only the course frames of a full backup are decompressed
+            temp_dir = tempfile.mkdtemp()
+            index = read_index(course_archive)
+            course_archive = unit_to_zip(course_archive, find_course_unit(index),
+                                         os.path.join(temp_dir, 'course.zip'), index)
+        logger.info("Restoring course from %s to %s" % (course_archive, host))
+        return restore_course( course_archive, host, username, password, ntiid, UA_STRING )
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, True)
+
 def _parse_args():
     arg_parser = ArgumentParser( description=UA_STRING )
-    arg_parser.add_argument( 'coursepath', help="Course archive to restore" )
+    arg_parser.add_argument( 'coursepath', help="Course archive, or tar.xz/tar.zst full backup, to restore. Use - to read a course archive from standard input." )
     arg_parser.add_argument( '-n', '--ntiid', dest='ntiid',
                              help="NTIID of the course to restore." )
     arg_parser.add_argument( '-d', '--dest-server', dest='dest_host',
@@ -30,26 +68,39 @@ def _parse_args():
                              help="Print debugging logs." )
     arg_parser.add_argument( '-q', '--quiet', dest='loglevel', action='store_const', const=logging.WARNING,
                              help="Print warning and error logs only." )
+    arg_parser.add_argument( '--cache-session', dest='cache_session', action='store_true', default=False,
+                             help="Cache the server session between runs until it expires." )
+    add_timing_arguments( arg_parser )
+    add_metrics_arguments( arg_parser )
+    add_profile_arguments( arg_parser )
     return arg_parser.parse_args()
 
+@profile_main
 def main():
     # Parse command line args
     args = _parse_args()
-    course_archive = os.path.abspath(os.path.expanduser(args.coursepath))
+    if args.coursepath == STDIO:
+        course_archive = binary_stdio('stdin')
+    else:
+        course_archive = os.path.abspath(os.path.expanduser(args.coursepath))
 
     site_library = args.site_library or args.dest_host
 
     loglevel = args.loglevel or logging.INFO
     configure_logging(level=loglevel)
 
+    if args.cache_session:
+        enable_session_cache()
+
     try:
-        password = getpass('Password for %s@%s: ' % (args.user, args.dest_host))
-        logger.info("Restoring course from %s to %s" % (course_archive, args.dest_host))
-        course = restore_course( course_archive, args.dest_host, args.user, password, args.ntiid, UA_STRING)
+        password = get_password(args.dest_host, args.user)
+        course = restore_course_archive( course_archive, args.dest_host, args.user, password, args.ntiid )
         logger.info('Course restored sucessfully as %s.' % (course['Course']['NTIID'],))
 
     except requests.exceptions.HTTPError as e:
         logger.error(e)
+    report_timing( args )
+    write_metrics( args )
 
 
 if __name__ == '__main__': # pragma: no cover
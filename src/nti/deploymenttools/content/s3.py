@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Object store output for backups.
+
+Archives are uploaded with parallel multipart uploads that read each
+part straight from the archive file, and an upload is skipped when the
+object already in the bucket has the same ETag.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import hashlib
+import binascii
+from concurrent.futures import ThreadPoolExecutor
+
+from six.moves.urllib.parse import urlparse
+
+from nti.deploymenttools.content.timing import span
+
+logger = __import__('logging').getLogger(__name__)
+
+S3_SCHEME = 's3://'
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+DEFAULT_PART_SIZE = 64 * 1024 * 1024
+
+DEFAULT_CONCURRENCY = 4
+
+
+def is_s3_url(value):
+    return bool(value) and value.startswith(S3_SCHEME)
+
+
+def parse_s3_url(url):
+    """
+    Split ``s3://bucket/some/prefix`` into the bucket name and the key
+    prefix (without surrounding slashes).
+    """
+    if not is_s3_url(url):
+        raise ValueError("Not an s3:// URL: %s" % url)
+    bucket, _, prefix = url[len(S3_SCHEME):].partition('/')
+    if not bucket:
+        raise ValueError("No bucket in %s" % url)
+    return bucket, prefix.strip('/')
+
+
+def join_key(prefix, *parts):
+    return '/'.join([p.strip('/') for p in (prefix,) + parts if p])
+
+
+def connect_bucket(bucket_name, endpoint=None):
+    """
+    Return the boto bucket ``bucket_name``.  ``endpoint`` is an optional
+    ``http[s]://host[:port]`` URL of an S3-compatible service, such as a
+    local stand-in used for testing.  Credentials come from the usual
+    boto configuration and environment variables.
+    """
+    from boto.s3.connection import S3Connection
+    from boto.s3.connection import OrdinaryCallingFormat
+    kwargs = {}
+    if endpoint:
+        parsed = urlparse(endpoint)
+        kwargs['host'] = parsed.hostname
+        kwargs['is_secure'] = parsed.scheme != 'http'
+        kwargs['calling_format'] = OrdinaryCallingFormat()
+        if parsed.port:
+            kwargs['port'] = parsed.port
+    connection = S3Connection(**kwargs)
+    return connection.get_bucket(bucket_name, validate=False)
+
+
+def _part_ranges(size, part_size):
+    offset = 0
+    while offset < size:
+        yield offset, min(part_size, size - offset)
+        offset += part_size
+
+
+def compute_etag(path, part_size=DEFAULT_PART_SIZE):
+    """
+    Return the ETag S3 gives ``path`` when uploaded by :func:`upload_file`
+    with ``part_size``: the MD5 for a single PUT, or the MD5 of the part
+    digests suffixed with the part count for a multipart upload.
+    """
+    size = os.path.getsize(path)
+    digests = []
+    with open(path, 'rb') as fp:
+        for _, length in _part_ranges(size, part_size):
+            md5 = hashlib.md5()
+            remaining = length
+            while remaining:
+                chunk = fp.read(min(remaining, 1024 * 1024))
+                md5.update(chunk)
+                remaining -= len(chunk)
+            digests.append(md5.digest())
+    if len(digests) <= 1:
+        digest = digests[0] if digests else hashlib.md5().digest()
+        return binascii.hexlify(digest).decode('ascii')
+    combined = hashlib.md5(b''.join(digests)).hexdigest()
+    return '%s-%s' % (combined, len(digests))
+
+
+def _upload_part(multipart, path, part_number, offset, length):
+    with open(path, 'rb') as fp:
+        fp.seek(offset)
+        multipart.upload_part_from_file(fp, part_number, size=length)
+    logger.debug('Uploaded part %s of %s (%s bytes)', part_number, path, length)
+    return part_number
+
+
+def upload_file(path, bucket, key_name, part_size=DEFAULT_PART_SIZE,
+                concurrency=DEFAULT_CONCURRENCY):
+    """
+    Upload ``path`` to ``key_name`` in ``bucket``.  Files larger than
+    ``part_size`` are sent as a multipart upload with up to
+    ``concurrency`` parts in flight.
+
+    Returns false if the object already in the bucket has the same ETag
+    and nothing was uploaded.
+    """
+    part_size = max(part_size, MIN_PART_SIZE)
+    etag = compute_etag(path, part_size)
+    existing = bucket.get_key(key_name)
+    if existing is not None and existing.etag \
+            and existing.etag.strip('"') == etag:
+        logger.info('s3://%s/%s is up to date, skipping upload.',
+                    bucket.name, key_name)
+        return False
+
+    size = os.path.getsize(path)
+    logger.info('Uploading %s to s3://%s/%s', path, bucket.name, key_name)
+    with span('upload', key_name, size):
+        _upload(path, bucket, key_name, size, part_size, concurrency)
+    return True
+
+
+def _upload(path, bucket, key_name, size, part_size, concurrency):
+    if size <= part_size:
+        key = bucket.new_key(key_name)
+        with open(path, 'rb') as fp:
+            key.set_contents_from_file(fp)
+        return
+
+    futures = []
+    multipart = bucket.initiate_multipart_upload(key_name)
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        futures = [executor.submit(_upload_part, multipart, path, number,
+                                   offset, length)
+                   for number, (offset, length)
+                   in enumerate(_part_ranges(size, part_size), 1)]
+        for future in futures:
+            future.result()
+        multipart.complete_upload()
+    except Exception:
+        logger.error('Cancelling upload of s3://%s/%s', bucket.name, key_name)
+        for future in futures:
+            future.cancel()
+        multipart.cancel_upload()
+        raise
+    finally:
+        executor.shutdown(wait=True)
+
+
+def upload_to_url(path, url, name=None, endpoint=None,
+                  part_size=DEFAULT_PART_SIZE, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Upload ``path`` below the ``s3://bucket/prefix`` ``url``, as ``name``
+    or the file's base name.  Returns the ``s3://`` URL of the object.
+    """
+    bucket_name, prefix = parse_s3_url(url)
+    key_name = join_key(prefix, name or os.path.basename(path))
+    bucket = connect_bucket(bucket_name, endpoint)
+    upload_file(path, bucket, key_name, part_size, concurrency)
+    return '%s%s/%s' % (S3_SCHEME, bucket_name, key_name)
+
+
+def add_s3_arguments(arg_parser):
+    arg_parser.add_argument('--s3-endpoint', dest='s3_endpoint',
+                            help="URL of an S3-compatible service to use instead of AWS.")
+    arg_parser.add_argument('--s3-part-size', dest='s3_part_size', type=int,
+                            default=DEFAULT_PART_SIZE // (1024 * 1024),
+                            help="Multipart upload part size in MiB. Defaults to 64.")
+    arg_parser.add_argument('--s3-concurrency', dest='s3_concurrency', type=int,
+                            default=DEFAULT_CONCURRENCY,
+                            help="Number of parts to upload in parallel. Defaults to 4.")
+
+
+def s3_options(args):
+    return {
+        'endpoint': args.s3_endpoint,
+        'part_size': args.s3_part_size * 1024 * 1024,
+        'concurrency': args.s3_concurrency,
+    }
@@ -0,0 +1,598 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Scheduled course backups.
+
+A JSON policy file says which courses to back up, how often, how and
+where, and how much of the night and how many workers the backups may
+use::
+
+    {
+        "username": "admin",
+        "workers": 3,
+        "window": {"start": "01:00", "end": "05:00"},
+        "policies": [
+            {"name": "janux", "sites": ["janux.ou.edu"], "every": "1d",
+             "type": "bundle", "output_dir": "/backups/janux",
+             "retention": 7},
+            {"name": "flagship", "host": "janux.ou.edu", "every": "7d",
+             "courses": ["tag:nextthought.com,2011-10:NTI-CourseInfo-..."],
+             "type": "full", "format": "tar.zst", "priority": 10,
+             "output_dir": "/backups/full", "retention": 4}
+        ]
+    }
+
+``sites`` back up every course in the catalog of each site, while
+``courses`` names them on ``host``.  On each run, usually started from
+cron at the beginning of the window, ``nti_backup_scheduler`` picks the
+courses whose last backup is older than ``every``.  Higher ``priority``
+goes first, then the courses that changed since their last backup,
+then the most overdue.  Courses that did not change are only left out
+with ``skip_unchanged``, as edits to lessons and assets do not always
+change the course itself.  The runs are laid out on
+``workers`` lanes using the duration of each course's previous backup
+(or ``estimate``), spread evenly over the window; runs that do not fit
+wait for the next night, when they are more overdue.
+
+Each run goes to its own timestamped directory below
+``output_dir/<course>``, and only the newest ``retention`` of them are
+kept.  The backups are made with the ``backup_course`` functions of
+``nti_backup_full_course`` and ``nti_backup_course``, in-process, or
+handed to an ``nti_worker`` queue with ``--enqueue``, in which case the
+next ``--enqueue`` pass records how they went.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import re
+import time
+import codecs
+import shutil
+import logging
+import threading
+from datetime import datetime
+from datetime import timedelta
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+import simplejson as json
+
+from nti.deploymenttools.content import get_password
+from nti.deploymenttools.content import get_course_info
+from nti.deploymenttools.content import configure_logging
+from nti.deploymenttools.content import enable_session_cache
+
+from nti.deploymenttools.content.cold_storage import FORMATS
+
+from nti.deploymenttools.content.journal import JOURNAL_DIR
+from nti.deploymenttools.content.journal import JobJournal
+
+from nti.deploymenttools.content.mirror import list_courses
+
+from nti.deploymenttools.content.s3 import is_s3_url
+
+from nti.deploymenttools.content.timing import report_timing
+from nti.deploymenttools.content.timing import add_timing_arguments
+
+from nti.deploymenttools.content.metrics import write_metrics
+from nti.deploymenttools.content.metrics import add_metrics_arguments
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
+
+from nti.deploymenttools.content.worker import QUEUE_PATH
+from nti.deploymenttools.content.worker import JobFailed
+
+UA_STRING = 'NextThought Backup Scheduler'
+
+logger = __import__('logging').getLogger(__name__)
+logging.captureWarnings(True)
+
+STATE_PATH = os.path.join(os.path.expanduser('~'), '.nti', 'backup_schedule.json')
+
+POLICY_DEFAULTS = {
+    'host': None,
+    'courses': (),
+    'sites': (),
+    'exclude': (),
+    'every': '1d',
+    'type': 'full',
+    'format': 'zip',
+    'compression_level': None,
+    'retention': None,
+    'priority': 0,
+    'estimate': '15m',
+    'skip_unchanged': False,
+}
+
+BACKUP_TYPES = ('full', 'bundle')
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+_INTERVAL = re.compile(r'^(\d+(?:\.\d+)?)\s*([smhdw]?)$')
+
+_RUN_NAME = re.compile(r'^\d{8}T\d{6}Z$')
+
+
+def parse_interval(value):
+    """
+    Return the seconds in ``value``, a number of seconds or a string
+    such as ``90m``, ``12h`` or ``7d``.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _INTERVAL.match(value.strip())
+    if match is None:
+        raise ValueError("Invalid interval %s" % value)
+    return float(match.group(1)) * _UNITS[match.group(2) or 's']
+
+
+def _normalize_policy(policy):
+    result = dict(POLICY_DEFAULTS)
+    result.update(policy)
+    if not result.get('name'):
+        raise ValueError("Backup policy without a name")
+    if not result.get('output_dir'):
+        raise ValueError("Backup policy %s has no output_dir" % result['name'])
+    if result['courses'] and not result['host']:
+        raise ValueError("Backup policy %s lists courses but no host" % result['name'])
+    if result['type'] not in BACKUP_TYPES:
+        raise ValueError("Unknown backup type %s" % result['type'])
+    if result['format'] not in FORMATS \
+            or (result['type'] == 'bundle' and result['format'] != 'zip'):
+        raise ValueError("Unsupported format %s for %s backups"
+                         % (result['format'], result['type']))
+    parse_interval(result['every'])
+    parse_interval(result['estimate'])
+    if not is_s3_url(result['output_dir']):
+        result['output_dir'] = os.path.abspath(os.path.expanduser(result['output_dir']))
+    return result
+
+
+def read_policy(path):
+    """
+    Read and validate the policy file at ``path``.
+    """
+    with codecs.open(path, 'r', 'utf-8') as fp:
+        config = json.load(fp)
+    config['policies'] = [_normalize_policy(p) for p in config.get('policies') or ()]
+    names = [p['name'] for p in config['policies']]
+    if len(set(names)) != len(names):
+        raise ValueError("Backup policy names must be unique")
+    config.setdefault('workers', 2)
+    config.setdefault('window', None)
+    config.setdefault('spread', True)
+    return config
+
+
+class ScheduleState(object):
+    """
+    When each course was last backed up, how long it took and how it
+    went, keyed by policy, host and course.
+    """
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self.records = {}
+        self._lock = threading.Lock()
+        if os.path.isfile(path):
+            with codecs.open(path, 'r', 'utf-8') as fp:
+                self.records = json.load(fp)
+
+    @staticmethod
+    def key(policy, host, course_ntiid):
+        return ' '.join((policy['name'], host, course_ntiid))
+
+    def get(self, key):
+        return self.records.get(key) or {}
+
+    def record(self, key, **values):
+        with self._lock:
+            self.records.setdefault(key, {}).update(values)
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        temp_path = self.path + '.tmp'
+        with codecs.open(temp_path, 'w', 'utf-8') as fp:
+            json.dump(self.records, fp, indent=2, sort_keys=True)
+        os.rename(temp_path, self.path)
+
+
+def course_dir(policy, course_ntiid):
+    name = re.sub(r'[^A-Za-z0-9._-]+', '_', course_ntiid)
+    if is_s3_url(policy['output_dir']):
+        return policy['output_dir'].rstrip('/') + '/' + name
+    return os.path.join(policy['output_dir'], name)
+
+
+def _targets(policy, username, passwords):
+    targets = [(policy['host'], ntiid) for ntiid in policy['courses']]
+    for site in policy['sites']:
+        targets.extend((site, ntiid) for ntiid in
+                       sorted(list_courses(site, username, passwords(site))))
+    return [(host, ntiid) for host, ntiid in targets
+            if ntiid not in policy['exclude']]
+
+
+def collect_candidates(config, state, username, passwords, now=None):
+    """
+    Return the courses that are due for a backup, most urgent first.
+    ``passwords`` is called with a host to get its password.
+    """
+    now = time.time() if now is None else now
+    candidates = []
+    for policy in config['policies']:
+        interval = parse_interval(policy['every'])
+        for host, ntiid in _targets(policy, username, passwords):
+            key = state.key(policy, host, ntiid)
+            record = state.get(key)
+            last = record.get('last_backup')
+            if last and now - last < interval:
+                continue
+            if record.get('last_status') == 'queued':
+                logger.debug('%s is still queued', ntiid)
+                continue
+            info = get_course_info(ntiid, host, username, passwords(host),
+                                   UA_STRING)
+            modified = info.get('Last Modified')
+            changed = not last or modified is None \
+                or modified > (record.get('last_modified') or 0)
+            if not changed and policy['skip_unchanged']:
+                logger.debug('%s has not changed since its last backup', ntiid)
+                continue
+            candidates.append({
+                'key': key,
+                'policy': policy,
+                'host': host,
+                'course_ntiid': ntiid,
+                'modified': modified,
+                'changed': changed,
+                'overdue': (now - last) / max(interval, 1) if last else None,
+                'estimate': record.get('last_duration')
+                            or parse_interval(policy['estimate']),
+            })
+    # Never backed up counts as the most overdue.
+    candidates.sort(key=lambda c: (-c['policy']['priority'], not c['changed'],
+                                   -(c['overdue'] if c['overdue'] is not None
+                                     else float('inf'))))
+    return candidates
+
+
+def _clock(value, day):
+    hours, minutes = [int(part) for part in value.split(':')]
+    return time.mktime((day + timedelta(hours=hours, minutes=minutes)).timetuple())
+
+
+def window_bounds(window, now=None):
+    """
+    Return the start and end timestamps of the backup window that is
+    open at ``now`` or opens next; the end is ``None`` without a window.
+    """
+    now = time.time() if now is None else now
+    if not window:
+        return now, None
+    today = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0,
+                                                microsecond=0)
+    for offset in (-1, 0, 1):
+        day = today + timedelta(days=offset)
+        start = _clock(window['start'], day)
+        end = _clock(window['end'], day)
+        if end <= start:
+            end = _clock(window['end'], day + timedelta(days=1))
+        if now < end:
+            return max(start, now), end
+
+
+def plan_runs(candidates, workers, start, end=None, spread=True):
+    """
+    Assign each candidate a start time and one of ``workers`` lanes in
+    order of urgency.  Returns the planned runs and those that would
+    not finish before ``end``.
+    """
+    lanes = [[] for _ in range(max(1, workers))]
+    busy_until = [start] * len(lanes)
+    deferred = []
+    for candidate in candidates:
+        lane = busy_until.index(min(busy_until))
+        if end is not None and busy_until[lane] + candidate['estimate'] > end:
+            deferred.append(candidate)
+            continue
+        lanes[lane].append(candidate)
+        busy_until[lane] += candidate['estimate']
+    planned = []
+    for number, runs in enumerate(lanes):
+        # Share the lane's idle time out between its runs.
+        gap = (end - busy_until[number]) / len(runs) if spread and end and runs else 0
+        offset = start
+        for run in runs:
+            planned.append(dict(run, lane=number, start=offset))
+            offset += run['estimate'] + gap
+    planned.sort(key=lambda run: (run['start'], run['lane']))
+    return planned, deferred
+
+
+def _completed_runs(path):
+    # A run directory is only created once its backup starts and is
+    # removed again if the backup fails, so an empty one is still to run.
+    return sorted(name for name in os.listdir(path)
+                  if _RUN_NAME.match(name) and os.listdir(os.path.join(path, name)))
+
+
+def prune_backups(path, keep):
+    """
+    Remove all but the newest ``keep`` completed backup runs below
+    ``path``.
+    """
+    if not keep or is_s3_url(path) or not os.path.isdir(path):
+        return []
+    removed = _completed_runs(path)[:-keep]
+    for name in removed:
+        logger.info('Removing expired backup %s', os.path.join(path, name))
+        shutil.rmtree(os.path.join(path, name), True)
+    return removed
+
+
+def _run_dir(run, stamp, create=True):
+    path = course_dir(run['policy'], run['course_ntiid'])
+    if is_s3_url(path):
+        return path + '/' + stamp
+    path = os.path.join(path, stamp)
+    if create:
+        os.makedirs(path)
+    return path
+
+
+def execute_run(run, username, password, journal_dir=JOURNAL_DIR):
+    """
+    Back up the course of ``run``, returning where the backup went.
+    The run directory of a failed backup is removed.
+    """
+    policy = run['policy']
+    output_dir = _run_dir(run, time.strftime('%Y%m%dT%H%M%SZ', time.gmtime()))
+    try:
+        if policy['type'] == 'full':
+            from nti.deploymenttools.content.backup_course import backup_course
+            params = {
+                'course_ntiid': run['course_ntiid'],
+                'source_host': run['host'],
+                'username': username,
+                'output_dir': output_dir,
+                'archive_format': policy['format'],
+                'compression_level': policy['compression_level'],
+            }
+            job = JobJournal.create('backup_course', params, journal_dir)
+            backup_course(job=job, password=password, **params)
+            if job.status == 'failed':
+                raise JobFailed(job.state.get('error'))
+        else:
+            from nti.deploymenttools.content.backup_course_bundle import backup_course
+            if backup_course(run['course_ntiid'], run['host'], username,
+                             password=password, output_dir=output_dir) is None:
+                raise JobFailed('Unable to export %s' % run['course_ntiid'])
+    except Exception:
+        if not is_s3_url(output_dir):
+            shutil.rmtree(output_dir, True)
+        raise
+    return output_dir
+
+
+def run_plan(planned, state, username, passwords, journal_dir=JOURNAL_DIR,
+             stop=None):
+    """
+    Run the planned backups, each lane on its own thread and no run
+    before its start time.  Returns the number of failed runs.
+    """
+    stop = stop or threading.Event()
+    lanes = {}
+    for run in planned:
+        lanes.setdefault(run['lane'], []).append(run)
+    failures = []
+
+    def _lane(runs):
+        for run in runs:
+            delay = run['start'] - time.time()
+            if delay > 0 and stop.wait(delay):
+                return
+            if stop.is_set():
+                return
+            started = time.time()
+            logger.info('Backing up %s from %s (%s)', run['course_ntiid'],
+                        run['host'], run['policy']['name'])
+            try:
+                output = execute_run(run, username, passwords(run['host']),
+                                     journal_dir)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error('Backup of %s failed: %s', run['course_ntiid'], e)
+                failures.append(run)
+                state.record(run['key'], last_status='failed',
+                             last_error=str(e), last_attempt=started)
+                continue
+            state.record(run['key'], last_backup=started,
+                         last_duration=time.time() - started,
+                         last_modified=run['modified'], last_status='finished',
+                         last_output=output, last_error=None)
+            prune_backups(course_dir(run['policy'], run['course_ntiid']),
+                          run['policy']['retention'])
+
+    executor = ThreadPoolExecutor(max_workers=max(1, len(lanes)))
+    try:
+        for lane in sorted(lanes):
+            executor.submit(_lane, lanes[lane])
+    finally:
+        executor.shutdown(wait=True)
+    return len(failures)
+
+
+def enqueue_plan(planned, state, queue, username):
+    """
+    Hand the planned backups to an ``nti_worker`` queue, to run no
+    earlier than their start times.  They are recorded as queued, and
+    :func:`update_queued` records how they went on a later pass.  Their
+    run directories are left for the worker to create, and only runs
+    completed before this pass are pruned.
+    """
+    job_ids = []
+    for run in planned:
+        policy = run['policy']
+        prune_backups(course_dir(policy, run['course_ntiid']), policy['retention'])
+        output_dir = _run_dir(run, time.strftime('%Y%m%dT%H%M%SZ',
+                                                 time.gmtime(run['start'])),
+                              create=False)
+        params = {
+            'course_ntiid': run['course_ntiid'],
+            'source_host': run['host'],
+            'username': username,
+            'output_dir': output_dir,
+        }
+        if policy['type'] == 'full':
+            kind = 'backup'
+            params['archive_format'] = policy['format']
+            params['compression_level'] = policy['compression_level']
+        else:
+            kind = 'backup-bundle'
+        job_id = queue.enqueue(kind, params, policy['priority'], run['start'])
+        job_ids.append(job_id)
+        state.record(run['key'], last_status='queued', job=job_id,
+                     queued_modified=run['modified'])
+    return job_ids
+
+
+def update_queued(state, queue):
+    """
+    Record the outcome of the backups queued on earlier passes that the
+    worker has finished or given up on since.  Returns the keys of those
+    still waiting in ``queue``.
+    """
+    pending = []
+    for key, record in sorted(state.records.items()):
+        if record.get('last_status') != 'queued' or not record.get('job'):
+            continue
+        job = queue.get(record['job'])
+        if job is None:
+            state.record(key, last_status='failed',
+                         last_error='Job %s is missing from the queue' % record['job'])
+        elif job['status'] == 'finished':
+            logger.info('Queued backup of %s finished.', key)
+            state.record(key, last_backup=job['started'],
+                         last_duration=job['finished'] - job['started'],
+                         last_modified=record.get('queued_modified'),
+                         last_status='finished',
+                         last_output=job['params']['output_dir'],
+                         last_error=None)
+        elif job['status'] in ('failed', 'cancelled'):
+            logger.warning('Queued backup of %s %s: %s', key, job['status'],
+                           job['error'])
+            state.record(key, last_status='failed', last_error=job['error'],
+                         last_attempt=job['started'])
+        else:
+            pending.append(key)
+    return pending
+
+
+def _format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp))
+
+
+def format_schedule(planned, deferred):
+    lines = ['%-16s %4s %-12s %-6s %8s %8s  %s'
+             % ('Start', 'Lane', 'Policy', 'Type', 'Estimate', 'Overdue', 'Course')]
+    for run in planned:
+        overdue = 'never' if run['overdue'] is None else 'x%.1f' % run['overdue']
+        lines.append('%-16s %4s %-12s %-6s %7.0fm %8s  %s'
+                     % (_format_time(run['start']), run['lane'],
+                        run['policy']['name'], run['policy']['type'],
+                        run['estimate'] / 60, overdue, run['course_ntiid']))
+    if deferred:
+        lines.append('Deferred to the next window: %s'
+                     % ', '.join(run['course_ntiid'] for run in deferred))
+    return '\n'.join(lines)
+
+
+def _parse_args():
+    arg_parser = ArgumentParser(description=UA_STRING)
+    arg_parser.add_argument('policy', help="Backup policy file.")
+    arg_parser.add_argument('-u', '--user', dest='user',
+                            help="User to authenticate with the servers. Overrides the policy file.")
+    arg_parser.add_argument('--state', dest='state', default=STATE_PATH,
+                            help="Backup history file. Defaults to %s." % STATE_PATH)
+    arg_parser.add_argument('--plan', dest='plan_only', action='store_true',
+                            default=False,
+                            help="Only print the planned runs.")
+    arg_parser.add_argument('--enqueue', dest='queue', nargs='?', const=QUEUE_PATH,
+                            help="Queue the runs for nti_worker instead of running them. Defaults to %s." % QUEUE_PATH)
+    arg_parser.add_argument('--journal-dir', dest='journal_dir', default=JOURNAL_DIR,
+                            help="Directory of the job journals. Defaults to %s." % JOURNAL_DIR)
+    arg_parser.add_argument('-v', '--verbose', dest='loglevel',
+                            action='store_const', const=logging.DEBUG,
+                            help="Print debugging logs.")
+    arg_parser.add_argument('-q', '--quiet', dest='loglevel',
+                            action='store_const', const=logging.WARNING,
+                            help="Print warning and error logs only.")
+    arg_parser.add_argument('--cache-session', dest='cache_session',
+                            action='store_true', default=False,
+                            help="Cache the server sessions between runs until they expire.")
+    add_timing_arguments(arg_parser)
+    add_metrics_arguments(arg_parser)
+    add_profile_arguments(arg_parser)
+    return arg_parser.parse_args()
+
+
+@profile_main
+def main():
+    args = _parse_args()
+
+    loglevel = args.loglevel or logging.INFO
+    configure_logging(level=loglevel)
+
+    if args.cache_session:
+        enable_session_cache()
+
+    config = read_policy(args.policy)
+    username = args.user or config.get('username')
+    state = ScheduleState(os.path.expanduser(args.state))
+
+    passwords = {}
+
+    def _password(host):
+        if host not in passwords:
+            passwords[host] = get_password(host, username)
+        return passwords[host]
+
+    queue = None
+    if args.queue:
+        from nti.deploymenttools.content.worker import JobQueue
+        queue = JobQueue(os.path.expanduser(args.queue))
+        update_queued(state, queue)
+
+    start, end = window_bounds(config['window'])
+    candidates = collect_candidates(config, state, username, _password)
+    planned, deferred = plan_runs(candidates, config['workers'], start, end,
+                                  config['spread'])
+    print(format_schedule(planned, deferred))
+    failures = 0
+    if args.plan_only:
+        pass
+    elif queue is not None:
+        job_ids = enqueue_plan(planned, state, queue, username)
+        logger.info('Queued %s backups.', len(job_ids))
+    else:
+        failures = run_plan(planned, state, username, _password,
+                            args.journal_dir)
+        logger.info('%s of %s backups succeeded.', len(planned) - failures,
+                    len(planned))
+    report_timing(args)
+    write_metrics(args)
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Authenticated, optionally cached, dataserver sessions.
+
+This is the only module of the package that needs :mod:`requests` at
+import time; the package imports it when the first session is asked
+for, so tools that exit early (``--help``, argument errors, dry runs)
+never pay for loading it.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import time
+import threading
+
+import requests
+
+import simplejson as json
+
+from six.moves.urllib.parse import quote
+
+from nti.deploymenttools.content import LOGON_PATH
+from nti.deploymenttools.content import SESSION_CACHE_DIR
+from nti.deploymenttools.content import server_url
+
+from nti.deploymenttools.content.metrics import record_retry
+from nti.deploymenttools.content.metrics import record_response
+
+logger = __import__('logging').getLogger(__name__)
+
+requests_codes = requests.codes
+
+#: Lifetime given to cached session cookies the server did not put an
+#: expiration on.
+SESSION_CACHE_MAX_AGE = 8 * 60 * 60
+
+
+class DataserverSession(requests.Session):
+    """
+    A :class:`requests.Session` that logs on to a dataserver once with
+    basic auth and then relies on the session cookie the server hands
+    out, so the password hash is not re-verified on every request.
+
+    If the server does not issue a cookie the session falls back to
+    sending basic auth. When a cookie expires mid-run the session logs
+    on again, provided it knows the password. A cached session the
+    server rejects is dropped from the cache, and the request fails with
+    an :class:`~requests.exceptions.HTTPError` asking to log on again.
+    So does a streamed upload that cannot be sent again after logging on.
+    """
+
+    def __init__(self, host, username, password=None):
+        super(DataserverSession, self).__init__()
+        self.host = host
+        self.username = username
+        self.password = password
+        self.hooks['response'].append(record_response)
+
+    def logon(self):
+        if not self.password:
+            raise ValueError("No password for %s@%s" % (self.username, self.host))
+        url = server_url(self.host, LOGON_PATH)
+        kwargs = {'auth': (self.username, self.password)}
+        if '.dev' in url:
+            kwargs['verify'] = False
+        logger.debug('Logging on to %s as %s', self.host, self.username)
+        response = super(DataserverSession, self).request('GET', url, **kwargs)
+        response.raise_for_status()
+        if not self.cookies:
+            logger.debug('No session cookie from %s, using basic auth.',
+                         self.host)
+            self.auth = (self.username, self.password)
+
+    def request(self, method, url, **kwargs):
+        response = super(DataserverSession, self).request(method, url, **kwargs)
+        if response.status_code == requests_codes.unauthorized \
+                and self.auth is None:
+            # Streamed responses hold their connection until closed.
+            response.close()
+            if not self.password:
+                _drop_session(self)
+                raise requests.exceptions.HTTPError(
+                    'Cached session for %s@%s was rejected, run again to log on.'
+                    % (self.username, self.host), response=response)
+            logger.info('Session for %s@%s expired, logging on again.',
+                        self.username, self.host)
+            record_retry(method, url)
+            self.cookies.clear()
+            self.logon()
+            _save_session(self)
+            for fp in (kwargs.get('files') or {}).values():
+                if hasattr(fp, 'seek'):
+                    fp.seek(0)
+            if hasattr(kwargs.get('data'), 'rewind'):
+                try:
+                    kwargs['data'].rewind()
+                except ValueError:
+                    # The session is good again, only this upload is lost.
+                    raise requests.exceptions.HTTPError(
+                        'Session for %s@%s expired during a streamed upload '
+                        'that cannot be sent again, run again to retry.'
+                        % (self.username, self.host), response=response)
+            response = super(DataserverSession, self).request(method, url,
+                                                              **kwargs)
+        return response
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_session_cache_dir = None
+
+
+def enable_session_cache(cache_dir=SESSION_CACHE_DIR):
+    """
+    Persist session cookies in ``cache_dir`` so later runs can skip the
+    password prompt until the cookie expires.
+    """
+    global _session_cache_dir
+    _session_cache_dir = cache_dir
+
+
+def _session_cache_path(host, username):
+    name = quote('%s@%s' % (username, host), safe='@')
+    return os.path.join(_session_cache_dir, name + '.json')
+
+
+def _save_session(session):
+    if not _session_cache_dir or session.auth is not None:
+        return
+    now = time.time()
+    cookies = []
+    for cookie in session.cookies:
+        cookies.append({
+            'name': cookie.name,
+            'value': cookie.value,
+            'domain': cookie.domain,
+            'path': cookie.path,
+            'secure': cookie.secure,
+            'expires': cookie.expires or int(now + SESSION_CACHE_MAX_AGE),
+        })
+    if not os.path.isdir(_session_cache_dir):
+        os.makedirs(_session_cache_dir, 0o700)
+    path = _session_cache_path(session.host, session.username)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as fp:
+        json.dump(cookies, fp)
+
+
+def _drop_session(session):
+    with _sessions_lock:
+        if _sessions.get((session.host, session.username)) is session:
+            del _sessions[(session.host, session.username)]
+    if not _session_cache_dir:
+        return
+    path = _session_cache_path(session.host, session.username)
+    if os.path.isfile(path):
+        logger.info('Removing rejected session cache %s', path)
+        os.remove(path)
+
+
+def _load_session(session):
+    if not _session_cache_dir:
+        return False
+    path = _session_cache_path(session.host, session.username)
+    if not os.path.isfile(path):
+        return False
+    try:
+        with open(path, 'r') as fp:
+            cookies = json.load(fp)
+    except ValueError:
+        logger.warning('Ignoring corrupt session cache %s', path)
+        return False
+    now = time.time()
+    cookies = [c for c in cookies if c['expires'] > now]
+    for cookie in cookies:
+        session.cookies.set(cookie['name'], cookie['value'],
+                            domain=cookie['domain'], path=cookie['path'],
+                            secure=cookie['secure'], expires=cookie['expires'])
+    if cookies:
+        logger.debug('Using cached session for %s@%s',
+                     session.username, session.host)
+    return bool(cookies)
+
+
+def has_session(host, username):
+    """
+    Return whether requests to ``host`` can be authenticated without a
+    password, either from this run or from the session cache.
+    """
+    with _sessions_lock:
+        if (host, username) in _sessions:
+            return True
+        session = DataserverSession(host, username)
+        if _load_session(session):
+            _sessions[(host, username)] = session
+            return True
+    return False
+
+
+def get_session(host, username, password=None):
+    """
+    Return the shared, authenticated session for ``username`` on ``host``,
+    logging on the first time it is requested.
+    """
+    with _sessions_lock:
+        session = _sessions.get((host, username))
+        if session is None:
+            session = DataserverSession(host, username, password)
+            if not _load_session(session):
+                session.logon()
+                _save_session(session)
+            _sessions[(host, username)] = session
+        elif password and not session.password:
+            session.password = password
+    return session
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Coroutines for :mod:`.test_aio`, kept apart because Python 2 cannot
+parse them.  Only import this module on Python 3.7 and later.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import asyncio
+
+from nti.deploymenttools.content import aio
+
+
+async def exercise_helpers(host, ntiids, package, output_dir):
+    async with aio.AsyncDataserverSession(host, 'admin', 'secret',
+                                          limit=8) as session:
+        infos = await asyncio.gather(*[aio.get_course_info(session, ntiid, 'test')
+                                       for ntiid in ntiids])
+        archive = await aio.export_course(session, ntiids[0], 'test',
+                                          backup=True, output_dir=output_dir)
+        course = await aio.import_course(session, archive, 'site', 'Level',
+                                         None, 'test')
+        restored = await aio.restore_course(session, archive, ntiids[1], 'test')
+        uploaded = await aio.upload_rendered_content(session, package, 'site',
+                                                     'test')
+        status = await aio.render_content(session, package, 'job', 'site',
+                                          'test', poll_interval=0.05)
+        return infos, archive, course, restored, uploaded, status
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import assert_that
+
+import sys
+import shutil
+import tempfile
+
+from nti.deploymenttools.content import set_url_scheme
+
+from nti.deploymenttools.content.benchmarks.generate import generate_dataset
+
+from nti.deploymenttools.content.benchmarks.server import FakeDataserver
+
+import unittest
+
+
+class TestAio(unittest.TestCase):
+
+    def setUp(self):
+        if sys.version_info < (3, 7):  # pragma: no cover
+            self.skipTest('The asyncio helpers need Python 3.7')
+        try:
+            import aiohttp  # pylint: disable=unused-variable
+        except ImportError:  # pragma: no cover
+            self.skipTest('aiohttp is not installed')
+        self.temp_dir = tempfile.mkdtemp()
+        self.dataset = generate_dataset(self.temp_dir, 'tiny')
+        self.server = FakeDataserver(render_time=0.2)
+        self.ntiids = []
+        for i in range(20):
+            ntiid = 'tag:nextthought.com,2011-10:NTI-CourseInfo-Async%s' % i
+            self.server.add_course(ntiid, self.dataset['bundle'], 'Async%s' % i)
+            self.ntiids.append(ntiid)
+        self.server.start()
+        set_url_scheme('http')
+
+    def tearDown(self):
+        self.server.stop()
+        set_url_scheme('https')
+        shutil.rmtree(self.temp_dir)
+
+    def test_helpers(self):
+        import asyncio
+        from nti.deploymenttools.content.tests._aio import exercise_helpers
+        package = list(self.dataset['packages'].values())[0]
+        infos, archive, course, restored, uploaded, status = asyncio.run(
+            exercise_helpers(self.server.host, self.ntiids, package,
+                             self.temp_dir))
+        assert_that([info['NTIID'] for info in infos], is_(self.ntiids))
+        with open(archive, 'rb') as fp, open(self.dataset['bundle'], 'rb') as bundle:
+            assert_that(fp.read(), is_(bundle.read()))
+        assert_that('NTIID' in course['Course'], is_(True))
+        # No provider id is sent rather than the string 'None'
+        assert_that(course['Course']['ProviderUniqueID'], is_(None))
+        assert_that(restored['Course']['NTIID'], is_(self.ntiids[1]))
+        assert_that(len(uploaded['Items']), is_(1))
+        assert_that(status, is_('Success'))
+        stats = self.server.stats
+        assert_that(stats['ImportCourse'], is_(1))
+        assert_that(stats['Import'], is_(1))
+        assert_that(stats['ImportRenderedContent'], is_(1))
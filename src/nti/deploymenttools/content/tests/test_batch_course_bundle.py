@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import has_entries
+from hamcrest import assert_that
+from hamcrest import contains
+
+import os
+import shutil
+import tempfile
+
+import requests
+
+from urllib3.exceptions import MaxRetryError
+from urllib3.exceptions import NewConnectionError
+
+from nti.deploymenttools.content import metrics
+from nti.deploymenttools.content import batch_course_bundle
+
+from nti.deploymenttools.content.batch_course_bundle import run_batch
+from nti.deploymenttools.content.batch_course_bundle import read_manifest
+
+import unittest
+
+
+class TestBatchCourseBundle(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self._originals = (batch_course_bundle.get_session,
+                           batch_course_bundle.import_course,
+                           batch_course_bundle.restore_course)
+        batch_course_bundle.get_session = lambda *args: None
+        self._metrics = metrics.METRICS
+        metrics.METRICS = metrics.HttpMetrics()
+
+    def tearDown(self):
+        (batch_course_bundle.get_session,
+         batch_course_bundle.import_course,
+         batch_course_bundle.restore_course) = self._originals
+        metrics.METRICS = self._metrics
+        shutil.rmtree(self.tmpdir, True)
+
+    def test_read_manifest(self):
+        manifest = os.path.join(self.tmpdir, 'manifest.csv')
+        with open(manifest, 'w') as fp:
+            fp.write('archive,admin_level,provider_id,ntiid\n')
+            fp.write('a.zip,Fall2018,CS 101,\n')
+        entries = read_manifest(manifest)
+        assert_that(entries, contains(
+            has_entries(archive=os.path.join(self.tmpdir, 'a.zip'),
+                        admin_level='Fall2018',
+                        provider_id='CS 101',
+                        ntiid=None)))
+
+    def test_run_batch_retries_transient_failures(self):
+        calls = []
+
+        def _error(status):
+            response = requests.Response()
+            response.status_code = status
+            return requests.exceptions.HTTPError(str(status), response=response)
+
+        def _import_course(archive, *unused_args):
+            calls.append(archive)
+            attempt = calls.count(archive)
+            if archive == 'bad.zip':
+                raise _error(400)
+            if archive == 'busy.zip' and attempt == 1:
+                raise _error(503)
+            if archive == 'refused.zip' and attempt == 1:
+                reason = NewConnectionError(None, 'refused')
+                raise requests.exceptions.ConnectionError(
+                    MaxRetryError(None, 'http://host', reason))
+            # The server may have created the course before these
+            if archive == 'reset.zip':
+                raise requests.exceptions.ConnectionError('reset')
+            if archive == 'gateway.zip':
+                raise _error(502)
+            return {'Course': {'NTIID': 'tag:' + archive}}
+        batch_course_bundle.import_course = _import_course
+
+        archives = ('busy.zip', 'refused.zip', 'bad.zip', 'reset.zip',
+                    'gateway.zip')
+        entries = [{'archive': archive, 'admin_level': None,
+                    'provider_id': None, 'ntiid': None}
+                   for archive in archives]
+        results = run_batch('import', entries, 'host', 'user', 'pw',
+                            'site', 'Admin', jobs=1, retry_delay=0)
+        assert_that(results, contains(
+            has_entries(archive='busy.zip', status='success',
+                        ntiid='tag:busy.zip', attempts=2),
+            has_entries(archive='refused.zip', status='success', attempts=2),
+            has_entries(archive='bad.zip', status='failed', attempts=1),
+            has_entries(archive='reset.zip', status='failed', attempts=1),
+            has_entries(archive='gateway.zip', status='failed', attempts=1)))
+        assert_that(len(calls), is_(7))
+        assert_that(metrics.METRICS.retries,
+                    is_({('@@ImportCourse', 'POST'): 2}))
+
+    def test_run_batch_retries_restore(self):
+        calls = []
+
+        def _restore_course(archive, *unused_args):
+            calls.append(archive)
+            if len(calls) == 1:
+                response = requests.Response()
+                response.status_code = 502
+                raise requests.exceptions.HTTPError('502', response=response)
+            if len(calls) == 2:
+                raise requests.exceptions.ConnectionError('reset')
+            return {'Course': {'NTIID': 'tag:a'}}
+        batch_course_bundle.restore_course = _restore_course
+
+        entries = [{'archive': 'a.zip', 'admin_level': None,
+                    'provider_id': None, 'ntiid': 'tag:a'}]
+        results = run_batch('restore', entries, 'host', 'user', 'pw',
+                            'site', 'Admin', jobs=1, retry_delay=0)
+        assert_that(results, contains(
+            has_entries(archive='a.zip', status='success', attempts=3)))
+        assert_that(metrics.METRICS.retries, is_({('@@Import', 'POST'): 2}))
+
+    def test_run_batch_restore_needs_ntiid(self):
+        entries = [{'archive': 'a.zip', 'admin_level': None,
+                    'provider_id': None, 'ntiid': 'tag:a'},
+                   {'archive': 'b.zip', 'admin_level': None,
+                    'provider_id': None, 'ntiid': None}]
+        with self.assertRaises(ValueError) as raised:
+            run_batch('restore', entries, 'host', 'user', 'pw', 'site', 'Admin')
+        assert_that(str(raised.exception), is_('No course ntiid to restore b.zip'))
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import assert_that
+from hamcrest import less_than
+from hamcrest import greater_than
+
+import os
+import shutil
+import tempfile
+
+from nti.deploymenttools.content import set_url_scheme
+
+from nti.deploymenttools.content.benchmarks.archive import run_archive_benchmarks
+
+from nti.deploymenttools.content.benchmarks.flows import run_flow
+
+from nti.deploymenttools.content.benchmarks.generate import generate_dataset
+
+from nti.deploymenttools.content.benchmarks.run import compare_reports
+
+from nti.deploymenttools.content.benchmarks.server import FakeDataserver
+
+import unittest
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.dataset = generate_dataset(self.temp_dir, 'tiny')
+        self.server = FakeDataserver(render_time=0.2)
+        self.server.add_course(self.dataset['course'], self.dataset['bundle'],
+                               self.dataset['provider_id'],
+                               sorted(self.dataset['packages']))
+        for ntiid, path in self.dataset['packages'].items():
+            self.server.add_package(ntiid, path)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        set_url_scheme('https')
+        shutil.rmtree(self.temp_dir)
+
+    def _spec(self, flow):
+        work_dir = os.path.join(self.temp_dir, flow)
+        os.makedirs(work_dir)
+        return {
+            'flow': flow,
+            'host': self.server.host,
+            'alias': self.server.alias,
+            'course': self.dataset['course'],
+            'bundle': self.dataset['bundle'],
+            'source': self.dataset['source'],
+            'work_dir': work_dir,
+        }
+
+    def test_copy_flow(self):
+        result = run_flow(self._spec('copy'))
+        phases = dict((row['phase'], row) for row in result['phases'])
+        # Export, package download and upload, then the import.
+        assert_that(sorted(phases),
+                    is_(['archive', 'download', 'export', 'import', 'patch', 'upload']))
+        package_size = os.path.getsize(list(self.dataset['packages'].values())[0])
+        assert_that(phases['download']['bytes'], is_(package_size))
+        assert_that(self.server.stats['sent'],
+                    is_(os.path.getsize(self.dataset['bundle']) + package_size))
+
+    def test_render_flow(self):
+        result = run_flow(self._spec('render'))
+        phases = dict((row['phase'], row) for row in result['phases'])
+        assert_that(phases['poll']['seconds'], greater_than(0.1))
+        assert_that(phases['upload']['bytes'], is_(result['bytes']))
+        # The default ignore rules keep the .git clutter out of the upload.
+        clutter = os.path.getsize(os.path.join(self.dataset['source'], '.git', 'pack'))
+        assert_that(self.server.stats['received'], less_than(clutter))
+
+
+class TestArchiveBenchmarks(unittest.TestCase):
+
+    def test_run_and_compare(self):
+        results = run_archive_benchmarks(shapes=['deep-tree'],
+                                         zip_configs=['stored', 'deflate-6'],
+                                         cold_configs=[], repeat=1, scale=0.01)
+        keys = [row['key'] for row in results]
+        assert_that(keys, is_(['deep-tree/archive/deflate-6',
+                               'deep-tree/extract/deflate-6',
+                               'deep-tree/patch-copy/deflate-6',
+                               'deep-tree/patch-manage/deflate-6',
+                               'deep-tree/archive/stored',
+                               'deep-tree/extract/stored',
+                               'deep-tree/patch-copy/stored',
+                               'deep-tree/patch-manage/stored']))
+        deflated, stored = results[0], results[4]
+        assert_that(deflated['output_bytes'], less_than(stored['output_bytes']))
+
+        old = {'results': results}
+        new = {'results': [dict(row, median_seconds=row['median_seconds'] * 2)
+                           for row in results[:1]]}
+        rows = compare_reports(old, new)
+        assert_that(rows[0][3], is_(1.0))
+        assert_that(rows[1][2], is_(None))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import contains_string
+from hamcrest import assert_that
+
+import os
+import shutil
+import tempfile
+from zipfile import ZipFile
+from zipfile import ZIP_DEFLATED
+
+import simplejson as json
+
+from nti.deploymenttools.content.bundle_diff import diff_json
+from nti.deploymenttools.content.bundle_diff import format_diff
+from nti.deploymenttools.content.bundle_diff import is_different
+from nti.deploymenttools.content.bundle_diff import diff_archives
+
+import unittest
+
+
+class TestBundleDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, True)
+
+    def _bundle(self, name, members):
+        path = os.path.join(self.tmpdir, name)
+        with ZipFile(path, 'w', ZIP_DEFLATED) as archive:
+            for member, data in members.items():
+                archive.writestr(member, data)
+        return path
+
+    def test_diff_json(self):
+        old = {'id': 'a', 'tags': ['x', 'y'], 'dates': {'start': 1}}
+        new = {'id': 'a', 'tags': ['x'], 'dates': {'start': 2, 'end': 3}}
+        assert_that(diff_json(old, new), is_([('dates.end', None, 3),
+                                              ('dates.start', 1, 2),
+                                              ('tags.1', 'y', None)]))
+        assert_that(diff_json(old, old), is_([]))
+
+    def test_diff_archives(self):
+        info = {'id': 'prov', 'startDate': '2020-01-01', 'title': 'Course'}
+        common = {
+            'bundle_meta_info.json': json.dumps({'ContentPackages': ['a']}),
+            'Discussions/welcome.json': '{}',
+            'presentation-assets/thumb.png': 'png' * 100,
+            'gone.txt': 'gone',
+        }
+        left = dict(common, **{'course_info.json': json.dumps(info),
+                               'notes.txt': 'one\ntwo\n'})
+        info = dict(info, startDate='2021-01-01')
+        right = dict(common, **{'course_info.json': json.dumps(info),
+                                'notes.txt': 'one\nthree\n',
+                                'added.txt': 'new'})
+        right.pop('gone.txt')
+        right['assets/thumb.png'] = right.pop('presentation-assets/thumb.png')
+        left = self._bundle('left.zip', left)
+        right = self._bundle('right.zip', right)
+
+        result = diff_archives(left, right, patch=True)
+        assert_that(result['added'], is_(['added.txt']))
+        assert_that(result['removed'], is_(['gone.txt']))
+        assert_that(result['moved'], is_([('presentation-assets/thumb.png',
+                                           'assets/thumb.png')]))
+        assert_that(result['changed'], is_(['course_info.json', 'notes.txt']))
+        assert_that(result['unchanged'], is_(['Discussions/welcome.json',
+                                              'bundle_meta_info.json']))
+        assert_that(result['details']['course_info.json'],
+                    is_([('startDate', '2020-01-01', '2021-01-01')]))
+        assert_that(result['details']['notes.txt'], contains_string('+three'))
+        assert_that(is_different(result), is_(True))
+        assert_that(format_diff(result),
+                    contains_string('startDate: "2020-01-01" -> "2021-01-01"'))
+
+        same = diff_archives(left, left)
+        assert_that(is_different(same), is_(False))
+        assert_that(same['details'], is_({}))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import assert_that
+from hamcrest import contains_string
+
+import sys
+
+from six import StringIO
+
+from nti.deploymenttools.content.cli import COMMANDS
+from nti.deploymenttools.content.cli import main
+from nti.deploymenttools.content.cli import load_command
+
+from nti.deploymenttools.content.benchmarks.startup import run_startup_benchmarks
+
+import unittest
+
+
+class TestCli(unittest.TestCase):
+
+    def test_load_command(self):
+        from nti.deploymenttools.content.copy_course import main as copy_main
+        assert_that(load_command('copy-course'), is_(copy_main))
+        assert_that(load_command('copy_course'), is_(copy_main))
+        for name in COMMANDS:
+            assert_that(callable(load_command(name)), is_(True))
+
+    def test_unknown_command(self):
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            assert_that(main(['no-such-tool']), is_(2))
+            assert_that(sys.stderr.getvalue(), contains_string('copy-course'))
+        finally:
+            sys.stderr = stderr
+
+    def test_help_is_light(self):
+        results = run_startup_benchmarks(['copy-course', 'render-content'],
+                                         repeat=1)
+        assert_that([row['key'] for row in results],
+                    is_(['startup/python', 'startup/copy-course',
+                         'startup/render-content']))
+        for row in results:
+            assert_that(row['heavy_modules'], is_([]))
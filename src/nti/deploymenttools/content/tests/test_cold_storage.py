@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import has_item
+from hamcrest import has_length
+from hamcrest import assert_that
+from hamcrest import greater_than
+
+import os
+import shutil
+import tarfile
+import tempfile
+from zipfile import ZipFile
+
+from nti.deploymenttools.content.cold_storage import read_index
+from nti.deploymenttools.content.cold_storage import unit_to_zip
+from nti.deploymenttools.content.cold_storage import extract_unit
+from nti.deploymenttools.content.cold_storage import extract_member
+from nti.deploymenttools.content.cold_storage import find_course_unit
+from nti.deploymenttools.content.cold_storage import write_cold_archive
+
+import unittest
+
+
+class TestColdStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.temp_dir, 'source')
+        self.files = {
+            'prov/course/course_info.json': b'{"title": "Course"}',
+            'prov/course/presentation-assets/big.bin': os.urandom(200000),
+            'prov/content/pkg-a/index.html': b'<html>a</html>' * 5000,
+            'prov/content/pkg-b/index.html': b'<html>b</html>' * 5000,
+            'prov/content/pkg-b/style.css': b'body {}',
+        }
+        for name, data in self.files.items():
+            path = os.path.join(self.source, *name.split('/'))
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as fp:
+                fp.write(data)
+        self.units = ['prov/course', 'prov/content/pkg-a', 'prov/content/pkg-b']
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _read(self, root, name):
+        with open(os.path.join(root, *name.split('/')), 'rb') as fp:
+            return fp.read()
+
+    def _write(self, codec):
+        archive = os.path.join(self.temp_dir, 'backup.tar.' + codec)
+        write_cold_archive(self.source, archive, codec, level=1,
+                           units=self.units, frame_size=64 * 1024, threads=3)
+        return archive
+
+    def _check_codec(self, codec):
+        archive = self._write(codec)
+        index = read_index(archive)
+        assert_that(index['frames'], has_length(greater_than(3)))
+        assert_that(sorted(index['units']), is_(sorted(self.units)))
+
+        # The whole archive is still a plain compressed tar.
+        if codec == 'xz':
+            with tarfile.open(archive, 'r:xz') as tar:
+                assert_that(sorted(tar.getnames()), is_(sorted(self.files)))
+
+        dest = os.path.join(self.temp_dir, 'unit')
+        names = extract_unit(archive, 'prov/content/pkg-b', dest, index)
+        assert_that(sorted(names), is_(['prov/content/pkg-b/index.html',
+                                        'prov/content/pkg-b/style.css']))
+        for name in names:
+            assert_that(self._read(dest, name), is_(self.files[name]))
+        assert_that(os.path.exists(os.path.join(dest, 'prov', 'course')),
+                    is_(False))
+
+        dest = os.path.join(self.temp_dir, 'member')
+        name = 'prov/course/presentation-assets/big.bin'
+        extract_member(archive, name, dest, index)
+        assert_that(self._read(dest, name), is_(self.files[name]))
+
+    def test_xz(self):
+        self._check_codec('xz')
+
+    def test_zst(self):
+        try:
+            import zstandard  # pylint: disable=unused-variable
+        except ImportError:  # pragma: no cover
+            self.skipTest('zstandard is not installed')
+        self._check_codec('zst')
+
+    def test_unit_to_zip(self):
+        archive = self._write('xz')
+        index = read_index(archive)
+        unit = find_course_unit(index)
+        assert_that(unit, is_('prov/course'))
+        bundle = unit_to_zip(archive, unit,
+                             os.path.join(self.temp_dir, 'course.zip'), index)
+        with ZipFile(bundle) as zf:
+            assert_that(zf.namelist(), has_item('course_info.json'))
+            assert_that(zf.read('course_info.json'),
+                        is_(self.files['prov/course/course_info.json']))
+
+    def test_deterministic(self):
+        archives = []
+        for mtime in (1000000000, 1500000000):
+            for name in self.files:
+                path = os.path.join(self.source, *name.split('/'))
+                os.utime(path, (mtime, mtime))
+            archive = os.path.join(self.temp_dir, 'backup.tar.xz')
+            write_cold_archive(self.source, archive, 'xz', level=1,
+                               units=self.units, frame_size=64 * 1024,
+                               threads=3, deterministic=True)
+            with open(archive, 'rb') as fp:
+                archives.append(fp.read())
+        assert_that(archives[0], is_(archives[1]))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import assert_that
+from hamcrest import contains_inanyorder
+
+import os
+import shutil
+import tempfile
+import threading
+from zipfile import ZipFile
+
+import simplejson as json
+
+from nti.deploymenttools.content import copy_course as copy_course_module
+
+from nti.deploymenttools.content.copy_course import copy_course
+
+from nti.deploymenttools.content.journal import JobJournal
+
+import unittest
+
+COURSE_ARCHIVE = os.path.join(os.path.dirname(__file__), 'data', 'course.zip')
+
+
+class TestCopyCourse(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.imported = []
+        self._originals = (copy_course_module.export_course,
+                           copy_course_module.import_course)
+
+        def _export_course(course_ntiid, *unused_args, **kwargs):
+            path = os.path.join(kwargs['output_dir'], course_ntiid + '.zip')
+            shutil.copy(COURSE_ARCHIVE, path)
+            return path
+
+        def _import_course(course, *args):
+            with ZipFile(course) as archive:
+                course_info = json.loads(archive.read('course_info.json'))
+            self.imported.append(course_info['id'])
+            return {'Course': {'NTIID': args[-2]}}
+
+        copy_course_module.export_course = _export_course
+        copy_course_module.import_course = _import_course
+
+    def tearDown(self):
+        (copy_course_module.export_course,
+         copy_course_module.import_course) = self._originals
+        shutil.rmtree(self.tmpdir, True)
+
+    def test_concurrent_copies(self):
+        cwd = os.getcwd()
+
+        def _copy(provider_id):
+            job = JobJournal.create('copy_course', {},
+                                    journal_dir=self.tmpdir)
+            copy_course('tag:course', 'host', 'host', 'user', 'site',
+                        'Admin', provider_id=provider_id, job=job)
+
+        threads = [threading.Thread(target=_copy, args=('Course %s' % i,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert_that(os.getcwd(), is_(cwd))
+        assert_that(self.imported, contains_inanyorder(
+            'Course 0', 'Course 1', 'Course 2', 'Course 3'))
+        assert_that(os.listdir(self.tmpdir), is_([]))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import assert_that
+
+import os
+import shutil
+import tempfile
+
+from nti.deploymenttools.content.journal import JobJournal
+
+import unittest
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, True)
+
+    def test_resume_skips_completed_steps(self):
+        calls = []
+
+        def _step(name):
+            calls.append(name)
+            if name == 'import':
+                raise ValueError('import failed')
+            return name + '.zip'
+
+        job = JobJournal.create('copy_course', {'course_ntiid': 'tag:x'},
+                                journal_dir=self.tmpdir)
+        assert_that(job.run('export', _step, 'export'), is_('export.zip'))
+        try:
+            job.run('import', _step, 'import')
+        except ValueError as e:
+            job.fail(e)
+
+        resumed = JobJournal.load(job.id, journal_dir=self.tmpdir)
+        assert_that(resumed.status, is_('failed'))
+        assert_that(resumed.params, is_({'course_ntiid': 'tag:x'}))
+        assert_that(resumed.run('export', _step, 'export'), is_('export.zip'))
+        assert_that(calls, is_(['export', 'import']))
+
+        resumed.finish(cleanup=False)
+        assert_that(os.path.isdir(resumed.job_dir), is_(True))
+        resumed.abort()
+        assert_that(os.path.isdir(resumed.job_dir), is_(False))
+        assert_that(JobJournal.list(self.tmpdir), is_([]))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import has_items
+from hamcrest import assert_that
+
+import os
+import shutil
+import hashlib
+import tempfile
+from zipfile import ZipFile
+from zipfile import ZIP_DEFLATED
+
+import simplejson as json
+
+from nti.deploymenttools.content import MANIFEST_NAME
+from nti.deploymenttools.content import read_archive_manifest
+
+from nti.deploymenttools.content.manage_course import read_changeset
+from nti.deploymenttools.content.manage_course import diff_presentation_assets
+from nti.deploymenttools.content.manage_course import _update_course_archive
+
+import unittest
+
+COURSE_ARCHIVE = os.path.join(os.path.dirname(__file__), 'data', 'course.zip')
+
+
+class TestManageCourse(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.course_archive = os.path.join(self.tmpdir, 'course.zip')
+        shutil.copy(COURSE_ARCHIVE, self.course_archive)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, True)
+
+    def _write(self, path, data='x'):
+        path = os.path.join(self.tmpdir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fp:
+            fp.write(data)
+        return path
+
+    def test_changeset(self):
+        self._write('metadata.xml', '<metadata/>')
+        self._write('discussions/welcome.json', '{}')
+        self._write('assets/thumb.png')
+        changeset = self._write('changes.json', json.dumps({
+            'metadata_path': 'metadata.xml',
+            'discussion_paths': ['discussions/welcome.json'],
+            'asset_path': 'assets',
+        }))
+        changes = read_changeset(changeset)
+        assert_that(changes['asset_path'],
+                    is_(os.path.join(self.tmpdir, 'assets')))
+
+        modified = _update_course_archive(self.course_archive, **changes)
+        with ZipFile(modified) as archive:
+            names = [name.replace(os.sep, '/') for name in archive.namelist()]
+            assert_that(archive.read('dc_metadata.xml'), is_(b'<metadata/>'))
+        assert_that(names, has_items('Discussions/welcome.json',
+                                     'presentation-assets/thumb.png',
+                                     'course_info.json'))
+
+    def test_unknown_changeset_key(self):
+        changeset = self._write('changes.json', '{"bogus": "x"}')
+        with self.assertRaises(ValueError):
+            read_changeset(changeset)
+
+    def test_delta_assets(self):
+        with ZipFile(self.course_archive, 'a', ZIP_DEFLATED) as archive:
+            archive.writestr('presentation-assets/same.png', 'same')
+            archive.writestr('presentation-assets/changed.png', 'old')
+            archive.writestr('presentation-assets/gone.png', 'gone')
+        self._write('assets/same.png', 'same')
+        self._write('assets/changed.png', 'new')
+        self._write('assets/sub/added.png', 'added')
+        asset_path = os.path.join(self.tmpdir, 'assets')
+
+        with ZipFile(self.course_archive) as archive:
+            diff = diff_presentation_assets(archive, asset_path)
+        assert_that(diff['added'], is_(['presentation-assets/sub/added.png']))
+        assert_that(diff['changed'], is_(['presentation-assets/changed.png']))
+        assert_that(diff['removed'], is_(['presentation-assets/gone.png']))
+        assert_that(diff['unchanged'], is_(['presentation-assets/same.png']))
+
+        modified = _update_course_archive(self.course_archive,
+                                          delta_assets=True,
+                                          asset_path=asset_path)
+        with ZipFile(modified) as archive:
+            assert_that(archive.testzip(), is_(None))
+            assert_that(archive.read('presentation-assets/same.png'), is_(b'same'))
+            assert_that(archive.getinfo('presentation-assets/same.png').compress_type,
+                        is_(ZIP_DEFLATED))
+            assert_that(archive.read('presentation-assets/changed.png'), is_(b'new'))
+            assert_that(archive.read('presentation-assets/sub/added.png'),
+                        is_(b'added'))
+            assert_that('presentation-assets/gone.png' in archive.namelist(),
+                        is_(False))
+            with ZipFile(COURSE_ARCHIVE) as original:
+                for name in original.namelist():
+                    assert_that(archive.read(name), is_(original.read(name)))
+
+    def test_manifest(self):
+        with ZipFile(self.course_archive, 'a', ZIP_DEFLATED) as archive:
+            archive.writestr('presentation-assets/old.png', 'old' * 1000)
+        asset_path = os.path.dirname(self._write('assets/new.png', 'new'))
+
+        modified = _update_course_archive(self.course_archive,
+                                          asset_path=asset_path,
+                                          manifest=True)
+        with ZipFile(modified) as archive:
+            manifest = read_archive_manifest(archive)
+            names = [name for name in archive.namelist() if name != MANIFEST_NAME]
+            assert_that(sorted(manifest), is_(sorted(names)))
+            for name in names:
+                data = archive.read(name)
+                assert_that(manifest[name], is_({
+                    'size': len(data),
+                    'sha256': hashlib.sha256(data).hexdigest(),
+                }))
+
+        # A bundle that has a manifest keeps an up to date one.
+        metadata_path = self._write('metadata.xml', '<metadata/>')
+        again = _update_course_archive(modified, metadata_path=metadata_path)
+        with ZipFile(again) as archive:
+            manifest = read_archive_manifest(archive)
+            assert_that(archive.namelist().count(MANIFEST_NAME), is_(1))
+            assert_that(manifest['dc_metadata.xml']['sha256'],
+                        is_(hashlib.sha256(b'<metadata/>').hexdigest()))
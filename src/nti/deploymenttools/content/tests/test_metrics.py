@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import assert_that
+from hamcrest import contains_string
+
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from datetime import timedelta
+
+from nti.deploymenttools.content import read_response
+
+from nti.deploymenttools.content import metrics
+from nti.deploymenttools.content.metrics import HttpMetrics
+from nti.deploymenttools.content.metrics import endpoint_of
+from nti.deploymenttools.content.metrics import record_response
+
+import unittest
+
+
+class _Request(object):
+
+    def __init__(self, method, url, headers=None):
+        self.method = method
+        self.url = url
+        self.headers = headers or {}
+
+
+class _Response(object):
+
+    def __init__(self, request, status_code, seconds, headers=None, body=b''):
+        self.request = request
+        self.status_code = status_code
+        self.elapsed = timedelta(seconds=seconds)
+        self.headers = headers or {}
+        self.raw = BytesIO(body)
+
+    @property
+    def content(self):
+        return self.raw.getvalue()
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.original = metrics.METRICS
+        metrics.METRICS = HttpMetrics()
+
+    def tearDown(self):
+        metrics.METRICS = self.original
+
+    def test_endpoint_of(self):
+        ntiid = 'tag:nextthought.com,2011-10:NTI-CourseInfo-Spring2015_LSTD_1153'
+        assert_that(endpoint_of('https://host/dataserver2/Objects/%s/@@Export' % ntiid),
+                    is_('@@Export'))
+        assert_that(endpoint_of('https://host/dataserver2/CourseAdmin/@@ImportCourse'),
+                    is_('@@ImportCourse'))
+        assert_that(endpoint_of('https://host/dataserver2/Objects/%s' % ntiid),
+                    is_('Objects'))
+        assert_that(endpoint_of('https://host/dataserver2/logon.nti'),
+                    is_('logon.nti'))
+        assert_that(endpoint_of('https://host/dataserver2/Library/jobs/abc%3A1/status'),
+                    is_('status'))
+
+    def test_textfile(self):
+        url = 'https://host/dataserver2/Objects/tag:x/@@Export'
+        request = _Request('GET', url)
+        record_response(_Response(request, 200, 0.3, {'Content-Length': '2048'}))
+        record_response(_Response(request, 200, 45))
+        record_response(_Response(request, 503, 0.01))
+        metrics.record_retry('get', url)
+
+        text = metrics.METRICS.to_text([('tool', 'nti_backup_course')])
+        prefix = 'nti_http_request_duration_seconds_bucket{tool="nti_backup_course",' \
+                 'endpoint="@@Export",method="GET",'
+        assert_that(text, contains_string(prefix + 'le="0.05"} 1\n'))
+        assert_that(text, contains_string(prefix + 'le="0.5"} 2\n'))
+        assert_that(text, contains_string(prefix + 'le="+Inf"} 3\n'))
+        assert_that(text, contains_string('nti_http_requests_total{tool="nti_backup_course",'
+                                          'endpoint="@@Export",method="GET",code="503"} 1\n'))
+        assert_that(text, contains_string('nti_http_response_bytes_total{tool="nti_backup_course",'
+                                          'endpoint="@@Export",method="GET"} 2048\n'))
+        assert_that(text, contains_string('nti_http_retries_total{tool="nti_backup_course",'
+                                          'endpoint="@@Export",method="GET"} 1\n'))
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'nti.prom')
+            metrics.METRICS.write_textfile(path)
+            assert_that(os.listdir(temp_dir), is_(['nti.prom']))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_unannounced_bytes(self):
+        url = 'https://host/dataserver2/Objects/tag:x/@@Export'
+        streamed = _Response(_Request('GET', url), 200, 0.3, body=b'x' * 3000)
+        record_response(streamed, stream=True)
+        assert_that(read_response(streamed, BytesIO()), is_(3000))
+        # Bodies that were not streamed are counted as they arrive
+        url = 'https://host/dataserver2/Objects/tag:x'
+        record_response(_Response(_Request('GET', url), 200, 0.1, body=b'{}'),
+                        stream=False)
+        text = metrics.METRICS.to_text()
+        assert_that(text, contains_string('nti_http_response_bytes_total'
+                                          '{endpoint="@@Export",method="GET"} 3000\n'))
+        assert_that(text, contains_string('nti_http_response_bytes_total'
+                                          '{endpoint="Objects",method="GET"} 2\n'))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import assert_that
+
+import os
+import shutil
+import tempfile
+
+from nti.deploymenttools.content import set_url_scheme
+
+from nti.deploymenttools.content.benchmarks.generate import generate_dataset
+
+from nti.deploymenttools.content.benchmarks.server import FakeDataserver
+
+from nti.deploymenttools.content.mirror import mirror_site
+from nti.deploymenttools.content.mirror import plan_mirror
+from nti.deploymenttools.content.mirror import diff_catalogs
+
+import nti.deploymenttools.content.session as session_module
+
+import unittest
+
+PACKAGE = 'tag:nextthought.com,2011-10:NTI-HTML-%s'
+
+COURSE = 'tag:nextthought.com,2011-10:NTI-CourseInfo-%s'
+
+
+class TestMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.dataset = generate_dataset(self.temp_dir, 'tiny')
+        package = list(self.dataset['packages'].values())[0]
+        bundle = self.dataset['bundle']
+        self.source = FakeDataserver()
+        self.dest = FakeDataserver()
+        for name, modified in (('A', 100), ('B', 300), ('C', 100)):
+            self.source.add_package(PACKAGE % name, package, modified)
+        for name, modified in (('A', 200), ('B', 200), ('D', 100)):
+            self.dest.add_package(PACKAGE % name, package, modified)
+        self.source.add_course(COURSE % 'ONE', bundle, 'ONE', modified=100)
+        self.source.add_course(COURSE % 'TWO', bundle, 'TWO', modified=500)
+        self.source.add_course(COURSE % 'THREE', bundle, 'THREE', modified=500)
+        self.dest.add_course(COURSE % 'ONE', bundle, 'ONE', modified=200)
+        self.dest.add_course(COURSE % 'THREE', bundle, 'THREE', modified=200)
+        self.source.start()
+        self.dest.start()
+        set_url_scheme('http')
+
+    def tearDown(self):
+        self.source.stop()
+        self.dest.stop()
+        set_url_scheme('https')
+        session_module._sessions.clear()
+        shutil.rmtree(self.temp_dir)
+
+    def test_diff_catalogs(self):
+        diff = diff_catalogs({'a': 1, 'b': 3, 'c': None, 'd': 1},
+                             {'a': 2, 'b': 2, 'c': 5, 'e': 1})
+        assert_that(diff, is_([('a', 'unchanged'), ('b', 'changed'),
+                               ('c', 'changed'), ('d', 'missing'),
+                               ('e', 'extra')]))
+
+    def test_mirror(self):
+        plan = plan_mirror(self.source.host, self.dest.host, 'admin',
+                           'secret', 'secret')
+        delta = sorted((kind, ntiid.split('-')[-1], state)
+                       for kind, ntiid, state in plan if state != 'unchanged')
+        assert_that(delta, is_([('course', 'THREE', 'changed'),
+                                ('course', 'TWO', 'missing'),
+                                ('package', 'B', 'changed'),
+                                ('package', 'C', 'missing'),
+                                ('package', 'D', 'extra')]))
+
+        results = mirror_site(plan, self.source.host, self.dest.host, 'admin',
+                              self.dest.host, jobs=2)
+        assert_that([r['status'] for r in results], is_(['success'] * 4))
+        # Only the delta went over the wire.
+        assert_that(self.source.stats['Export'], is_(4))
+        assert_that(self.dest.stats['ImportRenderedContent'], is_(2))
+        assert_that(self.dest.stats['ImportCourse'], is_(1))
+        assert_that(self.dest.stats['Import'], is_(1))
+        package = os.path.getsize(list(self.dataset['packages'].values())[0])
+        bundle = os.path.getsize(self.dataset['bundle'])
+        assert_that(self.source.stats['sent'], is_(2 * package + 2 * bundle))
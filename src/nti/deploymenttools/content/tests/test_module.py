@@ -13,13 +13,57 @@ from hamcrest import assert_that
 
 import os
 import shutil
+import socket
+import hashlib
 import tempfile
+import threading
+from io import BytesIO
+from zipfile import ZipFile
+from zipfile import ZipInfo
+from zipfile import ZIP_STORED
+from zipfile import ZIP_DEFLATED
 
+from nti.deploymenttools.content import get_session
+from nti.deploymenttools.content import has_session
+from nti.deploymenttools.content import read_response
+from nti.deploymenttools.content import save_response
+from nti.deploymenttools.content import MIN_CHUNK_SIZE
+from nti.deploymenttools.content import MAX_CHUNK_SIZE
+from nti.deploymenttools.content import _next_chunk_size
+from nti.deploymenttools.content import export_course
+from nti.deploymenttools.content import import_course
+from nti.deploymenttools.content import MultipartBody
+from nti.deploymenttools.content import restore_course
+from nti.deploymenttools.content import set_url_scheme
 from nti.deploymenttools.content import archive_directory
+from nti.deploymenttools.content import ArchiveManifest
+from nti.deploymenttools.content import read_archive_manifest
+from nti.deploymenttools.content import _write_member_chunks
+from nti.deploymenttools.content import enable_session_cache
+
+from nti.deploymenttools.content.benchmarks.server import FakeDataserver
+
+from nti.deploymenttools.content.benchmarks.generate import generate_dataset
+
+from nti.deploymenttools.content.session import DataserverSession
+
+import nti.deploymenttools.content.session as session_module
+
+import requests
 
 import unittest
 
 
+class _Response(object):
+
+    def __init__(self, data, headers=None):
+        self.raw = BytesIO(data)
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size):
+        return iter(lambda: self.raw.read(chunk_size), b'')
+
+
 class TestModule(unittest.TestCase):
 
     def test_archive_directory(self):
@@ -31,3 +75,276 @@ class TestModule(unittest.TestCase):
             assert_that(os.path.exists(archive_path), is_(True))
         finally:
             shutil.rmtree(tmpdir, True)
+
+    def test_archive_directory_deterministic(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            archives = []
+            for i, mtime in enumerate((1000000000, 1500000000)):
+                source = os.path.join(tmpdir, 'source%s' % i)
+                os.makedirs(os.path.join(source, 'b'))
+                for name in ('z.txt', 'a.txt', 'b/c.json'):
+                    path = os.path.join(source, *name.split('/'))
+                    with open(path, 'wb') as fp:
+                        fp.write(name.encode('ascii') * 100)
+                    os.chmod(path, 0o600 + i * 0o44)
+                    os.utime(path, (mtime, mtime))
+                archive = os.path.join(tmpdir, 'archive%s.zip' % i)
+                archive_directory(source, archive, compression=ZIP_DEFLATED,
+                                  deterministic=True)
+                with open(archive, 'rb') as fp:
+                    archives.append(fp.read())
+            assert_that(archives[0], is_(archives[1]))
+            with ZipFile(os.path.join(tmpdir, 'archive0.zip')) as zf:
+                assert_that(zf.namelist(), is_(['a.txt', 'z.txt', 'b/c.json']))
+                info = zf.getinfo('b/c.json')
+                assert_that(info.external_attr >> 16 & 0o777, is_(0o644))
+                assert_that(zf.read(info), is_(b'b/c.json' * 100))
+        finally:
+            shutil.rmtree(tmpdir, True)
+
+    def test_archive_directory_manifest(self):
+        source_path = os.path.dirname(__file__)
+        tmpdir = tempfile.mkdtemp()
+        archive_path = os.path.join(tmpdir, "archive.zip")
+        try:
+            archive_directory(source_path, archive_path,
+                              compression=ZIP_DEFLATED, manifest=True)
+            with ZipFile(archive_path) as zf:
+                manifest = read_archive_manifest(zf)
+                assert_that(len(manifest), is_(len(zf.namelist()) - 1))
+                data = zf.read('__init__.py')
+                assert_that(manifest['__init__.py']['sha256'],
+                            is_(hashlib.sha256(data).hexdigest()))
+        finally:
+            shutil.rmtree(tmpdir, True)
+
+    def test_write_member_chunks(self):
+        # The streaming fallback of write_archive_member before Python 3.6
+        data = os.urandom(5000) + b'text' * 5000
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'archive.zip')
+            manifest = ArchiveManifest()
+            with ZipFile(path, 'w', ZIP_DEFLATED) as archive:
+                for name, compression in (('stored', ZIP_STORED),
+                                          ('deflated', ZIP_DEFLATED)):
+                    info = ZipInfo(name, (1980, 1, 1, 0, 0, 0))
+                    info.compress_type = compression
+                    info.file_size = len(data)
+                    reader = manifest.reader(name, BytesIO(data))
+                    _write_member_chunks(archive, info, reader, 1024)
+                    reader.finish()
+                archive.writestr('after', b'after')
+            with ZipFile(path) as archive:
+                assert_that(archive.testzip(), is_(None))
+                assert_that(archive.read('stored'), is_(data))
+                assert_that(archive.read('deflated'), is_(data))
+                assert_that(archive.read('after'), is_(b'after'))
+                assert_that(archive.getinfo('deflated').compress_size < len(data),
+                            is_(True))
+            assert_that(manifest.members['deflated']['sha256'],
+                        is_(hashlib.sha256(data).hexdigest()))
+        finally:
+            shutil.rmtree(tmpdir, True)
+
+    def test_session_cache(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            enable_session_cache(tmpdir)
+            session = DataserverSession('example.com', 'admin')
+            session.cookies.set('nti.auth_tkt', 'ticket',
+                                domain='example.com', path='/')
+            session_module._save_session(session)
+            cached = os.listdir(tmpdir)
+            assert_that(cached, is_(['admin@example.com.json']))
+            mode = os.stat(os.path.join(tmpdir, cached[0])).st_mode
+            assert_that(mode & 0o077, is_(0))
+
+            assert_that(has_session('example.com', 'admin'), is_(True))
+            assert_that(has_session('example.com', 'other'), is_(False))
+            loaded = session_module._sessions[('example.com', 'admin')]
+            assert_that(loaded.cookies.get('nti.auth_tkt'), is_('ticket'))
+        finally:
+            session_module._sessions.clear()
+            enable_session_cache(None)
+            shutil.rmtree(tmpdir, True)
+
+    def test_rejected_session_cache(self):
+        tmpdir = tempfile.mkdtemp()
+        server = FakeDataserver()
+        try:
+            server.start()
+            set_url_scheme('http')
+            enable_session_cache(tmpdir)
+            session = DataserverSession(server.host, 'admin')
+            session.cookies.set('nti.auth_tkt', 'stale',
+                                domain='127.0.0.1', path='/')
+            session_module._save_session(session)
+            assert_that(has_session(server.host, 'admin'), is_(True))
+
+            session = get_session(server.host, 'admin')
+            with self.assertRaises(requests.exceptions.HTTPError) as e:
+                session.get('http://%s/dataserver2/CourseAdmin' % server.host,
+                            stream=True)
+            assert_that('log on' in str(e.exception), is_(True))
+            assert_that(os.listdir(tmpdir), is_([]))
+            assert_that(has_session(server.host, 'admin'), is_(False))
+
+            session = get_session(server.host, 'admin', 'secret')
+            response = session.get('http://%s/dataserver2/CourseAdmin'
+                                   % server.host)
+            assert_that(response.status_code, is_(404))
+        finally:
+            server.stop()
+            set_url_scheme('https')
+            session_module._sessions.clear()
+            enable_session_cache(None)
+            shutil.rmtree(tmpdir, True)
+
+    def test_multipart_body(self):
+        body = MultipartBody({'site': 'example.com', 'key': None}, 'data',
+                             BytesIO(b'archive'), 'course.zip', size=7,
+                             chunk_size=5)
+        data = b''.join(body)
+        assert_that(len(data), is_(body.len))
+        assert_that(body.sent, is_(7))
+        assert_that(data.endswith(b'\r\n\r\narchive\r\n--%s--\r\n'
+                                  % body.boundary.encode('ascii')), is_(True))
+        assert_that(b'name="site"\r\n\r\nexample.com\r\n' in data, is_(True))
+        assert_that(b'name="key"' in data, is_(False))
+        body.rewind()
+        assert_that(body.read(), is_(data))
+
+        streamed = MultipartBody({}, 'data', BytesIO(b'archive'), 'course.zip')
+        assert_that(hasattr(streamed, 'len'), is_(False))
+        streamed.read()
+        with self.assertRaises(ValueError):
+            streamed.rewind()
+
+    def test_download_reuses_connection(self):
+        tmpdir = tempfile.mkdtemp()
+        server = FakeDataserver()
+        try:
+            dataset = generate_dataset(tmpdir, 'tiny')
+            ntiid = 'tag:nextthought.com,2011-10:NTI-CourseInfo-Reuse'
+            server.add_course(ntiid, dataset['bundle'], 'Reuse')
+            server.start()
+            set_url_scheme('http')
+            get_session(server.host, 'admin', 'secret')
+            before = server.stats['connections']
+            for _ in range(5):
+                export_course(ntiid, server.host, 'admin', 'secret', 'test',
+                              output_dir=tmpdir)
+            assert_that(server.stats['connections'], is_(before))
+        finally:
+            server.stop()
+            set_url_scheme('https')
+            session_module._sessions.clear()
+            shutil.rmtree(tmpdir, True)
+
+    def test_stream_course(self):
+        tmpdir = tempfile.mkdtemp()
+        server = FakeDataserver()
+        try:
+            dataset = generate_dataset(tmpdir, 'tiny')
+            ntiid = 'tag:nextthought.com,2011-10:NTI-CourseInfo-Stream'
+            server.add_course(ntiid, dataset['bundle'], 'Stream')
+            server.start()
+            set_url_scheme('http')
+
+            output = BytesIO()
+            export_course(ntiid, server.host, 'admin', 'secret', 'test',
+                          backup=True, output=output)
+            with open(dataset['bundle'], 'rb') as fp:
+                assert_that(output.getvalue(), is_(fp.read()))
+
+            # A pipe has no size, so the upload goes out chunked
+            read_fd, write_fd = os.pipe()
+            def feed():
+                with os.fdopen(write_fd, 'wb') as fp:
+                    fp.write(output.getvalue())
+            writer = threading.Thread(target=feed)
+            writer.start()
+            with os.fdopen(read_fd, 'rb') as fp:
+                course = import_course(fp, server.host, 'admin', 'secret',
+                                       'site', 'Level', 'Stream', 'test')
+            writer.join()
+            assert_that('NTIID' in course['Course'], is_(True))
+
+            # A streamed upload cannot be resent after logging on again
+            server.tickets.clear()
+            with self.assertRaises(requests.exceptions.HTTPError) as e:
+                import_course(BytesIO(output.getvalue()), server.host,
+                              'admin', 'secret', 'site', 'Level', 'Stream',
+                              'test')
+            assert_that('run again' in str(e.exception), is_(True))
+            assert_that(server.stats['ImportCourse'], is_(1))
+
+            restore_course(dataset['bundle'], server.host, 'admin', 'secret',
+                           ntiid, 'test')
+            stats = server.stats
+            assert_that(stats['ImportCourse'], is_(1))
+            assert_that(stats['Import'], is_(1))
+            assert_that(stats['received'] > 2 * len(output.getvalue()),
+                        is_(True))
+        finally:
+            server.stop()
+            set_url_scheme('https')
+            session_module._sessions.clear()
+            shutil.rmtree(tmpdir, True)
+
+    def test_read_response(self):
+        data = os.urandom(3 * MIN_CHUNK_SIZE + 5)
+        output = BytesIO()
+        assert_that(read_response(_Response(data), output), is_(len(data)))
+        assert_that(output.getvalue(), is_(data))
+
+        # Encoded bodies are left to requests to decode
+        output = BytesIO()
+        response = _Response(data, {'Content-Encoding': 'gzip'})
+        assert_that(read_response(response, output), is_(len(data)))
+        assert_that(output.getvalue(), is_(data))
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'download.zip')
+            response = _Response(data, {'Content-Length': str(len(data) + 100)})
+            assert_that(save_response(response, path), is_(len(data)))
+            with open(path, 'rb') as fp:
+                assert_that(fp.read(), is_(data))
+        finally:
+            shutil.rmtree(tmpdir, True)
+
+    def test_read_truncated_response(self):
+        # The server promises more than it sends before hanging up
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+
+        def serve():
+            connection, _ = listener.accept()
+            connection.recv(65536)
+            connection.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 100000\r\n\r\n'
+                               + b'x' * 1000)
+            connection.close()
+        server = threading.Thread(target=serve)
+        server.start()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            url = 'http://127.0.0.1:%s/' % listener.getsockname()[1]
+            response = requests.get(url, stream=True)
+            path = os.path.join(tmpdir, 'download.zip')
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                save_response(response, path)
+            assert_that(os.path.exists(path), is_(False))
+        finally:
+            server.join()
+            listener.close()
+            shutil.rmtree(tmpdir, True)
+
+    def test_next_chunk_size(self):
+        # 4 MiB/s aims for 1 MiB reads
+        assert_that(_next_chunk_size(4 * 1024 * 1024, 1.0), is_(1024 * 1024))
+        assert_that(_next_chunk_size(1024, 10.0), is_(MIN_CHUNK_SIZE))
+        assert_that(_next_chunk_size(MAX_CHUNK_SIZE, 0.0), is_(MAX_CHUNK_SIZE))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import has_entries
+from hamcrest import assert_that
+from hamcrest import contains_string
+
+from nti.deploymenttools.content import plan as plan_module
+
+from nti.deploymenttools.content.plan import format_plan
+from nti.deploymenttools.content.plan import plan_transfer
+from nti.deploymenttools.content.plan import get_content_package_ntiids
+
+import unittest
+
+
+class _Response(object):
+
+    def __init__(self, length):
+        self.headers = {'Content-Length': str(length)}
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        return iter([b'x' * int(self.headers['Content-Length'])])
+
+    def close(self):
+        pass
+
+
+class _Session(object):
+
+    sizes = {'course': 1024, 'pkg1': 4096, 'pkg2': 2048}
+
+    def __init__(self):
+        self.sampled = []
+
+    def head(self, url, **unused_kwargs):
+        ntiid = url.split('/')[-2]
+        return _Response(self.sizes[ntiid])
+
+    def get(self, url, **unused_kwargs):
+        ntiid = url.split('/')[-2]
+        self.sampled.append(ntiid)
+        return _Response(self.sizes[ntiid])
+
+
+class TestPlan(unittest.TestCase):
+
+    def setUp(self):
+        self._originals = (plan_module.get_session, plan_module.get_course_info)
+        self.session = _Session()
+        plan_module.get_session = lambda *args: self.session
+        plan_module.get_course_info = lambda *args: {
+            'ContentPackageBundle': {
+                'ContentPackages': [{'NTIID': 'pkg1'}, {'NTIID': 'pkg2'}]
+            }
+        }
+
+    def tearDown(self):
+        plan_module.get_session, plan_module.get_course_info = self._originals
+
+    def test_content_package_ntiids(self):
+        assert_that(get_content_package_ntiids({'ContentPackages': ['a', 'b']}),
+                    is_(['a', 'b']))
+        assert_that(get_content_package_ntiids({}), is_([]))
+
+    def test_backup_plan(self):
+        plan = plan_transfer('course', 'source', 'user', 'pw', 'ua',
+                             throughput=1024)
+        assert_that(plan, has_entries(objects=3, skipped=0, bytes=7168,
+                                      transfer_bytes=7168, seconds=7))
+        assert_that(format_plan(plan), contains_string('0:00:07'))
+
+    def test_same_host_copy_plan(self):
+        plan = plan_transfer('course', 'source', 'user', 'pw', 'ua',
+                             dest_host='source', throughput=1024)
+        assert_that(plan, has_entries(objects=1, skipped=2, bytes=1024,
+                                      transfer_bytes=2048, seconds=2))
+        assert_that(format_plan(plan), contains_string('already on source'))
+
+    def test_sample_package_only(self):
+        plan = plan_transfer('course', 'source', 'user', 'pw', 'ua',
+                             dest_host='source')
+        # Skipped packages are sampled rather than the course export
+        assert_that(self.session.sampled, is_(['pkg1']))
+        assert_that(plan['sampled'], is_('pkg1'))
+
+        plan_module.get_course_info = lambda *args: {}
+        plan = plan_transfer('course', 'source', 'user', 'pw', 'ua')
+        assert_that(self.session.sampled, is_(['pkg1']))
+        assert_that(plan['throughput'], is_(None))
+        assert_that(format_plan(plan), contains_string('give --throughput'))
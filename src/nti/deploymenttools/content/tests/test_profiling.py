@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import assert_that
+from hamcrest import contains_string
+
+import os
+import shutil
+import tempfile
+
+from nti.deploymenttools.content.profiling import profile_main
+
+import unittest
+
+
+@profile_main
+def _main(args=None):
+    return sum(len(str(i)) for i in range(1000))
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_profile_main(self):
+        path = os.path.join(self.temp_dir, 'run.prof')
+        assert_that(_main(['--profile', path, '--profile-memory', '-v']),
+                    is_(2890))
+        assert_that(os.path.isfile(path), is_(True))
+        with open(path + '.txt') as fp:
+            report = fp.read()
+        assert_that(report, contains_string('_main'))
+        assert_that(report, contains_string('Peak traced memory'))
+
+    def test_not_profiled(self):
+        assert_that(_main([]), is_(2890))
+        assert_that(os.listdir(self.temp_dir), is_([]))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import assert_that
+from hamcrest import contains_inanyorder
+
+import os
+import shutil
+import tempfile
+from zipfile import ZipFile
+
+from nti.deploymenttools.content import archive_directory
+
+from nti.deploymenttools.content.remote_render import is_ignored
+from nti.deploymenttools.content.remote_render import get_ignore_rules
+from nti.deploymenttools.content.remote_render import compile_ignore_rules
+
+import unittest
+
+
+class TestIgnoreRules(unittest.TestCase):
+
+    def test_patterns(self):
+        rules = compile_ignore_rules(['# comment', '',
+                                      '*.log', '/build/', 'docs/**/*.tmp',
+                                      '!keep.log'])
+        assert_that(is_ignored(rules, 'render.log'), is_(True))
+        assert_that(is_ignored(rules, 'a/b/render.log'), is_(True))
+        assert_that(is_ignored(rules, 'keep.log'), is_(False))
+        assert_that(is_ignored(rules, 'build', True), is_(True))
+        assert_that(is_ignored(rules, 'build', False), is_(False))
+        assert_that(is_ignored(rules, 'a/build', True), is_(False))
+        assert_that(is_ignored(rules, 'docs/x.tmp'), is_(True))
+        assert_that(is_ignored(rules, 'docs/a/b/x.tmp'), is_(True))
+        assert_that(is_ignored(rules, 'other/x.tmp'), is_(False))
+        assert_that(is_ignored(rules, 'book.tex'), is_(False))
+
+    def test_archive_pruning(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmpdir, 'book')
+            for path in ('book.tex', 'book.aux', 'book.paux', 'images/a.png',
+                         '.git/HEAD', 'book/index.html', 'notes.txt',
+                         'chapter.tex~'):
+                path = os.path.join(source, path)
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                with open(path, 'w') as fp:
+                    fp.write('x')
+            with open(os.path.join(source, '.ntirenderignore'), 'w') as fp:
+                fp.write('*.txt\n')
+
+            rules = get_ignore_rules(source, 'book', includes=['book.aux'])
+            archive_path = os.path.join(tmpdir, 'book.zip')
+            archive_directory(source, archive_path,
+                              ignore=lambda p, d: is_ignored(rules, p, d))
+            with ZipFile(archive_path) as archive:
+                names = [n.replace(os.sep, '/') for n in archive.namelist()]
+            assert_that(names, contains_inanyorder('book.tex', 'book.aux',
+                                                   'images/a.png'))
+        finally:
+            shutil.rmtree(tmpdir, True)
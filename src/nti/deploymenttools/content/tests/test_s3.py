@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import assert_that
+
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from nti.deploymenttools.content.s3 import upload_file
+from nti.deploymenttools.content.s3 import compute_etag
+from nti.deploymenttools.content.s3 import parse_s3_url
+from nti.deploymenttools.content.s3 import MIN_PART_SIZE
+
+import unittest
+
+
+class _Key(object):
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.etag = None
+
+    def set_contents_from_file(self, fp):
+        data = fp.read()
+        self.bucket.objects[self.name] = data
+        self.etag = '"%s"' % hashlib.md5(data).hexdigest()
+        self.bucket.keys[self.name] = self
+
+
+class _MultiPartUpload(object):
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.parts = {}
+        self.lock = threading.Lock()
+
+    def upload_part_from_file(self, fp, part_number, size):
+        data = fp.read(size)
+        with self.lock:
+            self.parts[part_number] = data
+
+    def complete_upload(self):
+        parts = [self.parts[n] for n in sorted(self.parts)]
+        key = _Key(self.bucket, self.name)
+        digests = b''.join(hashlib.md5(p).digest() for p in parts)
+        key.etag = '"%s-%s"' % (hashlib.md5(digests).hexdigest(), len(parts))
+        self.bucket.objects[self.name] = b''.join(parts)
+        self.bucket.keys[self.name] = key
+
+    def cancel_upload(self):
+        self.parts.clear()
+
+
+class _Bucket(object):
+    """
+    A minimal in-memory stand-in for a boto S3 bucket.
+    """
+
+    name = 'backups'
+
+    def __init__(self):
+        self.keys = {}
+        self.objects = {}
+        self.uploads = 0
+
+    def get_key(self, name):
+        return self.keys.get(name)
+
+    def new_key(self, name):
+        self.uploads += 1
+        return _Key(self, name)
+
+    def initiate_multipart_upload(self, name):
+        self.uploads += 1
+        return _MultiPartUpload(self, name)
+
+
+class TestS3(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, True)
+
+    def _write(self, name, size):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as fp:
+            fp.write(os.urandom(size))
+        return path
+
+    def test_parse_s3_url(self):
+        assert_that(parse_s3_url('s3://bucket/a/b/'), is_(('bucket', 'a/b')))
+        assert_that(parse_s3_url('s3://bucket'), is_(('bucket', '')))
+        with self.assertRaises(ValueError):
+            parse_s3_url('/tmp/backups')
+
+    def test_multipart_upload_and_skip(self):
+        bucket = _Bucket()
+        path = self._write('course.zip', MIN_PART_SIZE * 2 + 1024)
+        assert_that(upload_file(path, bucket, 'a/course.zip',
+                                part_size=MIN_PART_SIZE, concurrency=3),
+                    is_(True))
+        with open(path, 'rb') as fp:
+            assert_that(bucket.objects['a/course.zip'] == fp.read(), is_(True))
+        assert_that(bucket.keys['a/course.zip'].etag.strip('"'),
+                    is_(compute_etag(path, MIN_PART_SIZE)))
+
+        assert_that(upload_file(path, bucket, 'a/course.zip',
+                                part_size=MIN_PART_SIZE), is_(False))
+        assert_that(bucket.uploads, is_(1))
+
+    def test_single_part_upload(self):
+        bucket = _Bucket()
+        path = self._write('course.csv', 100)
+        assert_that(upload_file(path, bucket, 'course.csv'), is_(True))
+        assert_that(upload_file(path, bucket, 'course.csv'), is_(False))
+        assert_that(bucket.uploads, is_(1))
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import has_length
+from hamcrest import assert_that
+
+import os
+import time
+import shutil
+import tempfile
+from datetime import datetime
+
+import simplejson as json
+
+from nti.deploymenttools.content import set_url_scheme
+
+from nti.deploymenttools.content.benchmarks.generate import generate_dataset
+
+from nti.deploymenttools.content.benchmarks.server import FakeDataserver
+
+from nti.deploymenttools.content.scheduler import ScheduleState
+from nti.deploymenttools.content.scheduler import run_plan
+from nti.deploymenttools.content.scheduler import plan_runs
+from nti.deploymenttools.content.scheduler import prune_backups
+from nti.deploymenttools.content.scheduler import course_dir
+from nti.deploymenttools.content.scheduler import execute_run
+from nti.deploymenttools.content.scheduler import enqueue_plan
+from nti.deploymenttools.content.scheduler import update_queued
+from nti.deploymenttools.content.scheduler import read_policy
+from nti.deploymenttools.content.scheduler import window_bounds
+from nti.deploymenttools.content.scheduler import parse_interval
+from nti.deploymenttools.content.scheduler import collect_candidates
+
+from nti.deploymenttools.content.worker import Worker
+from nti.deploymenttools.content.worker import JobQueue
+from nti.deploymenttools.content.worker import JobFailed
+
+import nti.deploymenttools.content.session as session_module
+
+import unittest
+
+
+class TestPlanning(unittest.TestCase):
+
+    def test_parse_interval(self):
+        assert_that(parse_interval('90m'), is_(5400.0))
+        assert_that(parse_interval('7d'), is_(604800.0))
+        assert_that(parse_interval(30), is_(30.0))
+        with self.assertRaises(ValueError):
+            parse_interval('soon')
+
+    def test_plan_runs(self):
+        candidates = [{'course_ntiid': name, 'estimate': estimate}
+                      for name, estimate in (('a', 400), ('b', 300),
+                                             ('c', 300), ('d', 600))]
+        planned, deferred = plan_runs(candidates, 2, 0, 1000, spread=False)
+        assert_that([(r['course_ntiid'], r['lane'], r['start']) for r in planned],
+                    is_([('a', 0, 0), ('b', 1, 0), ('c', 1, 300), ('d', 0, 400)]))
+        assert_that(deferred, is_([]))
+
+        planned, deferred = plan_runs(candidates, 1, 0, 1000)
+        assert_that([r['course_ntiid'] for r in planned], is_(['a', 'b', 'c']))
+        assert_that([r['course_ntiid'] for r in deferred], is_(['d']))
+        # The idle time is shared out between the runs of the lane.
+        assert_that([r['start'] for r in planned], is_([0, 400, 700]))
+
+        planned, _ = plan_runs(candidates[:2], 1, 0, 1000)
+        assert_that([r['start'] for r in planned], is_([0, 550]))
+
+    def test_window_bounds(self):
+        window = {'start': '22:00', 'end': '04:00'}
+        late = time.mktime(datetime(2020, 3, 10, 23, 30).timetuple())
+        start, end = window_bounds(window, late)
+        assert_that(start, is_(late))
+        assert_that(end, is_(time.mktime(datetime(2020, 3, 11, 4, 0).timetuple())))
+        noon = time.mktime(datetime(2020, 3, 10, 12, 0).timetuple())
+        start, end = window_bounds(window, noon)
+        assert_that(start, is_(time.mktime(datetime(2020, 3, 10, 22, 0).timetuple())))
+        assert_that(window_bounds(None, noon), is_((noon, None)))
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        data_dir = os.path.join(self.temp_dir, 'data')
+        os.makedirs(data_dir)
+        self.dataset = generate_dataset(data_dir, 'tiny')
+        self.server = FakeDataserver()
+        self.server.add_course(self.dataset['course'], self.dataset['bundle'],
+                               self.dataset['provider_id'],
+                               sorted(self.dataset['packages']))
+        self.server.start()
+        set_url_scheme('http')
+        session_module.get_session(self.server.host, 'admin', 'secret')
+
+    def tearDown(self):
+        self.server.stop()
+        set_url_scheme('https')
+        session_module._sessions.clear()
+        shutil.rmtree(self.temp_dir)
+
+    def _policy(self, **policy):
+        path = os.path.join(self.temp_dir, 'policy.json')
+        with open(path, 'w') as fp:
+            json.dump({'workers': 2, 'policies': [policy]}, fp)
+        return read_policy(path)
+
+    def test_run(self):
+        config = self._policy(name='site', sites=[self.server.host],
+                              type='bundle', every='0s', retention=1,
+                              skip_unchanged=True,
+                              output_dir=os.path.join(self.temp_dir, 'backups'))
+        state = ScheduleState(os.path.join(self.temp_dir, 'state.json'))
+
+        def _run():
+            candidates = collect_candidates(config, state, 'admin',
+                                            lambda host: None)
+            planned, _ = plan_runs(candidates, config['workers'], time.time())
+            assert_that(run_plan(planned, state, 'admin', lambda host: None), is_(0))
+            return planned
+
+        assert_that(_run(), has_length(1))
+        key = ' '.join(('site', self.server.host, self.dataset['course']))
+        record = state.get(key)
+        assert_that(record['last_status'], is_('finished'))
+        # Unchanged courses are not backed up again.
+        assert_that(_run(), has_length(0))
+
+        time.sleep(1)
+        self.server.touch(self.dataset['course'])
+        assert_that(_run(), has_length(1))
+        # Only the newest run is kept.
+        path = course_dir(config['policies'][0], self.dataset['course'])
+        runs = os.listdir(path)
+        assert_that(runs, has_length(1))
+        assert_that(ScheduleState(state.path).get(key)['last_output'],
+                    is_(os.path.join(path, runs[0])))
+
+    def test_unchanged_still_due(self):
+        config = self._policy(name='site', sites=[self.server.host],
+                              type='bundle', every='0s',
+                              output_dir=os.path.join(self.temp_dir, 'backups'))
+        state = ScheduleState(os.path.join(self.temp_dir, 'state.json'))
+        candidates = collect_candidates(config, state, 'admin', lambda host: None)
+        assert_that(candidates[0]['changed'], is_(True))
+        planned, _ = plan_runs(candidates, config['workers'], time.time())
+        assert_that(run_plan(planned, state, 'admin', lambda host: None), is_(0))
+        # Due courses are backed up even when the course did not change
+        candidates = collect_candidates(config, state, 'admin', lambda host: None)
+        assert_that(candidates, has_length(1))
+        assert_that(candidates[0]['changed'], is_(False))
+
+    def test_enqueue(self):
+        config = self._policy(name='site', sites=[self.server.host],
+                              type='bundle', every='0s', retention=1,
+                              output_dir=os.path.join(self.temp_dir, 'backups'))
+        policy = config['policies'][0]
+        path = course_dir(policy, self.dataset['course'])
+        previous = os.path.join(path, '20200101T000000Z')
+        os.makedirs(previous)
+        shutil.copy(self.dataset['bundle'], previous)
+        state = ScheduleState(os.path.join(self.temp_dir, 'state.json'))
+        queue = JobQueue(os.path.join(self.temp_dir, 'queue.sqlite'))
+
+        candidates = collect_candidates(config, state, 'admin', lambda host: None)
+        planned, _ = plan_runs(candidates, config['workers'], time.time())
+        assert_that(enqueue_plan(planned, state, queue, 'admin'), has_length(1))
+        # The only completed backup is kept until the queued one is done.
+        assert_that(os.listdir(path), is_(['20200101T000000Z']))
+        key = planned[0]['key']
+        assert_that(state.get(key).get('last_backup'), is_(None))
+        assert_that(update_queued(state, queue), is_([key]))
+        # Queued courses are not queued again.
+        assert_that(collect_candidates(config, state, 'admin', lambda host: None),
+                    is_([]))
+
+        worker = Worker(queue, 'admin', jobs=1, poll_interval=0.05,
+                        retry_delay=0,
+                        journal_dir=os.path.join(self.temp_dir, 'jobs'))
+        worker.serve(until_empty=True)
+        assert_that(os.listdir(path), has_length(2))
+        assert_that(update_queued(state, queue), is_([]))
+        record = state.get(key)
+        assert_that(record['last_status'], is_('finished'))
+        assert_that(record['last_backup'], is_(queue.get(record['job'])['started']))
+
+        # A failed job is recorded as failed, and the course stays due.
+        state.record(key, last_status='queued',
+                     job=queue.enqueue('backup-bundle', {}))
+        worker.serve(until_empty=True)
+        update_queued(state, queue)
+        assert_that(state.get(key)['last_status'], is_('failed'))
+
+        # Runs that have not completed yet do not count.
+        pending = os.path.join(path, '20990101T000000Z')
+        os.makedirs(pending)
+        assert_that(prune_backups(path, 1), is_(['20200101T000000Z']))
+        assert_that(os.listdir(path), has_length(2))
+        assert_that(os.path.isdir(pending), is_(True))
+
+    def test_failed_run(self):
+        config = self._policy(name='site', sites=[self.server.host],
+                              type='bundle', every='0s', retention=1,
+                              output_dir=os.path.join(self.temp_dir, 'backups'))
+        run = {'policy': config['policies'][0], 'host': self.server.host,
+               'course_ntiid': 'tag:nextthought.com,2011-10:NTI-CourseInfo-Missing'}
+        with self.assertRaises(JobFailed):
+            execute_run(run, 'admin', None)
+        # The run directory of the failed backup is removed.
+        assert_that(os.listdir(course_dir(run['policy'], run['course_ntiid'])),
+                    is_([]))
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            self._policy(name='bad', courses=['x'], output_dir='/tmp')
+        with self.assertRaises(ValueError):
+            self._policy(name='bad', host='h', type='bundle', format='tar.zst',
+                         output_dir='/tmp')
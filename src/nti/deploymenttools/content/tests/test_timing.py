@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import has_length
+from hamcrest import has_entries
+from hamcrest import assert_that
+from hamcrest import contains_string
+
+import os
+import shutil
+import tempfile
+
+import simplejson as json
+
+from nti.deploymenttools.content import timing
+from nti.deploymenttools.content.timing import Timings
+from nti.deploymenttools.content.timing import write_timing_report
+
+import unittest
+
+
+class TestTiming(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.timings = Timings()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_summary(self):
+        with self.timings.span('download', 'a', 100):
+            pass
+        with self.timings.span('download', 'b') as span:
+            span.bytes = 300
+        with self.timings.span('patch'):
+            pass
+        try:
+            with self.timings.span('import', 'c'):
+                raise ValueError('boom')
+        except ValueError:
+            pass
+
+        rows = self.timings.summary()
+        assert_that([row['phase'] for row in rows],
+                    is_(['download', 'patch', 'import']))
+        assert_that(rows[0], has_entries(count=2, bytes=400))
+        assert_that(rows[1]['bytes'], is_(none()))
+        assert_that(self.timings.spans[-1].status, is_('failed'))
+        assert_that(self.timings.format_summary(),
+                    contains_string('download'))
+
+        path = os.path.join(self.temp_dir, 'timing.json')
+        write_timing_report(path, self.timings)
+        with open(path) as fp:
+            report = json.load(fp)
+        assert_that(report['spans'], has_length(4))
+        assert_that(report['spans'][0], has_entries(phase='download',
+                                                    name='a', status='ok'))
+
+    def test_timed(self):
+        path = os.path.join(self.temp_dir, 'out.zip')
+        original = timing.TIMINGS
+        timing.TIMINGS = self.timings
+        try:
+            @timing.timed('archive')
+            def build(name):
+                with open(path, 'wb') as fp:
+                    fp.write(b'x' * 10)
+                return path
+            build(path)
+        finally:
+            timing.TIMINGS = original
+        assert_that(self.timings.spans[0].to_dict(),
+                    has_entries(phase='archive', name='out.zip', bytes=10))
+
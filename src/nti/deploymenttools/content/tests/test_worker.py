@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import has_item
+from hamcrest import assert_that
+from hamcrest import contains_string
+
+import os
+import time
+import shutil
+import tempfile
+
+from nti.deploymenttools.content import set_url_scheme
+
+from nti.deploymenttools.content.benchmarks.generate import generate_dataset
+
+from nti.deploymenttools.content.benchmarks.server import FakeDataserver
+
+from nti.deploymenttools.content.timing import TIMINGS
+
+from nti.deploymenttools.content.worker import Worker
+from nti.deploymenttools.content.worker import JobQueue
+from nti.deploymenttools.content.worker import validate
+from nti.deploymenttools.content.worker import parse_params
+
+import nti.deploymenttools.content.session as session_module
+
+import unittest
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.queue = JobQueue(os.path.join(self.temp_dir, 'queue.sqlite'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_claim_order(self):
+        low = self.queue.enqueue('import', {'archive': 'a.zip'})
+        high = self.queue.enqueue('import', {'archive': 'b.zip'}, priority=5)
+        later = self.queue.enqueue('import', {'archive': 'c.zip'}, priority=9,
+                                   run_after=time.time() + 3600)
+        assert_that(self.queue.claim()['id'], is_(high))
+        assert_that(self.queue.claim()['id'], is_(low))
+        assert_that(self.queue.claim(), is_(none()))
+        assert_that(self.queue.cancel(later), is_(True))
+        assert_that(self.queue.cancel(low), is_(False))
+        assert_that(self.queue.retry(later), is_(True))
+        assert_that(self.queue.get(later)['status'], is_('queued'))
+
+    def test_fail_and_requeue(self):
+        job_id = self.queue.enqueue('import', {}, retries=1)
+        self.queue.claim()
+        assert_that(self.queue.fail(job_id, 'boom', retry_delay=0), is_(True))
+        assert_that(self.queue.claim('one')['attempts'], is_(2))
+        assert_that(self.queue.requeue_running('one'), is_(1))
+        self.queue.claim()
+        assert_that(self.queue.fail(job_id, 'boom', retry_delay=0), is_(False))
+        job = self.queue.get(job_id)
+        assert_that(job['status'], is_('failed'))
+        assert_that(job['error'], is_('boom'))
+
+    def test_lease(self):
+        job_id = self.queue.enqueue('import', {})
+        assert_that(self.queue.claim('one')['worker'], is_('one'))
+        # The jobs of a live worker are not taken from it
+        assert_that(self.queue.requeue_running('two'), is_(0))
+        time.sleep(0.2)
+        self.queue.heartbeat('one')
+        assert_that(self.queue.requeue_running('two', lease=0.1), is_(0))
+        time.sleep(0.2)
+        assert_that(self.queue.requeue_running('two', lease=0.1), is_(1))
+        job = self.queue.get(job_id)
+        assert_that(job['status'], is_('queued'))
+        assert_that(job['attempts'], is_(0))
+
+    def test_params(self):
+        params = parse_params(['host=example.com', 'poll_interval=2',
+                               'excludes=["*.log"]'])
+        assert_that(params, is_({'host': 'example.com', 'poll_interval': 2,
+                                 'excludes': ['*.log']}))
+        with self.assertRaises(ValueError):
+            validate('import', {'archive': 'a.zip'})
+        with self.assertRaises(ValueError):
+            validate('defrag', {})
+        with self.assertRaises(ValueError):
+            validate('restore', {'archive': 'a.zip', 'host': 'example.com'})
+
+
+class TestWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        data_dir = os.path.join(self.temp_dir, 'data')
+        os.makedirs(data_dir)
+        self.dataset = generate_dataset(data_dir, 'tiny')
+        self.server = FakeDataserver()
+        self.server.add_course(self.dataset['course'], self.dataset['bundle'],
+                               self.dataset['provider_id'],
+                               sorted(self.dataset['packages']))
+        for ntiid, path in self.dataset['packages'].items():
+            self.server.add_package(ntiid, path)
+        self.server.start()
+        set_url_scheme('http')
+
+    def tearDown(self):
+        self.server.stop()
+        set_url_scheme('https')
+        session_module._sessions.clear()
+        shutil.rmtree(self.temp_dir)
+
+    def test_serve(self):
+        queue = JobQueue(os.path.join(self.temp_dir, 'queue.sqlite'))
+        host = self.server.host
+        finished = []
+        worker = Worker(queue, 'benchmark', jobs=2, poll_interval=0.05,
+                        retry_delay=0,
+                        journal_dir=os.path.join(self.temp_dir, 'jobs'),
+                        on_finish=finished.append)
+        worker.logon(host, 'benchmark')
+        worker.logon(self.server.alias, 'benchmark')
+
+        output_dir = os.path.join(self.temp_dir, 'backups')
+        backup = queue.enqueue('backup', {'course_ntiid': self.dataset['course'],
+                                          'source_host': host,
+                                          'output_dir': output_dir})
+        imported = queue.enqueue('import', {'archive': self.dataset['bundle'],
+                                            'host': host,
+                                            'admin_level': 'DefaultAPIWorker'})
+        copy = queue.enqueue('copy', {'course_ntiid': self.dataset['course'],
+                                      'source_host': host,
+                                      'dest_host': self.server.alias,
+                                      'site_library': self.server.alias,
+                                      'admin_level': 'DefaultAPIWorker'})
+        missing = queue.enqueue('restore', {'archive': os.path.join(self.temp_dir, 'missing.zip'),
+                                            'host': host,
+                                            'ntiid': self.dataset['course']},
+                                retries=1)
+        unnamed = queue.enqueue('restore', {'archive': self.dataset['bundle'],
+                                            'host': host})
+        worker.serve(until_empty=True)
+
+        assert_that(queue.get(backup)['status'], is_('finished'))
+        assert_that(os.listdir(output_dir),
+                    has_item(self.dataset['provider_id'] + '.csv'))
+        result = queue.get(imported)['result']
+        assert_that(result['ntiid'], contains_string('NTI-CourseInfo-'))
+        assert_that(queue.get(copy)['status'], is_('finished'))
+        failed = queue.get(missing)
+        assert_that(failed['status'], is_('failed'))
+        assert_that(failed['attempts'], is_(2))
+        # A restore with no course to restore to is never sent.
+        failed = queue.get(unnamed)
+        assert_that(failed['status'], is_('failed'))
+        assert_that(failed['error'], contains_string('ntiid'))
+        assert_that('Import' in self.server.stats, is_(False))
+        assert_that(len(finished), is_(6))
+        # Journals of finished jobs are cleaned up.
+        assert_that(os.listdir(os.path.join(self.temp_dir, 'jobs')), is_([]))
+
+    def test_serve_keeps_no_spans(self):
+        queue = JobQueue(os.path.join(self.temp_dir, 'queue.sqlite'))
+        worker = Worker(queue, 'benchmark', jobs=2, poll_interval=0.05,
+                        journal_dir=os.path.join(self.temp_dir, 'jobs'))
+        worker.logon(self.server.host, 'benchmark')
+        for _ in range(5):
+            queue.enqueue('import', {'archive': self.dataset['bundle'],
+                                     'host': self.server.host,
+                                     'admin_level': 'DefaultAPIWorker'})
+        before = len(TIMINGS.spans)
+        worker.serve(until_empty=True)
+        assert_that(len(TIMINGS.spans), is_(before))
+        assert_that(TIMINGS.enabled, is_(True))
+        assert_that(self.server.stats['ImportCourse'], is_(5))
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Timing spans for the phases of a run.
+
+Library functions wrap each phase (export, download, extract, patch,
+archive, upload, import, render, poll) in :func:`span` and record the
+bytes they moved.  The console scripts log a per-phase summary when
+they finish and can write every span to a JSON report with
+``--timing-report``.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import time
+import codecs
+import threading
+import functools
+from timeit import default_timer
+from contextlib import contextmanager
+
+import simplejson as json
+
+from six import string_types
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def format_bytes(value):
+    if value is None:
+        return 'unknown'
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if value < 1024:
+            return '%.1f %s' % (value, unit)
+        value /= 1024
+    return '%.1f TiB' % value
+
+
+class Span(object):
+    """
+    One timed phase.  Set :attr:`bytes` (or call :meth:`add_file`) inside
+    the ``with`` block to record how much data the phase moved.
+    """
+
+    def __init__(self, phase, name=None, nbytes=None):
+        self.phase = phase
+        self.name = name
+        self.bytes = nbytes
+        self.start = time.time()
+        self.elapsed = None
+        self.status = 'running'
+        self.thread = threading.current_thread().name
+
+    def add_file(self, path):
+        if path and os.path.isfile(path):
+            self.bytes = (self.bytes or 0) + os.path.getsize(path)
+
+    @property
+    def rate(self):
+        if self.bytes and self.elapsed:
+            return self.bytes / self.elapsed
+        return None
+
+    def to_dict(self):
+        return {
+            'phase': self.phase,
+            'name': self.name,
+            'start': self.start,
+            'elapsed': self.elapsed,
+            'bytes': self.bytes,
+            'bytes_per_second': self.rate,
+            'status': self.status,
+            'thread': self.thread,
+        }
+
+
+class Timings(object):
+    """
+    The spans recorded during a run.  Safe to use from several threads.
+    While :attr:`enabled` is false spans are still timed and logged but
+    not kept, for processes that run for too long to report them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.enabled = True
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.spans = []
+            self.started = time.time()
+            self.clock = default_timer()
+
+    @contextmanager
+    def span(self, phase, name=None, nbytes=None):
+        result = Span(phase, name, nbytes)
+        start = default_timer()
+        try:
+            yield result
+            result.status = 'ok'
+        except BaseException:
+            result.status = 'failed'
+            raise
+        finally:
+            result.elapsed = default_timer() - start
+            if self.enabled:
+                with self.lock:
+                    self.spans.append(result)
+            logger.debug('%s %s took %.3fs (%s)', phase, name or '',
+                         result.elapsed, format_bytes(result.bytes))
+
+    def summary(self):
+        """
+        Return one row per phase, in the order phases first finished,
+        with the span count, total seconds, bytes and bytes per second.
+        """
+        rows = {}
+        order = []
+        with self.lock:
+            spans = list(self.spans)
+        for item in spans:
+            row = rows.get(item.phase)
+            if row is None:
+                row = rows[item.phase] = {'phase': item.phase, 'count': 0,
+                                          'seconds': 0.0, 'bytes': None}
+                order.append(item.phase)
+            row['count'] += 1
+            row['seconds'] += item.elapsed
+            if item.bytes is not None:
+                row['bytes'] = (row['bytes'] or 0) + item.bytes
+        for row in rows.values():
+            row['bytes_per_second'] = row['bytes'] / row['seconds'] \
+                if row['bytes'] and row['seconds'] else None
+        return [rows[phase] for phase in order]
+
+    def wall_time(self):
+        return default_timer() - self.clock
+
+    def report(self):
+        with self.lock:
+            spans = [item.to_dict() for item in self.spans]
+        return {
+            'started': self.started,
+            'wall_seconds': self.wall_time(),
+            'phases': self.summary(),
+            'spans': spans,
+        }
+
+    def format_summary(self):
+        lines = ['%-10s %6s %10s %12s %14s'
+                 % ('Phase', 'Count', 'Seconds', 'Bytes', 'Rate')]
+        for row in self.summary():
+            rate = row['bytes_per_second']
+            lines.append('%-10s %6d %10.2f %12s %14s'
+                         % (row['phase'], row['count'], row['seconds'],
+                            format_bytes(row['bytes']) if row['bytes'] is not None else '-',
+                            format_bytes(rate) + '/s' if rate else '-'))
+        lines.append('Wall time: %.2fs' % self.wall_time())
+        return '\n'.join(lines)
+
+
+#: The timings of the current process.
+TIMINGS = Timings()
+
+
+def span(phase, name=None, nbytes=None):
+    """
+    Time the ``with`` block as ``phase`` of the current run.
+    """
+    return TIMINGS.span(phase, name, nbytes)
+
+
+def timed(phase):
+    """
+    Decorator timing every call of the function as ``phase``.  The span
+    is named after the first argument when it is a string, and records
+    the size of the returned file when the function returns a path.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            name = args[0] if args and isinstance(args[0], string_types) else None
+            with span(phase, name and os.path.basename(name)) as timing:
+                result = func(*args, **kwargs)
+                if isinstance(result, string_types):
+                    timing.add_file(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def write_timing_report(path, timings=TIMINGS):
+    with codecs.open(path, 'w', 'utf-8') as fp:
+        json.dump(timings.report(), fp, indent=2)
+
+
+def add_timing_arguments(arg_parser):
+    arg_parser.add_argument('--timing-report', dest='timing_report',
+                            metavar='PATH',
+                            help="Write the time and bytes of every phase to this JSON file.")
+
+
+def report_timing(args, timings=TIMINGS):
+    """
+    Log the phase summary and write the ``--timing-report`` if asked.
+    """
+    if not timings.spans:
+        return
+    logger.info('Timing summary\n%s', timings.format_summary())
+    if getattr(args, 'timing_report', None):
+        write_timing_report(args.timing_report, timings)
@@ -0,0 +1,641 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A long-running worker that executes queued jobs.
+
+Jobs are kept in a SQLite database (``~/.nti/queue.sqlite`` by
+default), so CI and admin tooling can hand work to ``nti_worker submit``
+instead of forking a tool and authenticating for every operation.
+``nti_worker run`` logs on to its servers once, keeps those sessions
+for its whole life and runs up to ``--jobs`` jobs at a time, highest
+priority first.  Copies and full backups are checkpointed in a
+:class:`~nti.deploymenttools.content.journal.JobJournal`, so a job that
+fails or is interrupted by a restart picks up where it stopped.
+``nti_worker status``, ``cancel`` and ``retry`` manage the queue.
+
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import time
+import signal
+import socket
+import logging
+import sqlite3
+import threading
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import simplejson as json
+
+from nti.deploymenttools.content import get_session
+from nti.deploymenttools.content import get_password
+from nti.deploymenttools.content import import_course
+from nti.deploymenttools.content import configure_logging
+from nti.deploymenttools.content import enable_session_cache
+
+from nti.deploymenttools.content.journal import JOURNAL_DIR
+from nti.deploymenttools.content.journal import JobJournal
+
+from nti.deploymenttools.content.timing import TIMINGS
+
+from nti.deploymenttools.content.metrics import write_metrics
+from nti.deploymenttools.content.metrics import add_metrics_arguments
+
+from nti.deploymenttools.content.profiling import profile_main
+from nti.deploymenttools.content.profiling import add_profile_arguments
+
+UA_STRING = 'NextThought Worker Utility'
+
+logger = __import__('logging').getLogger(__name__)
+logging.captureWarnings(True)
+
+QUEUE_PATH = os.path.join(os.path.expanduser('~'), '.nti', 'queue.sqlite')
+
+STATUSES = ('queued', 'running', 'finished', 'failed', 'cancelled')
+
+#: Seconds a running job stays with its worker without a heartbeat
+#: before another worker may take it over.
+LEASE_SECONDS = 120
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    created REAL NOT NULL,
+    run_after REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 1,
+    journal TEXT,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority, run_after);
+"""
+
+
+class JobFailed(Exception):
+    """
+    Raised when a tool reported a failure instead of raising one.
+    """
+
+
+class JobQueue(object):
+    """
+    The durable job queue.  Every method uses its own connection, so a
+    queue may be shared between threads and processes.
+    """
+
+    def __init__(self, path=QUEUE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+            # Queues created before jobs had owners
+            columns = [row[1] for row in connection.execute('PRAGMA table_info(jobs)')]
+            for column, kind in (('worker', 'TEXT'), ('heartbeat', 'REAL')):
+                if column not in columns:
+                    connection.execute('ALTER TABLE jobs ADD COLUMN %s %s'
+                                       % (column, kind))
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30,
+                                     isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(zip(row.keys(), tuple(row)))
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def enqueue(self, kind, params, priority=0, run_after=None, retries=0):
+        """
+        Add a job, returning its id.  It runs no earlier than the
+        timestamp ``run_after`` and is attempted ``retries`` more times
+        if it fails.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            cursor = connection.execute(
+                'INSERT INTO jobs (kind, params, priority, created, run_after,'
+                ' max_attempts) VALUES (?, ?, ?, ?, ?, ?)',
+                (kind, json.dumps(params), priority, now,
+                 now if run_after is None else run_after, retries + 1))
+            job_id = cursor.lastrowid
+        logger.debug('Queued %s job %s', kind, job_id)
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as connection:
+            row = connection.execute('SELECT * FROM jobs WHERE id = ?',
+                                     (job_id,)).fetchone()
+        return self._job(row)
+
+    def list(self, status=None, limit=None):
+        query = 'SELECT * FROM jobs'
+        args = []
+        if status:
+            query += ' WHERE status = ?'
+            args.append(status)
+        query += ' ORDER BY id DESC'
+        if limit:
+            query += ' LIMIT %d' % limit
+        with self._connect() as connection:
+            rows = connection.execute(query, args).fetchall()
+        return [self._job(row) for row in reversed(rows)]
+
+    def counts(self):
+        with self._connect() as connection:
+            rows = connection.execute(
+                'SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return dict((status, count) for status, count in rows)
+
+    def claim(self, worker=None):
+        """
+        Mark the most urgent job that is ready to run as running by
+        ``worker`` and return it, or return ``None`` if there is none.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued'"
+                    " AND run_after <= ? ORDER BY priority DESC, run_after, id"
+                    " LIMIT 1", (now,)).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE jobs SET status = 'running', started = ?,"
+                        " heartbeat = ?, worker = ?, attempts = attempts + 1"
+                        " WHERE id = ?", (now, now, worker, row[0]))
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+        return self.get(row[0]) if row is not None else None
+
+    def _update(self, job_id, condition='1', **values):
+        assignments = ', '.join('%s = ?' % name for name in sorted(values))
+        args = [values[name] for name in sorted(values)] + [job_id]
+        with self._connect() as connection:
+            cursor = connection.execute(
+                'UPDATE jobs SET %s WHERE id = ? AND %s' % (assignments, condition),
+                args)
+            return cursor.rowcount > 0
+
+    def set_journal(self, job_id, journal_id):
+        self._update(job_id, journal=journal_id)
+
+    def finish(self, job_id, result=None):
+        self._update(job_id, status='finished', finished=time.time(),
+                     result=json.dumps(result), error=None)
+
+    def fail(self, job_id, error, retry_delay=60):
+        """
+        Record a failed attempt, queueing the job again after an
+        exponentially growing delay if it has attempts left.  Returns
+        whether it was queued again.
+        """
+        job = self.get(job_id)
+        if job['attempts'] < job['max_attempts']:
+            delay = retry_delay * 2 ** (job['attempts'] - 1)
+            self._update(job_id, status='queued', error=str(error),
+                         run_after=time.time() + delay)
+            return True
+        self._update(job_id, status='failed', finished=time.time(),
+                     error=str(error))
+        return False
+
+    def cancel(self, job_id):
+        return self._update(job_id, "status = 'queued'", status='cancelled',
+                            finished=time.time())
+
+    def retry(self, job_id):
+        return self._update(job_id, "status IN ('failed', 'cancelled')",
+                            status='queued', run_after=time.time(),
+                            attempts=0, finished=None)
+
+    def heartbeat(self, worker):
+        """
+        Renew the lease of ``worker`` on the jobs it is running.
+        """
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE status = 'running'"
+                " AND worker = ?", (time.time(), worker))
+
+    def requeue_running(self, worker=None, lease=LEASE_SECONDS):
+        """
+        Queue jobs left running by ``worker``, or by any worker that has
+        not renewed its lease for ``lease`` seconds, again.  Jobs of other
+        workers that are still alive are left alone.
+        """
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = 'queued', attempts = attempts - 1,"
+                " worker = NULL WHERE status = 'running'"
+                " AND (worker = ? OR COALESCE(heartbeat, started) < ?)",
+                (worker, time.time() - lease))
+            return cursor.rowcount
+
+
+def _check_journal(journal):
+    # The tools record HTTP errors in the journal rather than raising them.
+    if journal.status == 'failed':
+        raise JobFailed(journal.state.get('error'))
+
+
+def run_copy(params, journal):
+    from nti.deploymenttools.content.copy_course import copy_course
+    copy_course(job=journal, **params)
+    _check_journal(journal)
+
+
+def run_backup(params, journal):
+    from nti.deploymenttools.content.backup_course import backup_course
+    backup_course(job=journal, **params)
+    _check_journal(journal)
+    return {'output_dir': params['output_dir']}
+
+
+def run_backup_bundle(params, unused_journal):
+    from nti.deploymenttools.content.backup_course_bundle import backup_course
+    archive = backup_course(**params)
+    if archive is None:
+        raise JobFailed('Unable to export %s' % params['course_ntiid'])
+    return {'archive': archive}
+
+
+def run_import(params, unused_journal):
+    course = import_course(params['archive'], params['host'], params['username'],
+                           None, params.get('site_library') or params['host'],
+                           params['admin_level'], params.get('provider_id'),
+                           UA_STRING)
+    return {'ntiid': course['Course']['NTIID']}
+
+
+def run_restore(params, unused_journal):
+    from nti.deploymenttools.content.restore_course_bundle import restore_course_archive
+    course = restore_course_archive(params['archive'], params['host'],
+                                    params['username'], None, params['ntiid'])
+    return {'ntiid': course['Course']['NTIID']}
+
+
+def run_render(params, unused_journal):
+    from nti.deploymenttools.content.remote_render import remote_render
+    status = remote_render(params['host'], params['username'], None,
+                           params.get('site_library') or params['host'],
+                           params['working_dir'], params.get('poll_interval', 10),
+                           cleanup=params.get('cleanup', True),
+                           excludes=params.get('excludes', ()),
+                           includes=params.get('includes', ()))
+    if status != 'Success':
+        raise JobFailed('Render of %s ended as %s' % (params['working_dir'], status))
+    return {'status': status}
+
+
+#: Job kind to ``(handler, required parameters, journaled)``.
+HANDLERS = {
+    'copy': (run_copy, ('course_ntiid', 'source_host', 'dest_host',
+                        'site_library', 'admin_level'), True),
+    'backup': (run_backup, ('course_ntiid', 'source_host', 'output_dir'), True),
+    'backup-bundle': (run_backup_bundle, ('course_ntiid', 'source_host',
+                                          'output_dir'), False),
+    'import': (run_import, ('archive', 'host', 'admin_level'), False),
+    'restore': (run_restore, ('archive', 'host', 'ntiid'), False),
+    'render': (run_render, ('host', 'working_dir'), False),
+}
+
+_JOURNAL_KINDS = {'copy': 'copy_course', 'backup': 'backup_course'}
+
+
+def validate(kind, params):
+    if kind not in HANDLERS:
+        raise ValueError("Unknown job kind %s" % kind)
+    missing = [name for name in HANDLERS[kind][1] if not params.get(name)]
+    if missing:
+        raise ValueError("%s jobs need %s" % (kind, ', '.join(missing)))
+
+
+class Worker(object):
+    """
+    Runs queued jobs on a pool of ``jobs`` threads, sharing the logged
+    on sessions of the process between them.
+    """
+
+    def __init__(self, queue, username=None, jobs=4, poll_interval=1.0,
+                 retry_delay=60, journal_dir=JOURNAL_DIR, on_finish=None,
+                 lease=LEASE_SECONDS):
+        self.queue = queue
+        self.username = username
+        self.jobs = max(1, jobs)
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.journal_dir = journal_dir
+        self.on_finish = on_finish
+        self.lease = lease
+        self.name = '%s:%s' % (socket.gethostname(), os.getpid())
+        self._running = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def logon(self, host, password):
+        """
+        Log on to ``host`` so jobs for it can use the session.
+        """
+        get_session(host, self.username, password)
+
+    def _journal(self, job):
+        if job['journal']:
+            try:
+                return JobJournal.load(job['journal'], self.journal_dir)
+            except ValueError:
+                pass
+        journal = JobJournal.create(_JOURNAL_KINDS[job['kind']], job['params'],
+                                    self.journal_dir)
+        self.queue.set_journal(job['id'], journal.id)
+        return journal
+
+    def execute(self, job):
+        """
+        Run ``job`` and record its outcome in the queue.
+        """
+        handler, _, journaled = HANDLERS[job['kind']]
+        params = dict(job['params'])
+        params.setdefault('username', self.username)
+        logger.info('Starting %s job %s (attempt %s)', job['kind'], job['id'],
+                    job['attempts'])
+        start = time.time()
+        try:
+            # Jobs may have been queued by something other than nti_worker
+            validate(job['kind'], params)
+            journal = self._journal(job) if journaled else None
+            result = handler(params, journal)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error('Job %s failed: %s', job['id'], e)
+            if self.queue.fail(job['id'], e, self.retry_delay):
+                logger.info('Job %s will be retried.', job['id'])
+        else:
+            self.queue.finish(job['id'], result)
+            logger.info('Finished %s job %s in %.1fs', job['kind'], job['id'],
+                        time.time() - start)
+        finally:
+            with self._lock:
+                self._running.discard(job['id'])
+                if self.on_finish is not None:
+                    self.on_finish(job)
+            self._wake.set()
+
+    def run_pending(self, executor):
+        """
+        Start ready jobs until the pool is busy, returning how many
+        were started.
+        """
+        started = 0
+        while not self._stopping.is_set():
+            with self._lock:
+                if len(self._running) >= self.jobs:
+                    break
+                job = self.queue.claim(self.name)
+                if job is None:
+                    break
+                self._running.add(job['id'])
+            executor.submit(self.execute, job)
+            started += 1
+        return started
+
+    def _wait(self):
+        # Finished jobs wake the loop to start the next one early, and
+        # the lease is renewed well before it runs out.
+        self._wake.wait(min(self.poll_interval, self.lease / 3))
+        self._wake.clear()
+
+    def serve(self, until_empty=False):
+        """
+        Run jobs until :meth:`stop` is called or, with ``until_empty``,
+        until nothing is running and no queued job is ready.  Timing
+        spans are not kept meanwhile, as nothing reports them.
+        """
+        recording, TIMINGS.enabled = TIMINGS.enabled, False
+        executor = ThreadPoolExecutor(max_workers=self.jobs)
+        try:
+            while not self._stopping.is_set():
+                self.queue.heartbeat(self.name)
+                requeued = self.queue.requeue_running(lease=self.lease)
+                if requeued:
+                    logger.info('Queued %s jobs of lost workers again.', requeued)
+                started = self.run_pending(executor)
+                with self._lock:
+                    idle = not self._running
+                if until_empty and idle and not started:
+                    break
+                self._wait()
+        finally:
+            logger.info('Waiting for running jobs to finish.')
+            # Keep the lease on the jobs until they are done.
+            while True:
+                with self._lock:
+                    if not self._running:
+                        break
+                self.queue.heartbeat(self.name)
+                self._wait()
+            executor.shutdown(wait=True)
+            TIMINGS.enabled = recording
+
+    def stop(self, *unused_args):
+        self._stopping.set()
+        self._wake.set()
+
+
+def _format_time(timestamp):
+    if not timestamp:
+        return '-'
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+
+def _summary(job):
+    if job['error'] and job['status'] != 'finished':
+        return job['error']
+    params = job['params']
+    return params.get('course_ntiid') or params.get('archive') \
+        or params.get('working_dir') or ''
+
+
+def format_jobs(jobs):
+    lines = ['%6s %-14s %-10s %4s %-19s %8s  %s'
+             % ('Id', 'Kind', 'Status', 'Prio', 'Created', 'Seconds', 'Details')]
+    for job in jobs:
+        elapsed = '-'
+        if job['started'] and job['finished']:
+            elapsed = '%.1f' % (job['finished'] - job['started'])
+        lines.append('%6s %-14s %-10s %4s %-19s %8s  %s'
+                     % (job['id'], job['kind'], job['status'], job['priority'],
+                        _format_time(job['created']), elapsed, _summary(job)))
+    return '\n'.join(lines)
+
+
+def parse_params(values):
+    """
+    Parse ``name=value`` pairs, reading each value as JSON when it is
+    valid JSON and as a string otherwise.
+    """
+    params = {}
+    for value in values or ():
+        if '=' not in value:
+            raise ValueError("Expected name=value, not %s" % value)
+        name, value = value.split('=', 1)
+        try:
+            params[name] = json.loads(value)
+        except ValueError:
+            params[name] = value
+    return params
+
+
+def _parse_args():
+    arg_parser = ArgumentParser(description=UA_STRING)
+    arg_parser.add_argument('--queue', dest='queue', default=QUEUE_PATH,
+                            help="Job queue database. Defaults to %s." % QUEUE_PATH)
+    arg_parser.add_argument('-v', '--verbose', dest='loglevel',
+                            action='store_const', const=logging.DEBUG,
+                            help="Print debugging logs.")
+    arg_parser.add_argument('-q', '--quiet', dest='loglevel',
+                            action='store_const', const=logging.WARNING,
+                            help="Print warning and error logs only.")
+    subparsers = arg_parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser('run', description='Run queued jobs')
+    run_parser.add_argument('-u', '--user', dest='user',
+                            help="User to authenticate with the servers.")
+    run_parser.add_argument('-s', '--server', dest='hosts', action='append',
+                            default=[],
+                            help="Server to log on to at startup. May be repeated.")
+    run_parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=4,
+                            help="Jobs to run at once. Defaults to 4.")
+    run_parser.add_argument('--poll-interval', dest='poll_interval', type=float,
+                            default=5,
+                            help="Seconds between checks for new jobs. Defaults to 5.")
+    run_parser.add_argument('--retry-delay', dest='retry_delay', type=float,
+                            default=60,
+                            help="Seconds before the first retry of a failed job, doubling after each. Defaults to 60.")
+    run_parser.add_argument('--until-empty', dest='until_empty',
+                            action='store_true', default=False,
+                            help="Exit once no queued job is ready to run.")
+    run_parser.add_argument('--journal-dir', dest='journal_dir',
+                            default=JOURNAL_DIR,
+                            help="Directory of the job journals. Defaults to %s." % JOURNAL_DIR)
+    run_parser.add_argument('--cache-session', dest='cache_session',
+                            action='store_true', default=False,
+                            help="Cache the server sessions between runs until they expire.")
+    add_metrics_arguments(run_parser)
+    add_profile_arguments(run_parser)
+
+    submit_parser = subparsers.add_parser('submit', description='Queue a job')
+    submit_parser.add_argument('kind', choices=sorted(HANDLERS),
+                               help="Kind of job.")
+    submit_parser.add_argument('params', nargs='*', metavar='NAME=VALUE',
+                               help="Job parameters, with JSON values where needed.")
+    submit_parser.add_argument('--priority', dest='priority', type=int, default=0,
+                               help="Jobs with higher priority run first. Defaults to 0.")
+    submit_parser.add_argument('--delay', dest='delay', type=float, default=0,
+                               help="Seconds to wait before the job may run.")
+    submit_parser.add_argument('--retries', dest='retries', type=int, default=0,
+                               help="Times to retry the job if it fails. Defaults to 0.")
+
+    status_parser = subparsers.add_parser('status', description='Show jobs')
+    status_parser.add_argument('job_id', nargs='?', type=int,
+                               help="Job to show in full.")
+    status_parser.add_argument('--status', dest='status', choices=STATUSES,
+                               help="Only show jobs with this status.")
+    status_parser.add_argument('-n', '--limit', dest='limit', type=int, default=50,
+                               help="Most recent jobs to show. Defaults to 50.")
+
+    cancel_parser = subparsers.add_parser('cancel', description='Cancel a queued job')
+    cancel_parser.add_argument('job_id', type=int)
+
+    retry_parser = subparsers.add_parser('retry',
+                                         description='Queue a failed or cancelled job again')
+    retry_parser.add_argument('job_id', type=int)
+    return arg_parser.parse_args()
+
+
+def _run(args, queue):
+    if args.cache_session:
+        enable_session_cache()
+    worker = Worker(queue, args.user, args.jobs, args.poll_interval,
+                    args.retry_delay, args.journal_dir,
+                    on_finish=lambda job: write_metrics(args))
+    for host in args.hosts:
+        worker.logon(host, get_password(host, args.user))
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    logger.info('Worker %s running %s jobs at a time from %s',
+                worker.name, worker.jobs, queue.path)
+    worker.serve(until_empty=args.until_empty)
+
+
+@profile_main
+def main():
+    args = _parse_args()
+
+    loglevel = args.loglevel or logging.INFO
+    configure_logging(level=loglevel)
+
+    queue = JobQueue(os.path.expanduser(args.queue))
+    if args.command == 'run':
+        _run(args, queue)
+    elif args.command == 'submit':
+        try:
+            params = parse_params(args.params)
+            validate(args.kind, params)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        job_id = queue.enqueue(args.kind, params, args.priority,
+                               time.time() + args.delay, args.retries)
+        print(job_id)
+    elif args.command == 'status':
+        if args.job_id is not None:
+            job = queue.get(args.job_id)
+            if job is None:
+                raise SystemExit("Unknown job %s" % args.job_id)
+            print(json.dumps(job, indent=2, sort_keys=True))
+        else:
+            print(format_jobs(queue.list(args.status, args.limit)))
+            counts = queue.counts()
+            print(', '.join('%s %s' % (counts[status], status)
+                            for status in STATUSES if counts.get(status)))
+    elif args.command == 'cancel':
+        if not queue.cancel(args.job_id):
+            raise SystemExit("Job %s is not queued" % args.job_id)
+    elif args.command == 'retry':
+        if not queue.retry(args.job_id):
+            raise SystemExit("Job %s has not failed or been cancelled" % args.job_id)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()